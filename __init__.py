@@ -1,14 +1,37 @@
+from contextlib import contextmanager
+from time import monotonic, sleep
+from serial import SerialException, SerialTimeoutException
 from .serial_context import SerialContext
+from .api.link.framing import FrameReader, SCAN, HEADER, BODY, COMPLETE, BAD_BCC, NAKED
+from .api.link.errors import LinkError, LinkCancelled, LinkTimeout, FrameError, FrameRejected
+from .api.link.retransmit import is_idempotent, backoff
+from .api.link.trace import TX, RX
+from .api.desfire.session import CardSession
+from .api.utils.lazy import LazyMethod
+
+
+#   How long a single blocking read may wait before the read deadline is re-checked
+READ_SLICE = 0.1
+
+#   Link speeds tried by SK_AD3.detect_baudrate(), fastest first
+BAUDRATES = (115200, 57600, 38400, 19200, 9600)
+
+#   Where the lazily imported DESFire methods live
+DESFIRE = __package__ + '.api.desfire'
 
 
 class SK_AD3:
     '''
     The SK_AD3 class owns all of the methods located in api/desfire and api/sk_ad3. 
-    They are imported and bound to this namespace at instatiation time, and therefore
-    must be accessed through an instance of this class. This mechanism allows for a 
-    (relatively) clean logical separation between the two APIs.
+    The api/sk_ad3 methods are bound to this namespace when the class is defined; the
+    api/desfire ones are imported and bound the first time they are looked up (see
+    `LazyMethod`). Either way they must be accessed through an instance of this class.
+    This mechanism allows for a (relatively) clean logical separation between the two APIs.
     '''
 
+    #   A `TraceRecorder` while wire tracing is enabled (see api/link/trace.py)
+    trace = None
+
     #   Top-level SK_AD3 methods
     from .api.sk_ad3.dispatch import send_command
     from .api.sk_ad3.basic_commands import \
@@ -21,74 +44,362 @@ class SK_AD3:
         activate_RF_card, \
         deactivate_RF_card
 
-    #   Top-level Desfire API methods
-    from .api.desfire.dispatch import send_raw_apdu
-    from .api.desfire.security_commands import \
-        aes_authenticate, \
-        des_authenticate, \
-        change_picc_master_key, \
-        change_application_key, \
-        get_key_version
-    from .api.desfire.application_commands import \
-        get_card_uid, \
-        get_application_ids, \
-        select_application, \
-        create_application, \
-        delete_application, \
-        format_picc
-    from .api.desfire.file_commands import \
-        get_file_ids, \
-        create_standard_data_file, \
-        create_cyclic_record_file, \
-        create_value_file, \
-        delete_file, \
-        get_file_settings
-    from .api.desfire.data_commands import \
-        read_data, \
-        write_data, \
-        write_record, \
-        read_record, \
-        credit_value_file, \
-        debit_value_file, \
-        get_value_in_value_file, \
-        commit_transaction
-
-    def __init__(self, port: str, addr: int = 0x00):
+    #   Top-level Desfire API methods. These are only imported on first use, and
+    #   pycryptodome, apdu_utils and file_objects with them (see `LazyMethod`), so
+    #   processes that only drive the mechanism start faster.
+    send_raw_apdu = LazyMethod(DESFIRE + '.dispatch')
+
+    aes_authenticate = LazyMethod(DESFIRE + '.security_commands')
+    des_authenticate = LazyMethod(DESFIRE + '.security_commands')
+    change_picc_master_key = LazyMethod(DESFIRE + '.security_commands')
+    change_application_key = LazyMethod(DESFIRE + '.security_commands')
+    ensure_authenticated = LazyMethod(DESFIRE + '.security_commands')
+    get_key_version = LazyMethod(DESFIRE + '.security_commands')
+
+    get_card_uid = LazyMethod(DESFIRE + '.application_commands')
+    get_application_ids = LazyMethod(DESFIRE + '.application_commands')
+    select_application = LazyMethod(DESFIRE + '.application_commands')
+    create_application = LazyMethod(DESFIRE + '.application_commands')
+    delete_application = LazyMethod(DESFIRE + '.application_commands')
+    format_picc = LazyMethod(DESFIRE + '.application_commands')
+
+    get_file_ids = LazyMethod(DESFIRE + '.file_commands')
+    create_standard_data_file = LazyMethod(DESFIRE + '.file_commands')
+    create_cyclic_record_file = LazyMethod(DESFIRE + '.file_commands')
+    create_value_file = LazyMethod(DESFIRE + '.file_commands')
+    delete_file = LazyMethod(DESFIRE + '.file_commands')
+    get_file_settings = LazyMethod(DESFIRE + '.file_commands')
+
+    read_data = LazyMethod(DESFIRE + '.data_commands')
+    iter_read_data = LazyMethod(DESFIRE + '.data_commands')
+    write_data = LazyMethod(DESFIRE + '.data_commands')
+    write_record = LazyMethod(DESFIRE + '.data_commands')
+    read_record = LazyMethod(DESFIRE + '.data_commands')
+    credit_value_file = LazyMethod(DESFIRE + '.data_commands')
+    debit_value_file = LazyMethod(DESFIRE + '.data_commands')
+    get_value_in_value_file = LazyMethod(DESFIRE + '.data_commands')
+    commit_transaction = LazyMethod(DESFIRE + '.data_commands')
+
+    dump_card = LazyMethod(DESFIRE + '.image')
+    restore_card = LazyMethod(DESFIRE + '.image')
+
+    def __init__(self, port: str = None, addr: int = 0x00, persistent: bool = False,
+                 read_timeout: float = 10.0, write_timeout: float = 2.0,
+                 baudrate=9600, transport: SerialContext = None, binary: bool = False,
+                 retries: int = 2):
+        '''
+        `baudrate` is the link speed the dispenser is configured for. Pass `'auto'`
+        to probe the candidates in `BAUDRATES` at construction time (see `detect_baudrate()`).
+
+        `transport` replaces the serial port with any `SerialContext` compatible object,
+        such as `simulator.transport.SimulatedTransport`. `port` is ignored when it is given.
+
+        `binary` switches `read_data`, `read_record` and `get_card_uid` to return `bytes`
+        (see `CardUID`) instead of lists and hex strings. Each of them also takes a
+        `binary` argument that overrides this per call.
+
+        `retries` is how many times a frame may be sent again after a link error
+        (see `_exchange()`); 0 turns retransmission off.
+        '''
         self.addr = addr
         self.port = port
-        self.serial_context = SerialContext(
-            port=self.port, baudrate=9600)
-        self.serial_context.close()
+        #   Upper bound on a whole response, mechanical moves included
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        #   When set (to a threading.Event), setting the event abandons the exchange in flight
+        self.abort_event = None
+        self.binary = binary
+        self.retries = retries
+        #   Pause before the first retransmit, in seconds; doubles with each one after
+        self.retry_backoff = 0.05
+        #   Set after a failed exchange, so the next one starts from a clean input buffer
+        self._stale_input = False
+        #   Until when the reply to an abandoned exchange may still arrive (see `_flush_input()`)
+        self._abandoned_until = None
+        #   What is known about the card in the RF position (see `CardSession`)
+        self.card_session = CardSession()
+        #   Callables `listener(frame, reply)`, called after every exchange on the thread
+        #   that made it (see `monitor.StatusMonitor`). They must be quick and must not raise.
+        self.listeners = []
+        #   A `metrics.Metrics` registry while instrumentation is enabled (see `Metrics.attach()`)
+        self.metrics = None
+        #   When the last frame finished draining, and when its answer started arriving
+        self._wrote_at = None
+        self._first_byte_at = None
+        #   Whether anything (an ACK or a frame) has come back since the last write. Only a
+        #   NAK in place of all that rejects the frame; any other is line noise.
+        self._answered = False
+        if transport is None:
+            transport = SerialContext(
+                port=self.port, baudrate=9600 if baudrate == 'auto' else baudrate,
+                timeout=READ_SLICE, write_timeout=write_timeout, persistent=persistent)
+        else:
+            transport.baudrate = 9600 if baudrate == 'auto' else baudrate
+            transport.timeout = READ_SLICE
+            transport.write_timeout = write_timeout
+            transport.persistent = persistent
+        self.serial_context = transport
+        if baudrate == 'auto':
+            self.detect_baudrate()
+        if persistent:
+            self.connect()
+        else:
+            self.serial_context.close()
 
-    def _read(self) -> list:
+    def connect(self) -> 'SK_AD3':
         '''
-        Internal use only.
-        Reads data from the serial port.
+        Opens the serial port and keeps it open until `disconnect()` is called.
+        Every command issued in the meantime reuses the same OS handle instead of
+        opening and closing the port around each call.
+        '''
+        self.serial_context.persistent = True
+        if not self.serial_context.is_open:
+            self.serial_context.open()
+        return self
+
+    def disconnect(self) -> None:
         '''
-        while self.serial_context.in_waiting:
-            pass
+        Ends a session started with `connect()`. The port is closed right away unless
+        a `session()` block or a command is still using it, in which case the last
+        one out closes it.
+        '''
+        self.serial_context.persistent = False
+        if self.serial_context.depth == 0:
+            self.serial_context.close()
+
+    @contextmanager
+    def session(self):
+        '''
+        Keeps the serial port open for the duration of a `with` block::
+
+            with dispenser.session():
+                dispenser.move_card('RF')
+                dispenser.activate_RF_card()
+
+        Sessions nest; the port is closed when the outermost block exits
+        (unless `connect()` has been called).
+        '''
+        with self.serial_context:
+            yield self
+
+    @property
+    def baudrate(self) -> int:
+        return self.serial_context.baudrate
+
+    def set_baudrate(self, baudrate: int) -> None:
+        '''
+        Changes the host side link speed. Takes effect immediately, even mid-session.
+        '''
+        self.serial_context.baudrate = baudrate
+
+    def detect_baudrate(self, candidates: tuple = BAUDRATES, probe_timeout: float = 0.3) -> int:
+        '''
+        Finds the link speed the dispenser answers at by issuing `get_status()` at each
+        of `candidates`, fastest first, and keeps the first one that succeeds.
+        Because the candidates are tried fastest first, this also moves the link onto the
+        highest rate the unit supports. (The SK-AD3's own rate is configured on the
+        unit; this command set has no command for changing it over the wire.)
+
+        Returns the detected baudrate. Raises an exception if no candidate answers,
+        in which case the original baudrate is restored.
+        '''
+        original = self.baudrate
+        read_timeout, retries = self.read_timeout, self.retries
+        self.read_timeout, self.retries = probe_timeout, 0
 
-        temp = self.serial_context.read(5)
-        response = list(temp)
         try:
-            #   NOTE:
-            #   99% of the time (for some unknown reason) the device
-            #   adds a 0x06 to the beginning of a response frame.
-            #   During a read error, The 0x06 is missed, triggering an
-            #   exception on remove().
-            response.remove(6)
-            length = (response[2] << 8) + response[3]
-            response += list(self.serial_context.read(length + 2))
-        except Exception:
-            print('Read Error Occurred')
+            with self.serial_context:
+                for baudrate in sorted(candidates, reverse=True):
+                    self.set_baudrate(baudrate)
+                    self.serial_context.reset_input_buffer()
+                    try:
+                        if self.get_status().is_successful():
+                            return baudrate
+                    except (LinkError, IndexError, KeyError):
+                        #   Line noise at the wrong speed rarely decodes into a frame
+                        continue
         finally:
-            return response
+            self.read_timeout, self.retries = read_timeout, retries
+
+        self.set_baudrate(original)
+        raise Exception(f'No response from dispenser at any of {list(candidates)} baud')
 
-    def _write(self, data: list) -> None:
+    def _exchange(self, frame) -> bytearray:
         '''
         Internal use only.
-        Writes data to the serial port. Must be provided with a valid SK-AD3 frame in the form of a list.
+        Writes a complete SK-AD3 frame and returns the frame the device answers with.
+        This is the single path every command takes to the wire.
+
+        A frame the device NAKs is sent again, as is an idempotent command (see
+        `api.link.retransmit`) whose reply timed out or arrived garbled, up to
+        `self.retries` times with a growing pause in between. Otherwise the failure is
+        raised as a `LinkTimeout`, `FrameError` or `FrameRejected`. An exchange abandoned
+        through `abort_event` raises `LinkCancelled` and is never sent again.
+        '''
+        attempt = 0
+        while True:
+            if self._stale_input:
+                self._flush_input()
+            metrics = self.metrics
+            if metrics is not None:
+                self._first_byte_at = None
+            start = monotonic()
+            try:
+                reply = self._transfer(frame)
+            except LinkCancelled as e:
+                #   If the frame went out, its reply may still come until the read deadline.
+                #   Every APDU shares one CM, so it could pass for the next APDU's reply.
+                self._stale_input = True
+                if self._wrote_at is not None and self._wrote_at >= start:
+                    self._abandoned_until = self._wrote_at + self.read_timeout
+                if metrics is not None:
+                    metrics.record_exchange(self, frame, bytearray(), start, monotonic(),
+                                            failure=type(e).__name__)
+                raise
+            except (LinkTimeout, FrameError, FrameRejected) as e:
+                #   Whatever is still on its way answers this attempt, not the next one
+                self._stale_input = True
+                if metrics is not None:
+                    metrics.record_exchange(self, frame, bytearray(), start, monotonic(),
+                                            failure=type(e).__name__)
+                attempt += 1
+                if attempt > self.retries or not (isinstance(e, FrameRejected) or is_idempotent(frame)):
+                    raise
+                sleep(backoff(attempt, self.retry_backoff))
+                continue
+
+            if metrics is not None:
+                metrics.record_exchange(self, frame, reply, start, monotonic(), retries=attempt)
+            if self.listeners:
+                for listener in self.listeners:
+                    listener(frame, reply)
+            return reply
+
+    def _transfer(self, frame) -> bytearray:
         '''
-        self.serial_context.write(bytearray(data))
-        while self.serial_context.out_waiting:
-            pass
+        Internal use only.
+        Moves one frame out and its answer back over this dispenser's link.
+        Replies to some other command (late answers to an earlier exchange) are discarded.
+        '''
+        self._write(frame)
+        deadline = monotonic() + self.read_timeout
+        while True:
+            reply = self._read(deadline - monotonic())
+            if reply[5] == frame[5]:
+                return reply
+
+    def _flush_input(self) -> None:
+        '''
+        Internal use only.
+        Discards anything left unread on the port after a failed exchange. The reply to an
+        exchange abandoned before its read deadline is waited for first (until that
+        deadline), as it may still be on its way.
+        '''
+        abandoned_until, self._abandoned_until = self._abandoned_until, None
+        if abandoned_until is not None and abandoned_until > monotonic():
+            try:
+                self._read(abandoned_until - monotonic())
+            except LinkCancelled:
+                #   Left for the next exchange to wait out
+                self._abandoned_until = abandoned_until
+                raise
+            except LinkError:
+                pass
+        self.serial_context.reset_input_buffer()
+        self._stale_input = False
+
+    def _read(self, timeout: float = None) -> bytearray:
+        '''
+        Internal use only.
+        Reads one frame from the serial port, blocking until it is complete or
+        `timeout` (`self.read_timeout` by default) seconds have passed. A frame that fails
+        its BCC check is parsed again from the next STX, in case line noise started it.
+
+        Raises `LinkTimeout` if no valid frame arrives in time, `FrameRejected` if the
+        device NAKed the frame written, and `FrameError` if only a corrupted frame or a
+        NAK that cannot have been the device's answer (one after an ACK or a frame) did.
+        '''
+        reader = FrameReader()
+        deadline = monotonic() + (self.read_timeout if timeout is None else timeout)
+        corrupted = False
+        stray_nak = False
+
+        while reader.state != COMPLETE:
+            if self.abort_event is not None and self.abort_event.is_set():
+                raise LinkCancelled('Read abandoned by caller')
+            if reader.state == NAKED:
+                if not (self._answered or reader.acked or corrupted):
+                    raise FrameRejected('Dispenser rejected the frame (NAK)')
+                #   The frame was taken, so this is noise; what it stands in for may be lost
+                stray_nak = True
+                reader.state = SCAN
+                continue
+            if reader.state == BAD_BCC:
+                corrupted = True
+                self._answered = True
+                reader.resync()
+                continue
+            try:
+                #   Blocks for at most the port timeout, so an idle link costs nothing
+                chunk = self.serial_context.read(reader.wanted())
+            except SerialException:
+                #   The device dropped mid-exchange. The response is lost, but
+                #   reopening here lets the rest of the session carry on.
+                self.serial_context.reopen()
+                raise
+            if chunk:
+                if self.trace is not None:
+                    self.trace.record(RX, chunk)
+                if self._first_byte_at is None:
+                    self._first_byte_at = monotonic()
+                reader.feed(chunk)
+            elif monotonic() >= deadline:
+                #   A length byte hit by noise leaves the reader waiting for bytes that
+                #   will never come; a real frame may still be among those it holds
+                while reader.state in (HEADER, BODY) and len(reader.frame) > 1:
+                    reader.resync()
+                if reader.state == COMPLETE:
+                    break
+                if corrupted or reader.state == BAD_BCC:
+                    raise FrameError('Reply failed its BCC check')
+                if stray_nak:
+                    raise FrameError('No reply, and a NAK after the frame was answered')
+                raise LinkTimeout(f'No reply within {self.read_timeout}s')
+
+        #   NOTE:
+        #   99% of the time (for some unknown reason) the device
+        #   adds a 0x06 (ACK) to the beginning of a response frame.
+        #   The frame is accepted whether or not the ACK was seen.
+        self._answered = True
+        return reader.frame
+
+    def _write(self, data) -> tuple:
+        '''
+        Internal use only.
+        Writes data to the serial port. Must be provided with a valid SK-AD3 frame, either as a
+        list of ints or as any bytes-like object (which is written as is, without copying).
+        Waits up to `self.write_timeout` seconds for the frame to drain onto the wire.
+
+        Returns `(bytes_written, elapsed_seconds)`.
+        '''
+        if self.abort_event is not None and self.abort_event.is_set():
+            raise LinkCancelled('Write abandoned by caller')
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+
+        start = monotonic()
+        try:
+            written = self.serial_context.write(data)
+        except SerialTimeoutException:
+            raise
+        except SerialException:
+            #   The handle went stale (e.g. the adapter was replugged). Reopen and resend once.
+            self.serial_context.reopen()
+            written = self.serial_context.write(data)
+        self._answered = False
+        if self.trace is not None:
+            self.trace.record(TX, data)
+        self.serial_context.drain(self.write_timeout)
+        self._wrote_at = monotonic()
+
+        return written, self._wrote_at - start
@@ -0,0 +1,80 @@
+import asyncio
+import inspect
+from . import SK_AD3
+from .worker import DeviceWorker, COMMANDS
+from .api.utils.lazy import LazyMethod
+
+
+class AsyncSK_AD3:
+    '''
+    An asyncio front end for `SK_AD3`. Every command listed in `COMMANDS` is available
+    as a coroutine taking the same arguments, plus an optional `timeout` in seconds,
+    and resolves to the same `Response`/`APDU_Response`::
+
+        async with AsyncSK_AD3('COM7') as dispenser:
+            response = await dispenser.move_card('RF', timeout=5)
+
+    Commands run one at a time, in call order, on the dispenser's `DeviceWorker` thread,
+    so the event loop never blocks on the port and multi-frame commands such as
+    `aes_authenticate` are never interleaved. Cancelling a call (or letting its `timeout`
+    expire) abandons its exchange within one port read slice and raises `LinkCancelled`
+    on that thread; calls queued behind it are unaffected.
+
+    Construct it with the same arguments as `SK_AD3`, or wrap an existing instance
+    with `AsyncSK_AD3(dispenser=...)`.
+    '''
+
+    def __init__(self, *args, dispenser: SK_AD3 = None, **kwargs):
+        self.dispenser = dispenser if dispenser is not None else SK_AD3(*args, **kwargs)
+        self.worker = DeviceWorker(self.dispenser)
+
+    async def __aenter__(self) -> 'AsyncSK_AD3':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def connect(self) -> None:
+        '''
+        Keeps the port open until `close()`. See `SK_AD3.connect()`.
+        '''
+        await self.submit(SK_AD3.connect)
+
+    async def close(self) -> None:
+        '''
+        Closes the port and stops the I/O thread once queued commands have finished.
+        '''
+        await self.submit(SK_AD3.disconnect)
+        await asyncio.get_running_loop().run_in_executor(None, self.worker.close)
+
+    async def submit(self, function, *args, timeout: float = None, **kwargs):
+        '''
+        Awaits `function(dispenser, *args, **kwargs)` run as one unit on the I/O thread.
+        See `DeviceWorker.submit()`.
+        '''
+        future = self.worker.submit(function, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            #   The thread cannot be interrupted directly; tell the exchange to give up
+            future.abort()
+            raise
+
+
+def _awaitable(name: str):
+    async def command(self, *args, timeout: float = None, **kwargs):
+        return await self.submit(name, *args, timeout=timeout, **kwargs)
+
+    command.__name__ = command.__qualname__ = name
+    #   Looked up statically: resolving a LazyMethod here would import the DESFire commands
+    method = inspect.getattr_static(SK_AD3, name)
+    if isinstance(method, LazyMethod):
+        command.__doc__ = f'See `SK_AD3.{name}`.'
+    else:
+        command.__doc__ = method.__doc__
+    return command
+
+
+for _name in COMMANDS:
+    setattr(AsyncSK_AD3, _name, _awaitable(_name))
@@ -3,6 +3,8 @@ CMT = 0x43
 PMT = 0x50
 EMT = 0x4E
 ETX = 0x03
+ACK = 0x06
+NAK = 0x15
 
 COMMAND_INIT = 0x30
 
@@ -1,10 +1,11 @@
 from ...file_objects.application import BaseDesfireApplication
 from ..response.response import APDU_Response
-from ..utils.utils import hexify
+from .uid import CardUID
+from .session import PICC_AID
 from .apdu_utils.application_commands import *
 
 
-def get_card_uid(self) -> APDU_Response:
+def get_card_uid(self, binary: bool = None) -> APDU_Response:
     '''
     Gets the UID of a card. You should always be able to obtain this information
     without authentication. the Get Version command-response procedure takes place
@@ -16,12 +17,16 @@ def get_card_uid(self) -> APDU_Response:
     If successful, response.data is::
 
     {'uid': str}
+
+    or, in binary mode (`binary`, which defaults to `self.binary`)::
+
+    {'uid': CardUID}
     '''
     with self.serial_context:
 
         #   Get the card version info
         apdu = command_get_version()
-        response = self.send_raw_apdu(apdu)
+        response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(response)
 
         if not response.is_successful():
@@ -29,7 +34,7 @@ def get_card_uid(self) -> APDU_Response:
 
         #   Get the next frame
         apdu = command_additional_frame()
-        response = self.send_raw_apdu(apdu)
+        response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(response)
 
         if not response.is_successful():
@@ -37,15 +42,16 @@ def get_card_uid(self) -> APDU_Response:
 
         #   And the next frame
         apdu = command_additional_frame()
-        response = self.send_raw_apdu(apdu)
+        response = self.send_raw_apdu(apdu, binary=True)
 
         #   Strip away non-uid-related information
-        uid = response[10:17]
-        uid = ''.join([i.replace('0x', '').upper() for i in hexify(uid)])
+        uid = CardUID(response[10:17])
+        #   The session keeps the CardUID whatever form the caller asked for
+        self.card_session.uid = uid
 
         #   Return successful response
         response = APDU_Response(response)
-        response.data = {'uid': uid}
+        response.data = {'uid': uid if (self.binary if binary is None else binary) else uid.text}
 
         return response
 
@@ -65,7 +71,7 @@ def create_application(self, app: BaseDesfireApplication) -> APDU_Response:
     with self.serial_context:
         apdu = command_create_application(
             app.aid, app.key_settings, app.app_settings)
-        response = self.send_raw_apdu(apdu)
+        response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(response)
 
         if not response.is_successful():
@@ -88,12 +94,18 @@ def select_application(self, aid: list):
     {'selected': aid, 'status' True}
     '''
     with self.serial_context:
+        #   Selecting ends the authentication, whether or not it succeeds
+        session = self.card_session
+        session.end_authentication()
+
         apdu = command_select_application(aid)
-        response = self.send_raw_apdu(apdu)
+        response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(response)
         if not response.is_successful():
+            session.aid = None
             response.data['selected'] = {'aid': aid, 'status': False}
             return response
+        session.aid = list(aid)
         response.data['selected'] = {'aid': aid, 'status': True}
         return response
 
@@ -109,11 +121,18 @@ def delete_application(self, aid: list) -> APDU_Response:
     '''
     with self.serial_context:
         apdu = command_delete_application(aid)
-        response = self.send_raw_apdu(apdu)
+        response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(response)
         if not response.is_successful():
             response.data['deleted'] = {'aid': aid, 'status': False}
             return response
+
+        #   Deleting the selected application leaves the PICC selected
+        session = self.card_session
+        if session.aid == list(aid):
+            session.aid = list(PICC_AID)
+            session.end_authentication()
+
         response.data['deleted'] = {'aid': aid, 'status': True}
         return response
 
@@ -134,14 +153,14 @@ def get_application_ids(self) -> APDU_Response:
     '''
     with self.serial_context:
         apdu = command_get_application_ids()
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
 
         if not response.is_successful():
             response.data['ids'] = None
             return response
 
-        ids = raw_response[10:-4]
+        ids = response.payload
 
         #   If no applications exist on the card
         if not ids:
@@ -149,7 +168,7 @@ def get_application_ids(self) -> APDU_Response:
             response.data['ids'] = None
 
         #   ids is a list of application ids. Each application id is a list of exactly 3 ints
-        ids = [ids[x:x+3] for x in range(0, len(ids), 3)]
+        ids = [list(ids[x:x+3]) for x in range(0, len(ids), 3)]
 
         #   If currently authenticated, the card will return ids along with an 8-byte
         #   CMAC added to the response. If the length of the last chunk of ids is 2,
@@ -174,7 +193,7 @@ def format_picc(self):
     '''
     with self.serial_context:
         apdu = command_format_picc()
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
 
         if not response.is_successful():
@@ -1,6 +1,6 @@
 from Crypto.Cipher import AES, DES
-import numpy as np
-from collections import deque
+from secrets import token_bytes
+from .crypto import ecb, cbc_encrypt, cbc_decrypt, rotate_left
 
 
 class Auth:
@@ -16,53 +16,39 @@ class Auth:
 
         assert (self.engine and self.index)
 
-        self.key = key
+        self.key = bytes(key)
         self.iv = None
-        self.cipher = None
+        self.cipher = ecb(self.engine, self.key)
         self.random_a = None
         self.random_b = None
         self.session_key = None
         self.authenticated = False
 
-    def _first_pass(self, ciphertext: list) -> list:
+    def _first_pass(self, ciphertext) -> list:
         '''
         Internal use only.
         Performs an external authentication procedure.
         '''
-        ciphertext = bytearray(ciphertext)
-        self.iv = bytearray([0x00] * self.index)
-        self.cipher = self.engine.new(
-            self.key, self.engine.MODE_CBC, iv=self.iv)
-        self.random_b = self.cipher.decrypt(ciphertext)
-        self.random_a = list(np.random.randint(0, 255, self.index))
-        random_b_prime = deque(list(self.random_b))
-        random_b_prime.rotate(-1)
-        random_b_prime = list(random_b_prime)
-        concatenated = bytearray(self.random_a + random_b_prime)
-        self.iv = ciphertext
-        cipher = self.engine.new(self.key, self.engine.MODE_CBC, iv=self.iv)
-        encrypted_concatenated = cipher.encrypt(concatenated)
+        ciphertext = bytes(ciphertext)
+        self.random_b = cbc_decrypt(self.cipher, bytes(self.index), ciphertext)
+        self.random_a = token_bytes(self.index)
+        encrypted_concatenated = cbc_encrypt(
+            self.cipher, ciphertext, self.random_a + rotate_left(self.random_b))
         self.iv = encrypted_concatenated[-self.index:]
-        result = list(encrypted_concatenated)
-        return result
+        return list(encrypted_concatenated)
 
-    def _second_pass(self, ciphertext: list) -> None:
+    def _second_pass(self, ciphertext) -> None:
         '''
         Internal use only.
         Decrypt last response. If it matches the original `random_a` (rotated one byte left),
         the reader knows the card has the same self.engine key.
-        It assumes that external_authentication has already been called. 
+        It assumes that external_authentication has already been called.
         '''
-        cipher = self.engine.new(self.key, self.engine.MODE_CBC, iv=self.iv)
-        ciphertext = bytearray(ciphertext)
-        result = cipher.decrypt(ciphertext)
-        check = deque(self.random_a)
-        check.rotate(-1)
-        self.authenticated = list(check) == list(result)
+        result = cbc_decrypt(self.cipher, self.iv, ciphertext) if len(ciphertext) == self.index else None
+        self.authenticated = result == rotate_left(self.random_a)
         if self.authenticated:
             if self.engine == AES:
-                part_1 = list(self.random_a[:4]) + list(self.random_b[:4])
-                part_2 = list(self.random_a[-4:]) + list(self.random_b[-4:])
-                self.session_key = part_1 + part_2
+                self.session_key = list(self.random_a[:4] + self.random_b[:4]
+                                        + self.random_a[-4:] + self.random_b[-4:])
             if self.engine == DES:
-                self.session_key = list(self.random_a[:4]) + list(self.random_b[:4])
+                self.session_key = list(self.random_a[:4] + self.random_b[:4])
@@ -0,0 +1,46 @@
+#   NOTE: DESFire only ever enciphers a block or two at a time, so creating a CBC
+#   cipher object (and its key schedule) per message costs more than the encryption
+#   itself. Instead, an ECB cipher is built once per key and CBC chaining is done here.
+#   ECB cipher objects keep no state between calls, so one can serve a whole
+#   authentication (see `Auth`) or session (see `CardSession.cipher`). They are not
+#   cached globally, so keys do not outlive the objects that use them.
+
+
+def ecb(engine, key: bytes):
+    '''
+    The ECB cipher for `key` under `engine` (`AES` or `DES`).
+    '''
+    return engine.new(bytes(key), engine.MODE_ECB)
+
+
+def _xor(a, b) -> bytes:
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
+
+def cbc_encrypt(cipher, iv, data) -> bytes:
+    '''
+    CBC-encrypts `data` (a whole number of blocks) with the ECB `cipher`, starting from `iv`.
+    '''
+    block = len(iv)
+    out = bytearray()
+    previous = iv
+    for start in range(0, len(data), block):
+        previous = cipher.encrypt(_xor(data[start:start + block], previous))
+        out += previous
+    return bytes(out)
+
+
+def cbc_decrypt(cipher, iv, data) -> bytes:
+    '''
+    CBC-decrypts `data` (a whole number of blocks) with the ECB `cipher`, starting from `iv`.
+    '''
+    data = bytes(data)
+    #   Every block can be deciphered in one call; chaining is a single XOR afterwards
+    return _xor(cipher.decrypt(data), bytes(iv) + data[:-len(iv)])
+
+
+def rotate_left(data) -> bytes:
+    '''
+    `data` rotated one byte to the left, as exchanged during authentication.
+    '''
+    return bytes(data[1:]) + bytes(data[:1])
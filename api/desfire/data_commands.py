@@ -1,30 +1,103 @@
 from ..response.response import APDU_Response
 from ..utils.utils import hexify
 from .apdu_utils.data_commands import *
+from .apdu_utils.application_commands import command_additional_frame
+
+
+#   NOTE: a DESFire frame carries at most 59 bytes of data. Longer transfers are split
+#   across frames, chained by the 0x91AF (additional frame) status. The first frame of a
+#   write also carries the 7-byte fileno/offset/length header.
+MAX_FRAME_DATA = 59
+WRITE_HEADER_LENGTH = 7
+ADDITIONAL_FRAME = (0x91, 0xAF)
+
+
+def _chain(self, apdu: list):
+    '''
+    Internal use only.
+    Sends `apdu` and keeps requesting additional frames for as long as the card
+    answers 0x91AF. Yields every APDU_Response, stopping after the first failure.
+    '''
+    response = APDU_Response(self.send_raw_apdu(apdu, binary=True))
+    yield response
+    while response.is_successful() and tuple(response.code) == ADDITIONAL_FRAME:
+        response = APDU_Response(self.send_raw_apdu(command_additional_frame(), binary=True))
+        yield response
+
+
+def _write_chained(self, build, data) -> APDU_Response:
+    '''
+    Internal use only.
+    Sends `build(first_chunk)`, then as many additional frames as it takes to deliver
+    the rest of `data`. Returns the last APDU_Response, stopping after the first failure.
+    '''
+    first = MAX_FRAME_DATA - WRITE_HEADER_LENGTH
+    #   The apdu_utils builders work on lists
+    response = APDU_Response(self.send_raw_apdu(build(list(data[:first])), binary=True))
+    for start in range(first, len(data), MAX_FRAME_DATA):
+        if not response.is_successful():
+            break
+        apdu = command_additional_frame(list(data[start:start + MAX_FRAME_DATA]))
+        response = APDU_Response(self.send_raw_apdu(apdu, binary=True))
+    return response
+
+
+def iter_read_data(self, fileno: list,
+                   offset: list = [0x00, 0x00, 0x00],
+                   length: list = [0x00, 0x00, 0x00]):
+    '''
+    Reads `length` bytes of data in a file starting at `offset`, yielding the data of
+    each frame as `bytes` as soon as it arrives. Additional frames are requested
+    automatically. `length` is `[0x00, 0x00, 0x00]` (the rest of the file) by default;
+    in that case, within an AES session, the last chunk ends with the card's 8-byte CMAC.
+
+    Raises an Exception if the card answers with an error.
+    '''
+    #   Anything past the requested length (e.g. a trailing CMAC) is dropped
+    remaining = int.from_bytes(bytes(length), 'little') or None
+    with self.serial_context:
+        for response in _chain(self, command_read_data(fileno, offset, length)):
+            if not response.is_successful():
+                raise Exception(f'Read of file {fileno} failed: {response.code}')
+            chunk = response.payload
+            if remaining is not None:
+                chunk = chunk[:remaining]
+                remaining -= len(chunk)
+            yield bytes(chunk)
 
 
 def read_data(self, fileno: list,
               offset: list = [0x00, 0x00, 0x00],
-              length: list = [0x10, 0x00, 0x00]) -> APDU_Response:
+              length: list = [0x10, 0x00, 0x00],
+              binary: bool = None) -> APDU_Response:
     '''
     Reads `length` bytes of data in a file starting at `offset`. 
     `offset` is set to `[0x00, 0x00, 0x00]` (no offset) by default.
-    `length` is set to `[0x00, 0x00, 0x00]` (16 bytes) by default.
+    `length` is set to `[0x10, 0x00, 0x00]` (16 bytes) by default.
+    `[0x00, 0x00, 0x00]` reads the rest of the file. Data spanning several frames is
+    collected automatically; see `iter_read_data` to process it frame by frame instead.
 
     If successful, response.data is::
 
     {'file': {'fileno' int, 'file_data': list}}
+
+    where `file_data` is a list of hex strings, or `bytes` in binary mode
+    (`binary`, which defaults to `self.binary`).
     '''
+    requested = int.from_bytes(bytes(length), 'little') or None
     with self.serial_context:
-        apdu = command_read_data(fileno, offset, length)
-        raw_response = self.send_raw_apdu(apdu)
-        response = APDU_Response(raw_response)
-        if not response.is_successful():
-            response.data['file'] = {'fileno': fileno,
-                                     'file_data': None}
-            return response
-
-        file_data = hexify(response.raw_response[10: -4])
+        chunks = []
+        for response in _chain(self, command_read_data(fileno, offset, length)):
+            if not response.is_successful():
+                response.data['file'] = {'fileno': fileno,
+                                         'file_data': None}
+                return response
+            chunks.append(response.payload)
+
+        #   Anything past the requested length (e.g. a trailing CMAC) is dropped
+        file_data = b''.join(chunks)[:requested]
+        if not (self.binary if binary is None else binary):
+            file_data = hexify(file_data)
         response.data['file'] = {'fileno': fileno,
                                  'file_data': file_data}
         return response
@@ -33,20 +106,25 @@ def read_data(self, fileno: list,
 def write_data(self, fileno: list,
                data: list,
                offset: list = [0x00, 0x00, 0x00],
-               length: list = [0x10, 0x00, 0x00]) -> APDU_Response:
+               length: list = None) -> APDU_Response:
     '''
     Writes data to a the file specified by `fileno` in the application currently selected.
+    `data` may be a list of ints or any bytes-like object, of any size: it is split across
+    as many frames as it takes.
     Offset is `[0x00, 0x00, 0x00]` (no offset) by default. 
-    Length is `[0x10, 0x00, 0x00]` (16 bytes) by default.
+    Length is the length of `data` by default.
 
     If successful, response.data is::
 
     {'file': {'fileno': int, 'written': True}}
     '''
+    data = memoryview(bytes(data))
+    if length is None:
+        length = list(len(data).to_bytes(3, 'little'))
+
     with self.serial_context:
-        apdu = command_write_data(fileno, offset, length, data)
-        raw_response = self.send_raw_apdu(apdu)
-        response = APDU_Response(raw_response)
+        response = _write_chained(
+            self, lambda chunk: command_write_data(fileno, offset, length, chunk), data)
         if not response.is_successful():
             response.data['file'] = {'fileno': fileno, 'written': False}
             return response
@@ -57,20 +135,24 @@ def write_data(self, fileno: list,
 def write_record(self, fileno: list,
                  data: list,
                  offset: list = [0x00, 0x00, 0x00],
-                 length: list = [0x10, 0x00, 0x00]) -> APDU_Response:
+                 length: list = None) -> APDU_Response:
     '''
     Writes a record to a the record file specified by `fileno` in the application currently selected.
+    As with `write_data`, records longer than one frame are split automatically.
     Offset is `[0x00, 0x00, 0x00]` (no offset) by default. 
-    Length is `[0x10, 0x00, 0x00]` (16 bytes) by default.
+    Length is the length of `data` by default.
 
     If successful, response.data is::
 
     {'file': {'fileno': int, 'record_written': True}}
     '''
+    data = memoryview(bytes(data))
+    if length is None:
+        length = list(len(data).to_bytes(3, 'little'))
+
     with self.serial_context:
-        apdu = command_write_record(fileno, offset, length, data)
-        raw_response = self.send_raw_apdu(apdu)
-        response = APDU_Response(raw_response)
+        response = _write_chained(
+            self, lambda chunk: command_write_record(fileno, offset, length, chunk), data)
         if not response.is_successful():
             response.data['file'] = {'fileno': fileno, 'record_written': False}
             return response
@@ -78,23 +160,39 @@ def write_record(self, fileno: list,
         return response
 
 
-def read_record(self, fileno: list, record_number: list, number_of_records: list) -> APDU_Response:
+def read_record(self, fileno: list, record_number: list, number_of_records: list,
+                binary: bool = None) -> APDU_Response:
+    '''
+    Reads records from the record file specified by `fileno`.
+
+    If successful, response.data is::
+
+    {'record_data': list}
+
+    where `record_data` is a list of ints, or `bytes` in binary mode
+    (`binary`, which defaults to `self.binary`).
+    '''
     with self.serial_context:
         apdu = command_read_record(fileno, record_number, number_of_records)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['record_data'] = None
             return response
-        response.data['record_data'] = raw_response[10:-12]
+        record_data = response.payload[:-8]
+        if self.binary if binary is None else binary:
+            response.data['record_data'] = bytes(record_data)
+        else:
+            response.data['record_data'] = list(record_data)
         return response
 
 
 def credit_value_file(self, fileno: list, amount: list) -> APDU_Response:
-    amount = list(amount[0].to_bytes(4, byteorder='big'))
+    #   Value files hold signed 32 bit integers, least significant byte first
+    amount = list(amount[0].to_bytes(4, 'little', signed=True))
     with self.serial_context:
         apdu = command_credit(fileno, amount)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['credit'] = False
@@ -105,10 +203,11 @@ def credit_value_file(self, fileno: list, amount: list) -> APDU_Response:
 
 
 def debit_value_file(self, fileno: list, amount: list) -> APDU_Response:
-    amount = list(amount[0].to_bytes(4, byteorder='big'))
+    #   Value files hold signed 32 bit integers, least significant byte first
+    amount = list(amount[0].to_bytes(4, 'little', signed=True))
     with self.serial_context:
         apdu = command_debit(fileno, amount)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['debit'] = False
@@ -119,18 +218,24 @@ def debit_value_file(self, fileno: list, amount: list) -> APDU_Response:
 
 
 def get_value_in_value_file(self, fileno: list) -> APDU_Response:
+    '''
+    Reads the value held in the value file specified by `fileno`.
+
+    If successful, response.data is::
+
+    {'value': int}
+    '''
     with self.serial_context:
         apdu = command_get_value(fileno)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['value'] = False
             return response
 
-        #   Converting from list of hex strings to single integer value
-        temp = ''.join([i.replace('0x', '')
-                       for i in hexify(raw_response[10:-4])])
-        value = int(temp, 16)
+        #   A signed 32 bit integer, least significant byte first (followed by a MAC
+        #   when authenticated)
+        value = int.from_bytes(response.payload[:4], 'little', signed=True)
 
         response.data['value'] = value
         return response
@@ -139,7 +244,7 @@ def get_value_in_value_file(self, fileno: list) -> APDU_Response:
 def commit_transaction(self) -> APDU_Response:
     with self.serial_context:
         apdu = command_commit_transaction()
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['commit'] = False
@@ -1,24 +1,23 @@
-from ..constants.command_codes import *
-from ..utils.utils import bcc
+from ..link.frames import build_frame
 
 
-def send_raw_apdu(self, apdu: list) -> list:
+def send_raw_apdu(self, apdu, binary: bool = False):
     '''
-    This is a generic method for wrapping APDUs in complete Command Packages 
-    and dispatching them to the SK-AD3 machine. `apdu` must be a list.
-    '''
-    # Since CMT, 0x60, and 0x34 are part of the TEXT field of the command package,
-    # The length in bytes of the TEXT field = the length of the APDU + 3
-    len_text = len(apdu) + 3
-    lenh = len_text >> 8
-    lenl = len_text & 0x00FF
-
-    buffer = [STX, self.addr, lenh, lenl, CMT, 0x60, 0x34]
-    buffer += apdu
-    buffer += [ETX]
-    buffer += [bcc(buffer)]
+    This is a generic method for wrapping APDUs in complete Command Packages
+    and dispatching them to the SK-AD3 machine. `apdu` may be a list of ints or
+    any bytes-like object. Returns the raw response frame as a list of ints, or with
+    `binary`, as the `bytearray` it was read into (as the commands use it).
 
-    self._write(buffer)
-    raw_response = self._read()
-
-    return raw_response
+    The card session is kept in step with the card (see `CardSession.observe`), so any
+    APDU may be sent this way without leaving a stale authentication behind.
+    '''
+    try:
+        #   CMT, 0x60 and 0x34 are part of the TEXT field of the command package;
+        #   build_frame works out LENH/LENL and the BCC around the APDU
+        reply = self._exchange(build_frame(self.addr, 0x60, 0x34, apdu))
+    except Exception:
+        #   Whether the card saw the command is unknown, and with it the authentication
+        self.card_session.end_authentication()
+        raise
+    self.card_session.observe(apdu, reply)
+    return reply if binary else list(reply)
@@ -21,7 +21,7 @@ def create_standard_data_file(self, file: BaseDataFile) -> APDU_Response:
     with self.serial_context:
         apdu = command_create_std_data_file(
             file.fileno, file.comms_setting_byte, file.access_rights, file.file_size)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['file'] = {'fileno': file.fileno,
@@ -36,7 +36,7 @@ def create_cyclic_record_file(self, file: BaseDataFile) -> APDU_Response:
     with self.serial_context:
         apdu = command_create_cyclic_record_file(
             file.fileno, file.comms_setting_byte, file.access_rights, file.record_size, file.number_of_records)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['file'] = {'fileno': file.fileno,
@@ -50,12 +50,12 @@ def create_cyclic_record_file(self, file: BaseDataFile) -> APDU_Response:
 def get_file_settings(self, fileno: list) -> APDU_Response:
     with self.serial_context:
         apdu = command_get_file_settings(fileno)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['file_settings'] = None
             return response
-        response.data['file_settings'] = raw_response
+        response.data['file_settings'] = response.raw_response
         return response
 
 
@@ -72,7 +72,7 @@ def create_value_file(self, file: BaseDataFile) -> APDU_Response:
         apdu = command_create_value_file(file.fileno, file.comms_setting_byte, file.access_rights,
                                          file.lower_limit, file.upper_limit, file.initial_value, file.limited_credit_available)
 
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['file'] = {'fileno': file.fileno,
@@ -93,7 +93,7 @@ def delete_file(self, fileno: list) -> APDU_Response:
     '''
     with self.serial_context:
         apdu = command_delete_file(fileno)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['file'] = {'fileno': fileno,
@@ -113,10 +113,10 @@ def get_file_ids(self) -> APDU_Response:
     '''
     with self.serial_context:
         apdu = command_get_file_ids()
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         if not response.is_successful():
             response.data['file'] = {'ids': None}
             return response
-        response.data['file'] = {'ids': raw_response}
+        response.data['file'] = {'ids': response.raw_response}
         return response
@@ -0,0 +1,273 @@
+from ...file_objects.application import BaseDesfireApplication
+from ...file_objects.file import BaseDataFile
+from ..response.response import APDU_Response
+from .apdu_utils.data_commands import command_read_record
+from .data_commands import _chain
+
+
+#   NOTE: a card image is a flat stream of records, each laid out as:
+#
+#           [TAG] + [LENGTH (3 bytes, little endian)] + [BODY]
+#
+#   following an 8-byte magic and a version byte. Records appear in the order the card
+#   was walked, so an image can be written and replayed without holding it in memory:
+#
+#           PICC                key settings, max keys
+#           APPLICATION         aid (3), key settings, app settings
+#           FILE                fileno, raw Get File Settings response
+#           DATA                fileno, file contents              (data files)
+#           VALUE               fileno, raw Get Value response (4)  (value files)
+#           RECORDS             fileno, records, oldest first      (record files)
+#           END
+#
+#   DATA, VALUE and RECORDS immediately follow the FILE record they belong to.
+
+IMAGE_MAGIC = b'SKAD3IMG'
+IMAGE_VERSION = 1
+
+TAG_PICC = 0x01
+TAG_APPLICATION = 0x02
+TAG_FILE = 0x03
+TAG_DATA = 0x04
+TAG_VALUE = 0x05
+TAG_RECORDS = 0x06
+TAG_END = 0xFF
+
+#   File types, as the first byte of Get File Settings
+STANDARD_DATA_FILE = 0x00
+BACKUP_DATA_FILE = 0x01
+VALUE_FILE = 0x02
+LINEAR_RECORD_FILE = 0x03
+CYCLIC_RECORD_FILE = 0x04
+
+#   Length of the Get File Settings response for each file type
+SETTINGS_LENGTH = {
+    STANDARD_DATA_FILE: 7,
+    BACKUP_DATA_FILE: 7,
+    VALUE_FILE: 17,
+    LINEAR_RECORD_FILE: 13,
+    CYCLIC_RECORD_FILE: 13,
+}
+
+#   Upper bound on the file contents held in memory at once while restoring
+RESTORE_CHUNK = 1024
+
+CMAC_LENGTH = 8
+
+
+def _check(response: APDU_Response, step: str) -> APDU_Response:
+    if not response.is_successful():
+        raise Exception(f'{step} failed: {response.raw_response}')
+    return response
+
+
+def _key_settings(self) -> APDU_Response:
+    #   Get Key Settings (0x45) for the PICC or the currently selected application
+    return _check(APDU_Response(self.send_raw_apdu([0x90, 0x45, 0x00, 0x00, 0x00], binary=True)),
+                  'Get Key Settings')
+
+
+def _write_record(stream, tag: int, body) -> int:
+    stream.write(bytes([tag]) + len(body).to_bytes(3, 'little'))
+    stream.write(body)
+    return 4 + len(body)
+
+
+def _read_exactly(stream, length: int) -> bytes:
+    data = stream.read(length)
+    if len(data) != length:
+        raise Exception('Card image is truncated')
+    return data
+
+
+def _records(stream):
+    '''
+    Yields `(tag, length)` for each record in an image, leaving `stream` positioned at
+    the record body. The body must be consumed before asking for the next record.
+    '''
+    if _read_exactly(stream, len(IMAGE_MAGIC)) != IMAGE_MAGIC:
+        raise Exception('Not a card image')
+    version = _read_exactly(stream, 1)[0]
+    if version != IMAGE_VERSION:
+        raise Exception(f'Unsupported card image version {version}')
+    while True:
+        header = _read_exactly(stream, 4)
+        tag, length = header[0], int.from_bytes(header[1:], 'little')
+        if tag == TAG_END:
+            return
+        yield tag, length
+
+
+def dump_card(self, stream, authenticate=None) -> dict:
+    '''
+    Walks every application and file on the card in the RF position and writes a
+    card image to `stream` (a binary file object) as it goes, so memory use does not
+    grow with the size of the card. See `restore_card()` to replay it.
+
+    `authenticate(dispenser, aid)`, if given, is called with the PICC aid `[0x00, 0x00, 0x00]`
+    before listing applications and again after each application is selected, and
+    should authenticate as needed to read it (returning the authentication response).
+    Within an AES session the card appends a CMAC to its answers, which is stripped.
+
+    Raises an Exception if any step fails. Returns::
+
+    {'applications': int, 'files': int, 'bytes': int}
+    '''
+    summary = {'applications': 0, 'files': 0, 'bytes': 0}
+
+    def authenticated(aid: list) -> bool:
+        #   True when answers will carry a CMAC
+        if authenticate is None:
+            return False
+        response = _check(authenticate(self, aid), f'Authentication for {aid}')
+        return len(response.data.get('session_key') or []) == 16
+
+    def emit(tag: int, body) -> None:
+        summary['bytes'] += _write_record(stream, tag, body)
+
+    with self.serial_context:
+        stream.write(IMAGE_MAGIC + bytes([IMAGE_VERSION]))
+        summary['bytes'] += len(IMAGE_MAGIC) + 1
+
+        _check(self.select_application([0x00, 0x00, 0x00]), 'Select PICC')
+        authenticated([0x00, 0x00, 0x00])
+        emit(TAG_PICC, bytes(_key_settings(self).payload[:2]))
+
+        aids = _check(self.get_application_ids(), 'Get Application IDs').data['ids'] or []
+        for aid in aids:
+            _check(self.select_application(aid), f'Select application {aid}')
+            mac = authenticated(aid)
+            emit(TAG_APPLICATION, bytes(aid) + bytes(_key_settings(self).payload[:2]))
+            summary['applications'] += 1
+
+            fileids = _check(self.get_file_ids(), f'Get File IDs of {aid}').payload
+            if mac:
+                fileids = fileids[:-CMAC_LENGTH]
+            for fileno in bytes(fileids):
+                settings = _check(self.get_file_settings([fileno]), f'Get File Settings of {fileno}').payload
+                file_type = settings[0]
+                if file_type not in SETTINGS_LENGTH:
+                    raise Exception(f'File {fileno} is of unknown type {file_type}')
+                settings = bytes(settings[:SETTINGS_LENGTH[file_type]])
+                emit(TAG_FILE, bytes([fileno]) + settings)
+                summary['files'] += 1
+
+                if file_type in (STANDARD_DATA_FILE, BACKUP_DATA_FILE):
+                    size = int.from_bytes(settings[4:7], 'little')
+                    stream.write(bytes([TAG_DATA]) + (size + 1).to_bytes(3, 'little') + bytes([fileno]))
+                    #   Stream the contents straight through, frame by frame
+                    remaining = size
+                    for chunk in self.iter_read_data([fileno], [0x00, 0x00, 0x00], list(settings[4:7])):
+                        stream.write(chunk)
+                        remaining -= len(chunk)
+                    if remaining:
+                        raise Exception(f'Read of file {fileno} returned {size - remaining} of {size} bytes')
+                    summary['bytes'] += 5 + size
+
+                elif file_type == VALUE_FILE:
+                    value = _check(self.get_value_in_value_file([fileno]), f'Get Value of {fileno}').payload
+                    emit(TAG_VALUE, bytes([fileno]) + bytes(value[:4]))
+
+                elif file_type in (LINEAR_RECORD_FILE, CYCLIC_RECORD_FILE):
+                    record_size = int.from_bytes(settings[4:7], 'little')
+                    current = int.from_bytes(settings[10:13], 'little')
+                    records = bytearray()
+                    if current:
+                        for response in _chain(self, command_read_record([fileno], [0x00] * 3, [0x00] * 3)):
+                            records += _check(response, f'Read Records of {fileno}').payload
+                    emit(TAG_RECORDS, bytes([fileno]) + records[:record_size * current])
+
+        emit(TAG_END, b'')
+        return summary
+
+
+def restore_card(self, stream, authenticate=None) -> dict:
+    '''
+    Replays a card image written by `dump_card()` onto the blank card in the RF position:
+    creates each application and its files with their original settings, then writes
+    their contents. File contents are written in pieces of at most `RESTORE_CHUNK` bytes,
+    so memory use does not grow with the size of the image.
+
+    `authenticate(dispenser, aid)`, if given, is called with the PICC aid `[0x00, 0x00, 0x00]`
+    before each application is created, and again after the new application is selected
+    (when its keys are still the defaults). PICC key settings are recorded in the image
+    but not applied.
+
+    Backup data and linear record files are dumped, but cannot be recreated by this API.
+
+    Raises an Exception if any step fails. Returns::
+
+    {'applications': int, 'files': int}
+    '''
+    summary = {'applications': 0, 'files': 0}
+    #   Value files are only created once their value (the following VALUE record) is known
+    pending_value_file = None
+    record_sizes = {}
+
+    def enter(aid: list) -> None:
+        _check(self.select_application(aid), f'Select application {aid}')
+        if authenticate is not None:
+            _check(authenticate(self, aid), f'Authentication for {aid}')
+
+    with self.serial_context:
+        for tag, length in _records(stream):
+            if tag == TAG_APPLICATION:
+                body = _read_exactly(stream, length)
+                aid = list(body[:3])
+                enter([0x00, 0x00, 0x00])
+                _check(self.create_application(BaseDesfireApplication(aid, [body[3]], [body[4]])),
+                       f'Create application {aid}')
+                enter(aid)
+                summary['applications'] += 1
+
+            elif tag == TAG_FILE:
+                body = _read_exactly(stream, length)
+                fileno, file_type = [body[0]], body[1]
+                comms, access = [body[2]], list(body[3:5])
+                if file_type == STANDARD_DATA_FILE:
+                    file = BaseDataFile(fileno, comms, access, list(body[5:8]))
+                    _check(self.create_standard_data_file(file), f'Create file {fileno}')
+                elif file_type == CYCLIC_RECORD_FILE:
+                    file = BaseDataFile(fileno, comms, access, [0x04, 0x00, 0x00])
+                    file.record_size, file.number_of_records = list(body[5:8]), list(body[8:11])
+                    record_sizes[body[0]] = int.from_bytes(body[5:8], 'little')
+                    _check(self.create_cyclic_record_file(file), f'Create file {fileno}')
+                elif file_type == VALUE_FILE:
+                    pending_value_file = BaseDataFile(fileno, comms, access, [0x04, 0x00, 0x00])
+                    pending_value_file.lower_limit = list(body[5:9])
+                    pending_value_file.upper_limit = list(body[9:13])
+                    pending_value_file.limited_credit_available = [body[17]]
+                else:
+                    raise Exception(f'File {fileno} is of type {file_type}, which cannot be created')
+                summary['files'] += 1
+
+            elif tag == TAG_VALUE:
+                body = _read_exactly(stream, length)
+                pending_value_file.initial_value = list(body[1:5])
+                _check(self.create_value_file(pending_value_file),
+                       f'Create file {pending_value_file.fileno}')
+                pending_value_file = None
+
+            elif tag == TAG_DATA:
+                fileno = [_read_exactly(stream, 1)[0]]
+                offset = 0
+                while offset < length - 1:
+                    chunk = _read_exactly(stream, min(RESTORE_CHUNK, length - 1 - offset))
+                    _check(self.write_data(fileno, chunk, list(offset.to_bytes(3, 'little'))),
+                           f'Write file {fileno}')
+                    offset += len(chunk)
+
+            elif tag == TAG_RECORDS:
+                body = _read_exactly(stream, length)
+                fileno = [body[0]]
+                record_size = record_sizes[body[0]]
+                for start in range(1, len(body), record_size):
+                    _check(self.write_record(fileno, body[start:start + record_size]),
+                           f'Write record to {fileno}')
+                    _check(self.commit_transaction(), 'Commit Transaction')
+
+            else:
+                #   PICC settings, and anything added by later versions
+                _read_exactly(stream, length)
+
+        return summary
@@ -1,7 +1,9 @@
 from Crypto.Cipher import DES, AES
 from .auth import Auth
+from .crypto import ecb, cbc_encrypt
+from .session import key_digest
 from ..response.response import APDU_Response
-from ..utils.utils import crc, flip
+from ..utils.checksum import crc32_bytes
 from .apdu_utils.security_commands import *
 from .apdu_utils.application_commands import command_additional_frame
 
@@ -24,9 +26,12 @@ def aes_authenticate(self, key: list, key_id: list = [0x00]) -> APDU_Response:
 
         authenticator = Auth(key, 'AES')
 
+        #   Any authentication attempt ends the current one, whatever its outcome
+        self.card_session.end_authentication()
+
         #   Request AES Challenge
         apdu = command_aes_auth(key_id)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
         #   Verify that the authentication procedure has begun
         if not response.is_successful():
@@ -34,14 +39,14 @@ def aes_authenticate(self, key: list, key_id: list = [0x00]) -> APDU_Response:
             return response
 
         #   Solve AES Challenge
-        challenge = raw_response[10:-4]
+        challenge = memoryview(raw_response)[10:-4]
         submission = authenticator._first_pass(challenge)
 
         #   Submit, and receive response
         apdu = command_additional_frame(submission)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
 
-        authenticator._second_pass(raw_response[10:-4])
+        authenticator._second_pass(memoryview(raw_response)[10:-4])
 
         response = APDU_Response(raw_response)
 
@@ -53,6 +58,10 @@ def aes_authenticate(self, key: list, key_id: list = [0x00]) -> APDU_Response:
         #   Else, return a successful response
         response.data = {'authentication': True,
                          'session_key': authenticator.session_key}
+        session = self.card_session
+        session.key_no, session.auth_type = key_id[0], 'AES'
+        session.key_digest = key_digest(key)
+        session.session_key, session.response = authenticator.session_key, response
 
         return response
 
@@ -75,8 +84,11 @@ def des_authenticate(self, key: list, key_id: list = [0x00]) -> APDU_Response:
     authenticator = Auth(key, 'DES')
 
     with self.serial_context:
+        #   Any authentication attempt ends the current one, whatever its outcome
+        self.card_session.end_authentication()
+
         apdu = command_des_auth(key_id)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
 
         #   Verify that the authentication procedure has begun
@@ -85,14 +97,14 @@ def des_authenticate(self, key: list, key_id: list = [0x00]) -> APDU_Response:
             return response
 
         #   Solve DES Challenge
-        challenge = raw_response[10:-4]
+        challenge = memoryview(raw_response)[10:-4]
         submission = authenticator._first_pass(challenge)
 
         #   Submit, and receive response
         apdu = command_additional_frame(submission)
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
 
-        authenticator._second_pass(raw_response[10:-4])
+        authenticator._second_pass(memoryview(raw_response)[10:-4])
 
         response = APDU_Response(raw_response)
 
@@ -102,14 +114,19 @@ def des_authenticate(self, key: list, key_id: list = [0x00]) -> APDU_Response:
 
         response.data = {'authentication': True,
                          'session_key': authenticator.session_key}
+        session = self.card_session
+        session.key_no, session.auth_type = key_id[0], 'DES'
+        session.key_digest = key_digest(key)
+        session.session_key, session.response = authenticator.session_key, response
 
         return response
 
 
-def _change_key(new_key: list, session_key: list, key_number: list, key_version: list):
+def _change_key(new_key: list, session_key: list, key_number: list, key_version: list, cipher=None):
     '''
     Internal use only.
     Encrypts the C4/ Change Key command data, builds and returns the encrypted APDU.
+    `cipher` is the ECB cipher for `session_key`, if one was already built.
 
     NOTE: Currently this method cannot revert an AES authenticated card back into its factory DES state.
     '''
@@ -129,55 +146,105 @@ def _change_key(new_key: list, session_key: list, key_number: list, key_version:
 
     command = [0xC4]
 
-    formatted_crc = flip(crc(command + key_number + new_key + key_version))
+    formatted_crc = list(crc32_bytes(command + key_number + new_key + key_version))
 
-    to_encipher = bytearray(new_key + key_version + formatted_crc + padding)
+    to_encipher = bytes(new_key + key_version + formatted_crc + padding)
 
-    cipher = engine.new(bytearray(session_key),
-                        engine.MODE_CBC,
-                        bytearray([0] * len(session_key)))
+    if cipher is None:
+        cipher = ecb(engine, session_key)
 
-    ciphertext = list(cipher.encrypt(to_encipher))
+    ciphertext = list(cbc_encrypt(cipher, bytes(len(session_key)), to_encipher))
 
     apdu = command_change_key(key_number, ciphertext)
 
     return apdu
 
 
-def change_picc_master_key(self, new_key: list, session_key: list, key_version: list = [0x00]) -> APDU_Response:
-
-    key_number = [0x80]
-
-    apdu = _change_key(new_key, session_key, key_number, key_version)
+def _send_change_key(self, new_key: list, session_key: list, key_number: list, key_version: list) -> APDU_Response:
+    '''
+    Internal use only.
+    Sends a Change Key command, enciphered under `session_key` (by default, the session
+    key of the current authentication, see `CardSession`).
+    '''
+    session = self.card_session
+    cipher = None
+    if session_key is None:
+        if not session.authenticated:
+            raise Exception('Changing a key requires an authenticated session')
+        session_key = session.session_key
+        if session.cipher is None:
+            session.cipher = ecb(DES if len(session_key) == 8 else AES, session_key)
+        cipher = session.cipher
+
+    apdu = _change_key(new_key, session_key, key_number, key_version, cipher)
 
     with self.serial_context:
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
 
         if not response.is_successful():
             response.data['key_changed'] = False
             return response
 
+        #   Changing the key in use ends the authentication on the card's side
+        if key_number[0] & 0x0F == session.key_no:
+            session.end_authentication()
+
         response.data['key_changed'] = True
 
         return response
 
 
-def change_application_key(self, new_key: list, session_key: list, key_number: list = [0x00], key_version: list = [0x00]) -> APDU_Response:
+def change_picc_master_key(self, new_key: list, session_key: list = None, key_version: list = [0x00]) -> APDU_Response:
+    '''
+    Changes the PICC master key. Requires authentication with the current PICC master key;
+    `session_key` defaults to the session key of that authentication.
 
-    apdu = _change_key(new_key, session_key, key_number, key_version)
+    If successful, response.data is::
 
-    with self.serial_context:
-        raw_response = self.send_raw_apdu(apdu)
-        response = APDU_Response(raw_response)
+    {'key_changed': True}
+    '''
+    return _send_change_key(self, new_key, session_key, [0x80], key_version)
 
-        if not response.is_successful():
-            response.data['key_changed'] = False
-            return response
 
-        response.data['key_changed'] = True
+def change_application_key(self, new_key: list, session_key: list = None, key_number: list = [0x00], key_version: list = [0x00]) -> APDU_Response:
+    '''
+    Changes key `key_number` of the selected application. Requires authentication with the
+    application master key; `session_key` defaults to the session key of that authentication.
 
-        return response
+    If successful, response.data is::
+
+    {'key_changed': True}
+    '''
+    return _send_change_key(self, new_key, session_key, key_number, key_version)
+
+
+def ensure_authenticated(self, key: list, key_id: list = [0x00], aid: list = None,
+                         auth_type: str = 'AES') -> APDU_Response:
+    '''
+    Authenticates with `key` as key `key_id` (selecting application `aid` first, if given),
+    unless the card session already is, with that same key. Returns the response of the authentication
+    that is in effect, which may be an earlier one. `auth_type` is `'AES'` or `'DES'`.
+
+    If successful, response.data is::
+
+    {'authentication': True, 'session_key': list}
+    '''
+    session = self.card_session
+    with self.serial_context:
+        if aid is not None and session.aid != list(aid):
+            response = self.select_application(aid)
+            if not response.is_successful():
+                return response
+
+        if session.is_authenticated(key_id[0], auth_type, key=key):
+            return session.response
+
+        if auth_type == 'AES':
+            return self.aes_authenticate(key, key_id)
+        if auth_type == 'DES':
+            return self.des_authenticate(key, key_id)
+        raise Exception(f"auth_type must be 'AES' or 'DES', not {auth_type}")
 
 
 def get_key_version(self, key_id: list):
@@ -192,7 +259,7 @@ def get_key_version(self, key_id: list):
     apdu = command_get_key_version(key_id)
 
     with self.serial_context:
-        raw_response = self.send_raw_apdu(apdu)
+        raw_response = self.send_raw_apdu(apdu, binary=True)
         response = APDU_Response(raw_response)
 
         if not response.is_successful():
@@ -0,0 +1,89 @@
+import hashlib
+import hmac
+from ..constants.command_codes import PMT
+
+
+PICC_AID = [0x00, 0x00, 0x00]
+
+#   Status words after which the card keeps the current authentication: success, and
+#   more frames to come. Any other status ends it on the card's side.
+AUTHENTICATION_KEEPING_CODES = frozenset((0x9100, 0x91AF))
+
+#   Instructions that end the current authentication whatever their outcome
+ENDS_AUTHENTICATION = frozenset((
+    0x0A,   # Authenticate (DES)
+    0x1A,   # Authenticate ISO
+    0xAA,   # Authenticate AES
+    0x5A,   # Select Application
+))
+
+
+def key_digest(key) -> bytes:
+    '''
+    A digest of `key`, so the session can tell which key opened it without holding on
+    to the key itself.
+    '''
+    return hashlib.sha256(bytes(key)).digest()
+
+
+class CardSession:
+    '''
+    What an `SK_AD3` instance knows about the card in the RF position: its `uid` (a
+    `CardUID`), the selected `aid`, and the key (`key_no`, `auth_type`, and a `key_digest`
+    of its value) and `session_key` of the current authentication, if any. `response` is the
+    authentication response that opened it, and `cipher` the ECB cipher for the session
+    key, built the first time it is needed and dropped with the authentication.
+
+    The commands keep it up to date, and `send_raw_apdu` ends the authentication as the
+    card does: on any status but success or additional frame, on selecting an application
+    or authenticating again, and when the exchange fails. Changing the key in use ends it
+    too; activating, deactivating or moving a card forgets everything.
+    '''
+
+    __slots__ = ('uid', 'aid', 'key_no', 'auth_type', 'key_digest', 'session_key', 'response', 'cipher')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.uid = None
+        self.aid = None
+        self.end_authentication()
+
+    def end_authentication(self) -> None:
+        self.key_no = None
+        self.auth_type = None
+        self.key_digest = None
+        self.session_key = None
+        self.response = None
+        self.cipher = None
+
+    @property
+    def authenticated(self) -> bool:
+        return self.session_key is not None
+
+    def is_authenticated(self, key_no: int, auth_type: str = None, aid: list = None,
+                         key: list = None) -> bool:
+        '''
+        True if the session is authenticated with key `key_no` (using `auth_type`, within
+        application `aid`, and with the key value `key`, when given).
+        '''
+        return self.authenticated and self.key_no == key_no \
+            and (auth_type is None or self.auth_type == auth_type) \
+            and (aid is None or self.aid == list(aid)) \
+            and (key is None or hmac.compare_digest(self.key_digest, key_digest(key)))
+
+    def observe(self, apdu, reply) -> None:
+        '''
+        Applies what the card does on its side after `apdu` was answered with `reply` (an
+        SK-AD3 frame): the instructions in `ENDS_AUTHENTICATION` and any status not in
+        `AUTHENTICATION_KEEPING_CODES` end the authentication.
+        '''
+        if len(apdu) > 1 and apdu[1] in ENDS_AUTHENTICATION:
+            if apdu[1] == 0x5A:
+                #   Known again once select_application sees the outcome
+                self.aid = None
+            self.end_authentication()
+        elif reply[4] != PMT or len(reply) < 14 \
+                or (reply[-4] << 8 | reply[-3]) not in AUTHENTICATION_KEEPING_CODES:
+            self.end_authentication()
@@ -0,0 +1,16 @@
+from functools import cached_property
+
+
+class CardUID(bytes):
+    '''
+    A card UID as returned by `get_card_uid(binary=True)`: the raw seven bytes,
+    which compare, hash and slice like any other `bytes`. `text` is the 14-character
+    uppercase hex form returned in non-binary mode, computed once on first use.
+    '''
+
+    @cached_property
+    def text(self) -> str:
+        return self.hex().upper()
+
+    def __str__(self) -> str:
+        return self.text
@@ -0,0 +1,29 @@
+class LinkError(Exception):
+    '''
+    Base class for failures of the serial link to the dispenser, as opposed to
+    failures reported by the dispenser or card themselves (see `Response`).
+    '''
+
+
+class LinkCancelled(LinkError):
+    '''
+    The exchange was abandoned because the caller cancelled it (see `SK_AD3.abort_event`).
+    '''
+
+
+class LinkTimeout(LinkError):
+    '''
+    No complete, valid reply arrived within `SK_AD3.read_timeout`.
+    '''
+
+
+class FrameError(LinkError):
+    '''
+    The reply failed its ETX/BCC check, and no valid frame could be recovered from it.
+    '''
+
+
+class FrameRejected(LinkError):
+    '''
+    The dispenser answered with a NAK: it received the frame corrupted and did not act on it.
+    '''
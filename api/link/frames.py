@@ -0,0 +1,39 @@
+from functools import lru_cache
+from ..constants.command_codes import STX, CMT, ETX
+from ..utils.checksum import bcc
+
+
+#   NOTE: outbound frames are laid out as:
+#
+#           [STX, ADDR, LENH, LENL] + [CMT, CM, PM, (DATA), ETX] + [BCC]
+#
+#   so a frame is always 9 bytes longer than its DATA field.
+
+FRAME_OVERHEAD = 9
+DATA_OFFSET = 7
+
+
+def build_frame(addr: int, cm: int, pm: int, data=b'') -> bytearray:
+    '''
+    Builds a complete outbound frame in a single preallocated buffer. `data` may be
+    any bytes-like object or a list of ints; it is copied straight into place.
+    '''
+    length = len(data)
+    frame = bytearray(length + FRAME_OVERHEAD)
+    text_length = length + 3
+    frame[0:DATA_OFFSET] = (STX, addr, text_length >> 8, text_length & 0xFF, CMT, cm, pm)
+    frame[DATA_OFFSET:DATA_OFFSET + length] = data
+    frame[-2] = ETX
+    #   The BCC slot is still zero, so XOR-ing the whole buffer is the same as skipping it
+    frame[-1] = bcc(frame)
+    return frame
+
+
+@lru_cache(maxsize=256)
+def cached_frame(addr: int, cm: int, pm: int, data: tuple = ()) -> bytes:
+    '''
+    Like `build_frame`, for frames that never change: built once per
+    `(addr, cm, pm, data)` and shared, as immutable `bytes`, by every caller.
+    `data` must be hashable (a tuple or bytes).
+    '''
+    return bytes(build_frame(addr, cm, pm, data))
@@ -0,0 +1,115 @@
+from ..constants.command_codes import STX, ETX, ACK, NAK
+from ..utils.checksum import bcc
+
+
+#   NOTE: inbound frames are laid out as:
+#
+#           [ACK] + [STX, ADDR, LENH, LENL] + [TEXT] + [ETX, BCC]
+#
+#   where TEXT is LENH/LENL bytes long. The leading ACK is usually, but not
+#   always, present (see SK_AD3._read).
+
+#   Parser states
+SCAN = 0        # Waiting for ACK, NAK or STX. Anything else is line noise.
+HEADER = 1      # Collecting ADDR, LENH, LENL
+BODY = 2        # Collecting TEXT, ETX and BCC
+COMPLETE = 3    # A full frame with a valid BCC is in `frame`
+BAD_BCC = 4     # A full frame arrived, but its ETX or BCC did not check out (or its header was implausible)
+NAKED = 5       # The device answered with a NAK
+
+HEADER_LENGTH = 4
+
+#   Longer than any TEXT the SK-AD3 sends. A header claiming more is taken for line
+#   noise (a stray STX) rather than waited on.
+MAX_TEXT_LENGTH = 1024
+
+
+class FrameReader:
+    '''
+    An incremental, state machine based parser for inbound SK-AD3 frames.
+    Bytes are pushed in with `feed()` as they come off the wire, in chunks of any size.
+    `wanted()` reports how many bytes the parser can use next, so callers can issue
+    blocking reads of exactly that size instead of polling the port.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.state = SCAN
+        #   A fresh buffer rather than clear(), so a finished frame can be handed off as is
+        self.frame = bytearray()
+        self.acked = False
+        self.remaining = 0
+
+    @property
+    def done(self) -> bool:
+        return self.state >= COMPLETE
+
+    def wanted(self) -> int:
+        '''
+        The number of bytes needed to make progress. Never more than what is left
+        of the current frame, so a read of this size cannot swallow the next one.
+        '''
+        if self.state == HEADER:
+            return HEADER_LENGTH - len(self.frame)
+        if self.state == BODY:
+            return self.remaining
+        return 1
+
+    def feed(self, data) -> int:
+        '''
+        Consumes bytes from `data` until it is exhausted or a frame is finished.
+        Returns the number of bytes consumed.
+        '''
+        view = memoryview(data)
+        consumed = 0
+        while consumed < len(view) and not self.done:
+            if self.state == SCAN:
+                byte = view[consumed]
+                consumed += 1
+                if byte == STX:
+                    self.frame.append(byte)
+                    self.state = HEADER
+                elif byte == ACK:
+                    self.acked = True
+                elif byte == NAK:
+                    self.state = NAKED
+            elif self.state == HEADER:
+                take = min(HEADER_LENGTH - len(self.frame), len(view) - consumed)
+                self.frame += view[consumed:consumed + take]
+                consumed += take
+                if len(self.frame) == HEADER_LENGTH:
+                    #   TEXT plus ETX and BCC
+                    self.remaining = (self.frame[2] << 8) + self.frame[3] + 2
+                    self.state = BODY if self.remaining - 2 <= MAX_TEXT_LENGTH else BAD_BCC
+            elif self.state == BODY:
+                take = min(self.remaining, len(view) - consumed)
+                self.frame += view[consumed:consumed + take]
+                consumed += take
+                self.remaining -= take
+                if not self.remaining:
+                    self.state = COMPLETE if self._check() else BAD_BCC
+        return consumed
+
+    def resync(self) -> None:
+        '''
+        Gives up on the frame in progress (or the bad one just finished) and parses
+        everything after its STX again, in case that STX was line noise and the real one
+        came later. Stray NAKs among those bytes are taken for noise too.
+        Afterwards the reader is in whatever state the bytes lead to.
+        '''
+        pending = bytes(self.frame[1:])
+        self.reset()
+        while pending:
+            consumed = self.feed(pending)
+            pending = pending[consumed:]
+            if self.state in (BAD_BCC, NAKED):
+                pending = bytes(self.frame[1:]) + pending
+                self.reset()
+            elif self.done:
+                return
+
+    def _check(self) -> bool:
+        #   XOR over the whole frame, BCC included, is zero when the BCC matches
+        return self.frame[-2] == ETX and bcc(self.frame) == 0
@@ -0,0 +1,49 @@
+from ..constants.command_codes import \
+    COMMAND_STATUS_SENSE, \
+    COMMAND_AUTO_TEST_CARD_TYPE, \
+    COMMAND_SET_INSERTION
+
+
+#   SK-AD3 commands that leave the unit in the same state however many times they run,
+#   and so may be sent again when their reply is lost
+IDEMPOTENT_COMMANDS = frozenset((COMMAND_STATUS_SENSE, COMMAND_AUTO_TEST_CARD_TYPE, COMMAND_SET_INSERTION))
+
+#   CM/PM of the command that carries an APDU to the card
+APDU_COMMAND = (0x60, 0x34)
+
+#   DESFire instructions that only read, or (Select Application) only set the same state
+#   again. Each starts its own exchange, so sending it again restarts it cleanly; the
+#   continuation of a chained answer (Additional Frame) is not among them.
+IDEMPOTENT_INS = frozenset((
+    0x45,   # Get Key Settings
+    0x5A,   # Select Application
+    0x60,   # Get Version
+    0x64,   # Get Key Version
+    0x6A,   # Get Application IDs
+    0x6C,   # Get Value
+    0x6F,   # Get File IDs
+    0xBB,   # Read Records
+    0xBD,   # Read Data
+    0xF5,   # Get File Settings
+))
+
+#   Cap on the pause before a retransmit, in seconds
+MAX_BACKOFF = 1.0
+
+
+def is_idempotent(frame) -> bool:
+    '''
+    True if the command in outbound `frame` may safely be sent again after its reply was
+    lost or garbled (see `IDEMPOTENT_COMMANDS` and `IDEMPOTENT_INS`).
+    '''
+    if (frame[5], frame[6]) == APDU_COMMAND:
+        return len(frame) > 10 and frame[8] in IDEMPOTENT_INS
+    return frame[5] in IDEMPOTENT_COMMANDS
+
+
+def backoff(attempt: int, base: float) -> float:
+    '''
+    The pause before retransmit number `attempt` (from 1): `base`, doubling each time,
+    at most `MAX_BACKOFF`.
+    '''
+    return min(base * 2 ** (attempt - 1), MAX_BACKOFF)
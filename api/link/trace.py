@@ -0,0 +1,161 @@
+import os
+import struct
+import threading
+from collections import namedtuple
+from time import monotonic, time
+
+
+#   NOTE: a trace file is an 8-byte magic, a version byte and the wall-clock time the
+#   file was started (a little endian double), followed by one record per write or read:
+#
+#           [DIRECTION] + [MICROSECONDS SINCE START (8 bytes)] + [LENGTH (2 bytes)] + [BYTES]
+#
+#   all little endian. Writes are recorded as issued (one per frame) and reads as the
+#   chunks that came off the port, stray ACKs and line noise included.
+
+TRACE_MAGIC = b'SKAD3TRC'
+TRACE_VERSION = 1
+
+TX = 0
+RX = 1
+
+HEADER = struct.Struct('<8sBd')
+RECORD = struct.Struct('<BQH')
+
+TraceRecord = namedtuple('TraceRecord', ('direction', 'time', 'data'))
+
+
+class TraceRecorder:
+    '''
+    Appends timestamped TX/RX records to a binary trace file. Set it as a dispenser's
+    (or a `Bus`'s) `trace` to record everything written to and read from the port::
+
+        dispenser.trace = TraceRecorder('unit7.trace')
+
+    Once the file reaches `max_bytes` it is rotated to `unit7.trace.1` (and so on, up to
+    `backups` old files, the oldest being deleted), so the whole trace never takes more
+    than `max_bytes * (backups + 1)` bytes. Each file can be read or replayed on its own.
+    An existing file is rotated out when the recorder starts.
+
+    Records are buffered; set `flush` to write each one through at once, so that a trace
+    survives the process dying abruptly.
+    '''
+
+    def __init__(self, path: str, max_bytes: int = 16 * 1024 * 1024, backups: int = 3,
+                 flush: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.autoflush = flush
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._started = None
+        if os.path.exists(path) and os.path.getsize(path):
+            self._rotate()
+        self._open()
+
+    def record(self, direction: int, data) -> None:
+        '''
+        Appends `data` (bytes written, for `TX`, or read, for `RX`) stamped with the current time.
+        '''
+        with self._lock:
+            if self._file is None:
+                return
+            length = len(data)
+            if self._size + RECORD.size + length > self.max_bytes and self._size > HEADER.size:
+                self._file.close()
+                self._rotate()
+                self._open()
+            self._file.write(RECORD.pack(direction, int((monotonic() - self._started) * 1e6), length))
+            self._file.write(data)
+            self._size += RECORD.size + length
+            if self.autoflush:
+                self._file.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> 'TraceRecorder':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _open(self) -> None:
+        self._file = open(self.path, 'wb')
+        self._started = monotonic()
+        self._file.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, time()))
+        self._size = HEADER.size
+
+    def _rotate(self) -> None:
+        for index in range(self.backups - 1, 0, -1):
+            older = f'{self.path}.{index}'
+            if os.path.exists(older):
+                os.replace(older, f'{self.path}.{index + 1}')
+        if self.backups:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+
+
+def trace_files(path: str) -> list:
+    '''
+    The files of a rotated trace, oldest first.
+    '''
+    files, index = [], 1
+    while os.path.exists(f'{path}.{index}'):
+        files.append(f'{path}.{index}')
+        index += 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_trace(path: str):
+    '''
+    Yields a `TraceRecord(direction, time, data)` for each record in a trace file, `time`
+    being seconds since the file was started. The wall-clock start time is available as
+    `trace_start(path)`.
+    '''
+    with open(path, 'rb') as stream:
+        _read_header(stream)
+        while True:
+            header = stream.read(RECORD.size)
+            if len(header) < RECORD.size:
+                #   The end of the file, or a record cut short by the process dying
+                return
+            direction, microseconds, length = RECORD.unpack(header)
+            data = stream.read(length)
+            if len(data) < length:
+                return
+            yield TraceRecord(direction, microseconds / 1e6, data)
+
+
+def trace_start(path: str) -> float:
+    '''
+    The wall-clock time (as from `time.time()`) a trace file was started.
+    '''
+    with open(path, 'rb') as stream:
+        return _read_header(stream)
+
+
+def _read_header(stream) -> float:
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise Exception('Not a trace file')
+    magic, version, started = HEADER.unpack(header)
+    if magic != TRACE_MAGIC:
+        raise Exception('Not a trace file')
+    if version != TRACE_VERSION:
+        raise Exception(f'Unsupported trace version {version}')
+    return started
@@ -1,9 +1,12 @@
-from ..desfire.apdu_utils.response_codes import apdu_response_codes
 from ..constants.command_codes import *
 from ..constants.status_codes import _get_status
 from ..constants.error_codes import _get_error
 
 
+#   Status words (SW1 << 8 | SW2) that count as success for APDU_Response.is_successful
+APDU_SUCCESS_CODES = frozenset((0x9100, 0x9000, 0x91AF))
+
+
 class Response:
     '''
     The object returned from top-level API calls to the dispenser.
@@ -12,20 +15,57 @@ class Response:
     and obtaining error codes (see constants/error_codes.py). This class
     and its derived APDU_Response simplify the process of reading inbound Command Packages,
     they provide no actual error handling.
+
+    `frame` holds the inbound Command Package exactly as it came off the wire (a `bytearray`).
+    `raw_response` is the same frame as a list of ints, built on first access. `data`,
+    `status()` and `error()` are likewise only built when first asked for, then cached.
     '''
 
-    def __init__(self, raw_response: list):
+    __slots__ = ('frame', '_raw_response', '_data', '_status', '_error')
+
+    def __init__(self, raw_response) -> None:
         self.raw_response = raw_response
-        self.data = {}
+        self._data = None
+        self._status = None
+        self._error = None
+
+    @property
+    def raw_response(self) -> list:
+        if self._raw_response is None:
+            self._raw_response = list(self.frame)
+        return self._raw_response
+
+    @raw_response.setter
+    def raw_response(self, raw_response) -> None:
+        if isinstance(raw_response, (bytes, bytearray, memoryview)):
+            self.frame = raw_response
+            self._raw_response = None
+        else:
+            self.frame = bytes(raw_response)
+            self._raw_response = raw_response
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = {}
+        return self._data
+
+    @data.setter
+    def data(self, data: dict) -> None:
+        self._data = data
 
     def status(self):
-        return _get_status(self.raw_response)
+        if self._status is None:
+            self._status = _get_status(self.frame)
+        return self._status
 
     def error(self):
-        return _get_error(self.raw_response)
+        if self._error is None:
+            self._error = _get_error(self.frame)
+        return self._error
 
     def is_successful(self):
-        if self.raw_response[4] == PMT:
+        if self.frame[4] == PMT:
             return True
         return False
 
@@ -38,13 +78,31 @@ class APDU_Response(Response):
     RFID cards.
     '''
 
-    def __init__(self, raw_response: list, *args, **kwargs) -> None:
-        super().__init__(self, *args, **kwargs)
-        self.raw_response = raw_response
-        self.code = self.raw_response[-4:-2]
-        # self.data = None
+    __slots__ = ('_code',)
+
+    def __init__(self, raw_response, *args, **kwargs) -> None:
+        super().__init__(raw_response, *args, **kwargs)
+        self._code = None
+
+    @property
+    def code(self) -> list:
+        '''
+        The status word, `[SW1, SW2]`.
+        '''
+        if self._code is None:
+            self._code = list(self.frame[-4:-2])
+        return self._code
+
+    @property
+    def payload(self) -> memoryview:
+        '''
+        The card's response data, without the status word, as a view into `frame`.
+        '''
+        return memoryview(self.frame)[10:-4]
 
     def apdu_response_code(self) -> str:
+        #   Imported here so that loading responses does not pull in apdu_utils
+        from ..desfire.apdu_utils.response_codes import apdu_response_codes
         key = tuple(self.code)
         try:
             return apdu_response_codes[key]
@@ -54,8 +112,6 @@ class APDU_Response(Response):
     #   Overrides Response.is_successful. In addition to checking for PMT
     #   this method also checks the APDU response code to determine success.
     def is_successful(self) -> bool:
-        if self.raw_response[4] == PMT:
-            key = tuple(self.code)
-            if key not in [(0x91, 0x00), (0x90, 0x00), (0x91, 0xAF)]:
-                return False
-            return True
+        frame = self.frame
+        if frame[4] == PMT:
+            return len(frame) >= 14 and (frame[-4] << 8 | frame[-3]) in APDU_SUCCESS_CODES
@@ -1,12 +1,13 @@
 from ..constants.command_codes import *
-from ..constants.status_codes import _get_status
-from ..utils.utils import bcc
+from ..link.frames import cached_frame
 from ..response.response import Response
 
 
 #   NOTE: commands in this file are constructed according to the convention:
 #
 #           [STX, ADDR, LENH, LENL] + [CMT, CM, PM, (DATA), ETX] + [BCC]
+#
+#   Their frames never change for a given address, so they come from cached_frame().
 
 
 def init(self, position: str = 'capture') -> Response:
@@ -34,12 +35,12 @@ def init(self, position: str = 'capture') -> Response:
 
     parameter = positions[position]
 
-    buffer = [STX, self.addr, 0x00, 0x03]
-    buffer += [CMT, COMMAND_INIT, parameter, ETX]
-    buffer += [bcc(buffer)]
+    buffer = cached_frame(self.addr, COMMAND_INIT, parameter)
 
     with self.serial_context:
-        raw_response = self.send_command(buffer)
+        #   Initialising may move the card, so whatever was known about it is stale
+        self.card_session.reset()
+        raw_response = self.send_command(buffer, binary=True)
         response = Response(raw_response)
         response.data['position'] = position
         return response
@@ -67,12 +68,12 @@ def move_card(self, position: str) -> Response:
 
     parameter = positions[position]
 
-    buffer = [STX, self.addr, 0x00, 0x03]
-    buffer += [CMT, COMMAND_MOVE_CARD, parameter, ETX]
-    buffer += [bcc(buffer)]
+    buffer = cached_frame(self.addr, COMMAND_MOVE_CARD, parameter)
 
     with self.serial_context:
-        raw_response = self.send_command(buffer)
+        #   Once moved, the card is no longer activated, let alone authenticated
+        self.card_session.reset()
+        raw_response = self.send_command(buffer, binary=True)
         response = Response(raw_response)
         response.data['position'] = position
         return response
@@ -87,14 +88,12 @@ def get_status(self) -> Response:
 
     {'status': dict}
     '''
-    buffer = [STX, self.addr, 0x00, 0x03]
-    buffer += [CMT, COMMAND_STATUS_SENSE, PARAM_PROVIDE_STATUS_INFO, ETX]
-    buffer += [bcc(buffer)]
+    buffer = cached_frame(self.addr, COMMAND_STATUS_SENSE, PARAM_PROVIDE_STATUS_INFO)
 
     with self.serial_context:
-        raw_response = self.send_command(buffer)
+        raw_response = self.send_command(buffer, binary=True)
         response = Response(raw_response)
-        response.data['status'] = _get_status(raw_response)
+        response.data['status'] = response.status()
         return response
 
 
@@ -115,12 +114,10 @@ def set_insertion(self, setting: bool) -> Response:
 
     assert (parameter is not None)
 
-    buffer = [STX, self.addr, 0x00, 0x03]
-    buffer += [CMT, COMMAND_SET_INSERTION, parameter, ETX]
-    buffer += [bcc(buffer)]
+    buffer = cached_frame(self.addr, COMMAND_SET_INSERTION, parameter)
 
     with self.serial_context:
-        raw_response = self.send_command(buffer)
+        raw_response = self.send_command(buffer, binary=True)
         response = Response(raw_response)
         response.data['allow_insertion'] = setting
         return response
@@ -1,5 +1,5 @@
 from ..constants.command_codes import *
-from ..utils.utils import bcc
+from ..link.frames import cached_frame
 from ..response.response import Response
 
 
@@ -20,15 +20,13 @@ def auto_test_RF_card_type(self) -> Response:
         ('3', '0'): "Type B CPU card",
     }
 
-    buffer = [STX, self.addr, 0x00, 0x03]
-    buffer += [CMT, COMMAND_AUTO_TEST_CARD_TYPE, PARAM_TEST_RF_CARD, ETX]
-    buffer += [bcc(buffer)]
+    buffer = cached_frame(self.addr, COMMAND_AUTO_TEST_CARD_TYPE, PARAM_TEST_RF_CARD)
 
     with self.serial_context:
-        response = self.send_command(buffer)
+        response = self.send_command(buffer, binary=True)
         response = Response(response)
 
-        key = tuple([chr(i) for i in response.raw_response[-4:-2]])
+        key = tuple([chr(i) for i in response.frame[-4:-2]])
         response.data['card_type'] = card_types[key]
 
         return response
@@ -49,24 +47,20 @@ def activate_RF_card(self, card_type: str = 'type_a') -> Response:
 
     {'card_active': True}
     '''
-    buffer = [STX, self.addr, 0x00, 0x05]
-    buffer += [CMT, COMMAND_RF_CARD_OPERATION, PARAM_ACTIVATE_RF_CARD]
-
-    sets = []
+    sets = ()
     if card_type == 'type_a':
-        sets = [0x41, 0x30]
+        sets = (0x41, 0x30)
     elif card_type == 'type_b':
-        sets = [0x30, 0x41]
+        sets = (0x30, 0x41)
     else:
         raise Exception(f"Unexpected value for card_type: {card_type}.\
                         Must be either 'type_a' or 'type_b'")
 
-    buffer += sets
-    buffer += [ETX]
-    buffer += [bcc(buffer)]
+    buffer = cached_frame(self.addr, COMMAND_RF_CARD_OPERATION, PARAM_ACTIVATE_RF_CARD, sets)
 
     with self.serial_context:
-        response = self.send_command(buffer)
+        self.card_session.reset()
+        response = self.send_command(buffer, binary=True)
         response = Response(response)
 
         if not response.is_successful():
@@ -85,12 +79,11 @@ def deactivate_RF_card(self) -> Response:
 
     {'card_active': False}
     '''
-    buffer = [STX, self.addr, 0x00, 0x03]
-    buffer += [CMT, COMMAND_RF_CARD_OPERATION, PARAM_DEACTIVATE_RF_CARD, ETX]
-    buffer += [bcc(buffer)]
+    buffer = cached_frame(self.addr, COMMAND_RF_CARD_OPERATION, PARAM_DEACTIVATE_RF_CARD)
 
     with self.serial_context:
-        response = self.send_command(buffer)
+        self.card_session.reset()
+        response = self.send_command(buffer, binary=True)
         response = Response(response)
 
         if not response.is_successful():
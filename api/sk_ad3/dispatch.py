@@ -1,7 +1,7 @@
-def send_command(self, command_package: list) -> list:
+def send_command(self, command_package, binary: bool = False):
     '''
-    Sends a command package
+    Sends a command package and returns the raw response frame as a list of ints, or with
+    `binary`, as the `bytearray` it was read into (as the commands use it).
     '''
-    self._write(command_package)
-    raw_response = self._read()
-    return raw_response
+    raw_response = self._exchange(command_package)
+    return raw_response if binary else list(raw_response)
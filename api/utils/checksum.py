@@ -0,0 +1,88 @@
+import zlib
+
+
+#   DESFire CRC32 is the IEEE 802.3 CRC (as computed by zlib) without the final inversion
+CRC32_INIT = 0xFFFFFFFF
+
+#   ISO/IEC 14443-3 type A CRC (CRC_A), used by legacy DES/3DES native commands
+CRC16_POLY = 0x8408
+CRC16_INIT = 0x6363
+
+
+def _crc16_table() -> tuple:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ CRC16_POLY if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _crc16_table()
+
+#   From this many bytes on, bcc() folds the buffer as one integer instead of looping
+BCC_FOLD_LENGTH = 96
+
+
+def _buffer(data):
+    #   Anything supporting the buffer protocol is used as is; lists of ints are converted
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return data
+    return bytes(data)
+
+
+def bcc(data) -> int:
+    '''
+    XOR of every byte in `data` (bytes-like or a list of ints).
+    '''
+    length = len(data)
+    if length < BCC_FOLD_LENGTH:
+        #   Frames are short, and for them a plain loop is fastest
+        result = 0
+        for byte in data:
+            result ^= byte
+        return result
+    #   XOR the upper half of the bytes onto the lower half until one byte is left
+    value = int.from_bytes(data, 'little')
+    while length > 1:
+        length -= length >> 1
+        value = (value & ((1 << 8 * length) - 1)) ^ (value >> 8 * length)
+    return value
+
+
+def bcc_check(data, against: int) -> bool:
+    return bcc(data) == against
+
+
+def crc32(data) -> int:
+    '''
+    DESFire CRC32 of `data` (bytes-like or a list of ints).
+    '''
+    return zlib.crc32(_buffer(data)) ^ CRC32_INIT
+
+
+def crc32_bytes(data) -> bytes:
+    '''
+    `crc32(data)` as the four little-endian bytes appended to DESFire commands.
+    '''
+    return crc32(data).to_bytes(4, 'little')
+
+
+def crc16(data) -> int:
+    '''
+    CRC_A of `data` (bytes-like or a list of ints).
+    '''
+    crc = CRC16_INIT
+    table = CRC16_TABLE
+    for byte in _buffer(data):
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def crc16_bytes(data) -> bytes:
+    '''
+    `crc16(data)` as the two little-endian bytes appended to legacy DES commands.
+    '''
+    return crc16(data).to_bytes(2, 'little')
+
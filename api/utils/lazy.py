@@ -0,0 +1,32 @@
+from importlib import import_module
+
+
+class LazyMethod:
+    '''
+    A method that is imported from `module` the first time it is looked up, then
+    replaces itself on the class with the real function, so later lookups cost
+    nothing extra::
+
+        class SK_AD3:
+            read_data = LazyMethod('SK_AD3_Card_Dispenser.api.desfire.data_commands')
+
+    The function must have the same name as the attribute.
+    '''
+
+    def __init__(self, module: str):
+        self.module = module
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.owner = owner
+        self.name = name
+
+    def load(self):
+        function = getattr(import_module(self.module), self.name)
+        setattr(self.owner, self.name, function)
+        return function
+
+    def __get__(self, instance, owner=None):
+        function = self.load()
+        if instance is None:
+            return function
+        return function.__get__(instance, owner)
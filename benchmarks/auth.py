@@ -0,0 +1,111 @@
+'''
+Authentication microbenchmark.
+
+Measures the host-side CPU cost of the DESFire three-pass authentication (`Auth`)
+and of enciphering a Change Key command, with the card's side of the exchange
+computed outside the timed sections, and of a whole `aes_authenticate` against the
+simulator::
+
+    python -m SK_AD3_Card_Dispenser.benchmarks.auth --iterations 5000
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from Crypto.Cipher import AES, DES
+from .. import SK_AD3
+from ..api.desfire.auth import Auth
+from ..api.desfire.security_commands import _change_key
+from ..simulator.transport import SimulatedTransport
+from ..simulator.dispenser import SimulatedDispenser
+from ..simulator.desfire import VirtualDesfireCard
+
+
+KEYS = {'AES': bytes(16), 'DES': bytes(8)}
+ENGINES = {'AES': AES, 'DES': DES}
+
+
+def time_auth(auth_type: str, iterations: int) -> dict:
+    '''
+    Host-side time per authentication, in microseconds. The card's challenge and
+    answer are computed with fresh cipher objects, outside the timed sections.
+    '''
+    key, engine = KEYS[auth_type], ENGINES[auth_type]
+    block = engine.block_size
+    wall = cpu = 0.0
+    for _ in range(iterations):
+        random_b = os.urandom(block)
+        challenge = engine.new(key, engine.MODE_CBC, iv=bytes(block)).encrypt(random_b)
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        authenticator = Auth(key, auth_type)
+        submission = bytes(authenticator._first_pass(challenge))
+        wall += time.perf_counter() - wall_start
+        cpu += time.process_time() - cpu_start
+
+        random_a = engine.new(key, engine.MODE_CBC, iv=challenge).decrypt(submission)[:block]
+        answer = engine.new(key, engine.MODE_CBC, iv=submission[-block:]).encrypt(
+            random_a[1:] + random_a[:1])
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        authenticator._second_pass(answer)
+        wall += time.perf_counter() - wall_start
+        cpu += time.process_time() - cpu_start
+
+        if not authenticator.authenticated:
+            raise Exception(f'{auth_type} authentication failed')
+    return {'wall_us': wall / iterations * 1e6, 'cpu_us': cpu / iterations * 1e6}
+
+
+def time_change_key(iterations: int) -> dict:
+    '''
+    Time to build an enciphered AES Change Key APDU, in microseconds.
+    '''
+    session_key = list(os.urandom(16))
+    new_key = [0x01] * 16
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(iterations):
+        _change_key(new_key, session_key, [0x00], [0x00])
+    return {'wall_us': (time.perf_counter() - wall_start) / iterations * 1e6,
+            'cpu_us': (time.process_time() - cpu_start) / iterations * 1e6}
+
+
+def time_command(iterations: int) -> dict:
+    '''
+    Time per `aes_authenticate` against the simulator with no link latency, in microseconds.
+    The simulated card's own cryptography is included.
+    '''
+    unit = SimulatedDispenser(card_factory=lambda: VirtualDesfireCard(master_key=KEYS['AES']))
+    dispenser = SK_AD3(transport=SimulatedTransport(unit, byte_latency=0, command_latency=0))
+    with dispenser.session():
+        for step in (dispenser.init, lambda: dispenser.move_card('RF'), dispenser.activate_RF_card):
+            if not step().is_successful():
+                raise Exception('Simulator failed to present a card')
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        for _ in range(iterations):
+            if not dispenser.aes_authenticate(list(KEYS['AES'])).is_successful():
+                raise Exception('aes_authenticate failed')
+        return {'wall_us': (time.perf_counter() - wall_start) / iterations * 1e6,
+                'cpu_us': (time.process_time() - cpu_start) / iterations * 1e6}
+
+
+def main(argv: list = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    results = {
+        'iterations': args.iterations,
+        'auth_aes': time_auth('AES', args.iterations),
+        'auth_des': time_auth('DES', args.iterations),
+        'change_key_aes': time_change_key(args.iterations),
+        'aes_authenticate': time_command(max(1, args.iterations // 10)),
+    }
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    return results
+
+
+if __name__ == '__main__':
+    main()
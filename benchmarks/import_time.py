@@ -0,0 +1,69 @@
+'''
+Cold-start import time budget.
+
+Imports `SK_AD3` in fresh interpreters and reports the best time of several runs,
+along with any heavy modules that were loaded although a mechanism-only process
+never needs them. Exits with status 1 if the import is over budget or pulled in
+one of them, so it can guard a CI job or a kiosk image build::
+
+    python -m SK_AD3_Card_Dispenser.benchmarks.import_time --budget-ms 60
+
+`--module` imports one of the front ends (`aio`, `worker`, ...) instead.
+'''
+import argparse
+import json
+import subprocess
+import sys
+
+
+#   Modules that should only load with the first DESFire command
+DEFERRED = ('Crypto', 'numpy', 'apdu_utils', 'file_objects', 'security_commands', 'data_commands')
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'modules': list(sys.modules)}}))
+'''
+
+
+def probe(module: str) -> dict:
+    output = subprocess.run([sys.executable, '-c', PROBE.format(module=module)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main(argv: list = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='fail if the best import time exceeds this')
+    parser.add_argument('--module', default=None,
+                        help='import this submodule of the package (e.g. aio) rather than the package')
+    args = parser.parse_args(argv)
+
+    package = __package__.rpartition('.')[0]
+    module = package if args.module is None else f'{package}.{args.module}'
+    runs = [probe(module) for _ in range(args.runs)]
+    loaded = [name for name in runs[0]['modules']
+              if any(part in DEFERRED for part in name.split('.'))]
+
+    results = {
+        'module': module,
+        'best_ms': min(run['ms'] for run in runs),
+        'runs_ms': [run['ms'] for run in runs],
+        'budget_ms': args.budget_ms,
+        'deferred_modules_loaded': loaded,
+    }
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+    over = args.budget_ms is not None and results['best_ms'] > args.budget_ms
+    if over or loaded:
+        sys.exit(1)
+    return results
+
+
+if __name__ == '__main__':
+    main()
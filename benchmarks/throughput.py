@@ -0,0 +1,230 @@
+'''
+End-to-end throughput benchmark.
+
+Drives the card personalisation workflow through `SK_AD3` against the simulator
+(or a real unit with `--port`, or a recorded trace with `--replay`) and reports
+cards/hour, per-command latency percentiles and host CPU time per card. Results are
+written as JSON so that runs can be compared with `--compare`::
+
+    python -m SK_AD3_Card_Dispenser.benchmarks.throughput --cards 100 --output after.json --compare before.json
+
+`--trace` records a run's traffic, so that a run on a real unit can be replayed
+later (with the same `--cards`) without one::
+
+    python -m SK_AD3_Card_Dispenser.benchmarks.throughput --port COM7 --cards 20 --trace unit7.trace
+    python -m SK_AD3_Card_Dispenser.benchmarks.throughput --replay unit7.trace --cards 20 --realtime
+'''
+import argparse
+import json
+import platform
+import sys
+import time
+from .. import SK_AD3
+from ..simulator.transport import SimulatedTransport
+from ..simulator.dispenser import SimulatedDispenser
+from ..simulator.desfire import VirtualDesfireCard
+from ..simulator.replay import ReplayTransport
+from ..api.link.trace import TraceRecorder
+from ..api.constants.command_codes import COMMAND_INIT, COMMAND_MOVE_CARD
+from ..file_objects.application import PermissiveDesfireApplication
+from ..file_objects.file import PermissiveStandardDataFile
+
+
+MASTER_KEY = [0x00] * 16
+AID = [0xAB, 0xCD, 0xEF]
+FILENO = [0x00]
+PAYLOAD = list(range(16))
+
+#   The commands timed individually, in workflow order
+COMMANDS = (
+    'init',
+    'move_card',
+    'activate_RF_card',
+    'get_card_uid',
+    'aes_authenticate',
+    'create_application',
+    'select_application',
+    'create_standard_data_file',
+    'write_data',
+    'read_data',
+)
+
+
+def percentile(samples: list, p: float) -> float:
+    '''
+    Nearest-rank percentile of `samples`, which must already be sorted.
+    '''
+    if not samples:
+        return None
+    rank = max(1, -(-len(samples) * p // 100))
+    return samples[int(rank) - 1]
+
+
+class Recorder:
+    '''
+    Times every call to the methods in `COMMANDS` on one dispenser instance by
+    shadowing them with timed wrappers.
+    '''
+
+    def __init__(self, dispenser: SK_AD3):
+        self.samples = {name: [] for name in COMMANDS}
+        for name in COMMANDS:
+            setattr(dispenser, name, self._timed(name, getattr(dispenser, name)))
+
+    def _timed(self, name: str, method):
+        samples = self.samples[name]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+        return timed
+
+    def summary(self) -> dict:
+        summary = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            summary[name] = {
+                'calls': len(ordered),
+                'p50_ms': percentile(ordered, 50) * 1000,
+                'p95_ms': percentile(ordered, 95) * 1000,
+                'p99_ms': percentile(ordered, 99) * 1000,
+            }
+        return summary
+
+
+def personalise(dispenser: SK_AD3) -> None:
+    '''
+    One card through the whole workflow. Raises on the first failed step.
+    '''
+    steps = (
+        lambda: dispenser.move_card('RF'),
+        lambda: dispenser.activate_RF_card(),
+        lambda: dispenser.get_card_uid(),
+        lambda: dispenser.aes_authenticate(MASTER_KEY),
+        lambda: dispenser.create_application(PermissiveDesfireApplication(AID)),
+        lambda: dispenser.select_application(AID),
+        lambda: dispenser.create_standard_data_file(PermissiveStandardDataFile(FILENO)),
+        lambda: dispenser.write_data(FILENO, PAYLOAD),
+        lambda: dispenser.read_data(FILENO),
+        lambda: dispenser.move_card('capture'),
+    )
+    for step in steps:
+        response = step()
+        if not response.is_successful():
+            raise Exception(f'Workflow step failed: {response.raw_response}')
+
+
+def simulated_dispenser(args) -> SK_AD3:
+    unit = SimulatedDispenser(
+        baudrate=args.baudrate,
+        stacker=args.cards,
+        capture_box_capacity=args.cards,
+        card_factory=lambda: VirtualDesfireCard(master_key=bytes(MASTER_KEY)),
+        latency={COMMAND_MOVE_CARD: args.move_latency, COMMAND_INIT: args.move_latency})
+    transport = SimulatedTransport(unit, byte_latency=args.byte_latency,
+                                   command_latency=args.command_latency)
+    return SK_AD3(transport=transport, baudrate=args.baudrate)
+
+
+def run(dispenser: SK_AD3, cards: int) -> dict:
+    recorder = Recorder(dispenser)
+    card_wall, card_cpu = [], []
+
+    with dispenser.session():
+        if not dispenser.init().is_successful():
+            raise Exception('Dispenser failed to initialise')
+
+        started = time.perf_counter()
+        for _ in range(cards):
+            wall, cpu = time.perf_counter(), time.process_time()
+            personalise(dispenser)
+            card_wall.append(time.perf_counter() - wall)
+            card_cpu.append(time.process_time() - cpu)
+        elapsed = time.perf_counter() - started
+
+    return {
+        'cards': cards,
+        'elapsed_s': elapsed,
+        'cards_per_hour': cards * 3600 / elapsed,
+        'card_ms': {'mean': sum(card_wall) / cards * 1000,
+                    'p50': percentile(sorted(card_wall), 50) * 1000,
+                    'p99': percentile(sorted(card_wall), 99) * 1000},
+        'cpu_ms_per_card': sum(card_cpu) / cards * 1000,
+        'commands': recorder.summary(),
+    }
+
+
+def compare(current: dict, baseline: dict) -> None:
+    def line(label, before, after):
+        change = (after - before) / before * 100 if before else float('nan')
+        print(f'{label:<40} {before:>12.3f} {after:>12.3f} {change:>+8.1f}%')
+
+    print(f'{"":<40} {"baseline":>12} {"current":>12} {"change":>9}')
+    line('cards/hour', baseline['cards_per_hour'], current['cards_per_hour'])
+    line('cpu ms/card', baseline['cpu_ms_per_card'], current['cpu_ms_per_card'])
+    for name, stats in current['commands'].items():
+        if name in baseline['commands']:
+            for key in ('p50_ms', 'p99_ms'):
+                line(f'{name} {key}', baseline['commands'][name][key], stats[key])
+
+
+def main(argv: list = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cards', type=int, default=50)
+    parser.add_argument('--port', help='benchmark a real unit on this port instead of the simulator')
+    parser.add_argument('--replay', metavar='TRACE',
+                        help='benchmark against a trace recorded with --trace instead of the simulator')
+    parser.add_argument('--realtime', action='store_true',
+                        help='with --replay, answer with the recorded delays rather than at once')
+    parser.add_argument('--trace', help='record the run\'s traffic to this trace file')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--byte-latency', type=float, default=None,
+                        help='simulated seconds per byte (default: real wire time at --baudrate)')
+    parser.add_argument('--command-latency', type=float, default=0.002,
+                        help='simulated turnaround per command, in seconds')
+    parser.add_argument('--move-latency', type=float, default=0.0,
+                        help='simulated mechanical time for move_card and init, in seconds')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='print a comparison against a previous JSON result')
+    args = parser.parse_args(argv)
+
+    if args.port:
+        dispenser = SK_AD3(args.port, baudrate=args.baudrate)
+    elif args.replay:
+        #   Authentication uses fresh random numbers, so its frames never match the trace
+        transport = ReplayTransport(args.replay, realtime=args.realtime, strict=False)
+        dispenser = SK_AD3(transport=transport, baudrate=args.baudrate)
+    else:
+        dispenser = simulated_dispenser(args)
+    if args.trace:
+        dispenser.trace = TraceRecorder(args.trace)
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in ('output', 'compare')},
+        **run(dispenser, args.cards),
+    }
+    if dispenser.trace is not None:
+        dispenser.trace.close()
+
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return results
+
+
+if __name__ == '__main__':
+    main()
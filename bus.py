@@ -0,0 +1,303 @@
+import queue
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
+from . import SK_AD3, READ_SLICE
+from .serial_context import SerialContext
+from .api.constants.command_codes import ACK, NAK, COMMAND_INIT, COMMAND_MOVE_CARD
+from .api.link.framing import FrameReader, SCAN, COMPLETE, BAD_BCC, NAKED
+from .api.link.errors import LinkCancelled, LinkTimeout, FrameError, FrameRejected
+from .api.link.trace import RX
+
+
+#   Commands that keep the mechanism busy long after the frame has been accepted.
+#   Once the device ACKs one of these, the line is handed to other addresses while
+#   the reply is pending.
+RELEASE_AFTER_ACK = (COMMAND_INIT, COMMAND_MOVE_CARD)
+
+
+class Bus:
+    '''
+    Owns a single serial port shared by several dispensers on a multi-drop (RS-485) line,
+    and hands out a `BusDevice` (a regular `SK_AD3`) per address::
+
+        with Bus('COM7') as bus:
+            left, right = bus.device(0x00), bus.device(0x01)
+            left.move_card('RF')
+            right.get_status()
+
+    Frames are serialized onto the line, taking turns round-robin across the addresses
+    that have something to send, so a busy unit cannot starve the others. A single
+    listener thread reads everything off the line and routes replies by their ADDR
+    byte. While a unit executes a mechanical command (`RELEASE_AFTER_ACK`) the line is
+    released as soon as the command is ACKed, so other units can be polled meanwhile.
+
+    `transport` replaces the serial port, as with `SK_AD3`.
+    '''
+
+    def __init__(self, port: str = None, baudrate: int = 9600, transport: SerialContext = None,
+                 ack_timeout: float = 0.2, read_timeout: float = 10.0, write_timeout: float = 2.0):
+        if transport is None:
+            transport = SerialContext(port=port, baudrate=baudrate, timeout=READ_SLICE,
+                                      write_timeout=write_timeout)
+            transport.close()
+        else:
+            transport.baudrate = baudrate
+            transport.timeout = READ_SLICE
+            transport.write_timeout = write_timeout
+        self.port = port
+        self.serial_context = transport
+        self.ack_timeout = ack_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        #   A `TraceRecorder` for the whole line while tracing is enabled
+        self.trace = None
+
+        self.devices = {}
+        #   Per address: reply frames, plus ACK, NAK and BAD_BCC for handshakes and
+        #   corrupted frames (see BusDevice._receive())
+        self.mailboxes = {}
+        self._listener = None
+        self._listening = False
+
+        #   Round-robin turn taking, see turn()
+        self._turns = threading.Condition()
+        self._waiting = {}
+        self._order = deque()
+        self._holder = None
+        #   The address the current holder writes to
+        self._holder_addr = None
+
+    def __enter__(self) -> 'Bus':
+        self.open()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def open(self) -> None:
+        '''
+        Opens the port and starts the listener. The port stays open until `close()`.
+        '''
+        self.serial_context.persistent = True
+        if not self.serial_context.is_open:
+            self.serial_context.open()
+        if self._listener is None:
+            self._listening = True
+            self._listener = threading.Thread(target=self._listen, name='SK_AD3 bus', daemon=True)
+            self._listener.start()
+
+    def close(self) -> None:
+        self._listening = False
+        if self._listener is not None:
+            self._listener.join()
+            self._listener = None
+        self.serial_context.persistent = False
+        if self.serial_context.depth == 0:
+            self.serial_context.close()
+
+    def device(self, addr: int) -> 'BusDevice':
+        '''
+        Returns the handle for the unit at `addr`, creating it on first use.
+        '''
+        if addr not in self.devices:
+            self.mailboxes[addr] = queue.Queue()
+            self.devices[addr] = BusDevice(self, addr)
+        return self.devices[addr]
+
+    @contextmanager
+    def turn(self, addr: int):
+        '''
+        Holds the line for `addr`. Waiting addresses are served round-robin, and requests
+        from the same address in arrival order.
+        '''
+        ticket = object()
+        with self._turns:
+            if addr not in self._waiting:
+                self._waiting[addr] = deque()
+                self._order.append(addr)
+            self._waiting[addr].append(ticket)
+            if self._holder is None:
+                self._grant()
+            while self._holder is not ticket:
+                self._turns.wait()
+        try:
+            yield
+        finally:
+            with self._turns:
+                self._holder = None
+                self._grant()
+
+    def _grant(self) -> None:
+        #   Give the line to the oldest request of the next address in rotation
+        for _ in range(len(self._order)):
+            addr = self._order[0]
+            self._order.rotate(-1)
+            if self._waiting[addr]:
+                self._holder = self._waiting[addr].popleft()
+                self._holder_addr = addr
+                self._turns.notify_all()
+                return
+        self._holder_addr = None
+
+    def _listen(self) -> None:
+        reader = FrameReader()
+        arrived = None
+        while self._listening:
+            chunk = self.serial_context.read(reader.wanted())
+            if not chunk:
+                continue
+            if reader.state == SCAN:
+                #   When whatever comes next (an ACK, or a frame's STX) started arriving
+                arrived = monotonic()
+            if self.trace is not None:
+                self.trace.record(RX, chunk)
+            reader.feed(chunk)
+            #   ACK and NAK carry no address; they answer whoever holds the line
+            if reader.acked:
+                self._first_byte(self._holder_addr, arrived)
+                self._post(self._holder_addr, ACK)
+                reader.acked = False
+            if reader.state == NAKED:
+                self._post(self._holder_addr, NAK)
+                reader.reset()
+                continue
+            if reader.state == BAD_BCC:
+                #   Blamed on the unit the frame claims to be from, or failing that the holder
+                addr = reader.frame[1]
+                self._post(addr if addr in self.mailboxes else self._holder_addr, BAD_BCC)
+                #   The STX may have been noise; look for the real one among the bytes held
+                reader.resync()
+            if reader.done:
+                if reader.state == COMPLETE and reader.frame[1] in self.mailboxes:
+                    self._first_byte(reader.frame[1], arrived)
+                    self.mailboxes[reader.frame[1]].put(reader.frame)
+                reader.reset()
+
+    def _first_byte(self, addr: int, at: float) -> None:
+        #   The listener reads for every device, so it times their answers (see SK_AD3._read)
+        device = self.devices.get(addr)
+        if device is not None and device._first_byte_at is None:
+            device._first_byte_at = at
+
+    def _post(self, addr: int, entry) -> None:
+        mailbox = self.mailboxes.get(addr)
+        if mailbox is not None:
+            mailbox.put(entry)
+
+
+class BusDevice(SK_AD3):
+    '''
+    An `SK_AD3` bound to one address on a `Bus`. Obtain it with `Bus.device()`; the bus
+    owns the port, so `connect()` and `disconnect()` do nothing here.
+    '''
+
+    def __init__(self, bus: Bus, addr: int):
+        self.bus = bus
+        #   Set when a corrupted frame, or a NAK after the unit answered, turns up during an exchange
+        self._corrupted = False
+        self._stray_nak = False
+        super().__init__(addr=addr, persistent=True, transport=bus.serial_context,
+                         baudrate=bus.serial_context.baudrate,
+                         read_timeout=bus.read_timeout, write_timeout=bus.write_timeout)
+
+    @property
+    def trace(self):
+        #   The line is traced as a whole, so every device shares the bus's recorder
+        return self.bus.trace
+
+    @trace.setter
+    def trace(self, trace) -> None:
+        self.bus.trace = trace
+
+    def connect(self) -> 'BusDevice':
+        return self
+
+    def disconnect(self) -> None:
+        pass
+
+    def _transfer(self, frame) -> bytearray:
+        mailbox = self.bus.mailboxes[self.addr]
+        deadline = monotonic() + self.read_timeout
+        self._corrupted = False
+        self._stray_nak = False
+
+        with self.bus.turn(self.addr):
+            #   Anything still in the mailbox answers an exchange that already gave up
+            while not mailbox.empty():
+                mailbox.get_nowait()
+            self._write(frame)
+            reply = None
+            if frame[5] in RELEASE_AFTER_ACK:
+                reply = self._receive(mailbox, frame[5], min(deadline, monotonic() + self.bus.ack_timeout),
+                                      until_ack=True)
+            if reply is None:
+                #   No ACK (the unit sometimes leaves it out): keep the line until the reply
+                reply = self._receive(mailbox, frame[5], deadline)
+
+        if reply == ACK:
+            reply = self._receive(mailbox, frame[5], deadline)
+        return reply
+
+    def _flush_input(self) -> None:
+        #   The port is shared, and each exchange empties its own mailbox first anyway.
+        #   Only the reply to an abandoned exchange, which may still come, is waited for.
+        abandoned_until, self._abandoned_until = self._abandoned_until, None
+        mailbox = self.bus.mailboxes[self.addr]
+        while abandoned_until is not None:
+            if self.abort_event is not None and self.abort_event.is_set():
+                self._abandoned_until = abandoned_until
+                raise LinkCancelled('Exchange abandoned by caller')
+            remaining = abandoned_until - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = mailbox.get(timeout=min(READ_SLICE, remaining))
+            except queue.Empty:
+                continue
+            if entry != ACK:
+                #   The reply (or a NAK, or a corrupted frame) in place of it
+                break
+        self._stale_input = False
+
+    def _receive(self, mailbox: queue.Queue, cm: int, deadline: float, until_ack: bool = False):
+        '''
+        Takes entries off the mailbox until the reply to command `cm` arrives, or with
+        `until_ack`, until the unit ACKs (returning `ACK`), checking `abort_event` between
+        slices. Raises as `SK_AD3._read()` does: `FrameRejected` on a NAK before anything
+        else came back, and at the deadline `FrameError` if only a corrupted frame or a
+        later NAK came, otherwise `LinkTimeout`. With `until_ack`, returns `None` at the
+        deadline instead.
+        '''
+        while True:
+            if self.abort_event is not None and self.abort_event.is_set():
+                raise LinkCancelled('Exchange abandoned by caller')
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                if until_ack:
+                    return None
+                if self._corrupted:
+                    raise FrameError(f'Reply from {self.addr:#04x} failed its BCC check')
+                if self._stray_nak:
+                    raise FrameError(f'No reply from {self.addr:#04x}, and a NAK after the frame was answered')
+                raise LinkTimeout(f'No reply from {self.addr:#04x} within {self.read_timeout}s')
+            try:
+                entry = mailbox.get(timeout=min(READ_SLICE, remaining))
+            except queue.Empty:
+                continue
+            if entry == NAK:
+                if not self._answered:
+                    raise FrameRejected(f'Dispenser at {self.addr:#04x} rejected the frame (NAK)')
+                #   Line noise, as the frame was taken
+                self._stray_nak = True
+                continue
+            self._answered = True
+            if entry == ACK:
+                if until_ack:
+                    return ACK
+            elif entry == BAD_BCC:
+                self._corrupted = True
+            elif entry[5] == cm:
+                return entry
+            #   Otherwise a late reply to an earlier command; it is dropped and the wait goes on
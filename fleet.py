@@ -0,0 +1,305 @@
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from time import monotonic
+from . import SK_AD3
+
+
+#   Messages from a worker process, as (kind, job_id, payload)
+READY = 0           # The dispenser is built and its port open: the worker takes jobs
+UNAVAILABLE = 1     # The dispenser could not be built or opened; payload is the exception
+STARTED = 2
+DONE = 3
+FAILED = 4
+
+
+def _work(factory, port: str, connection) -> None:
+    '''
+    Worker process body: one `SK_AD3` for `port`, running the jobs the supervisor sends
+    over `connection` one at a time, until it sends `None`, and reporting back over it.
+    '''
+    try:
+        dispenser = factory(port)
+        dispenser.connect()
+    except Exception as e:
+        _send(connection, (UNAVAILABLE, None, e))
+        raise SystemExit(1)
+    connection.send((READY, None, None))
+    try:
+        while True:
+            job = connection.recv()
+            if job is None:
+                return
+            job_id, function, args, kwargs = job
+            #   Pipe sends are synchronous, so the supervisor knows the job had started
+            #   even if the process dies straight after
+            connection.send((STARTED, job_id, None))
+            try:
+                if isinstance(function, str):
+                    function = getattr(type(dispenser), function)
+                message = (DONE, job_id, function(dispenser, *args, **kwargs))
+            except Exception as e:
+                message = (FAILED, job_id, e)
+            _send(connection, message)
+    finally:
+        dispenser.disconnect()
+
+
+def _send(connection, message: tuple) -> None:
+    try:
+        connection.send(message)
+    except Exception as e:
+        kind, job_id, _ = message
+        connection.send((FAILED if kind == DONE else kind, job_id,
+                         Exception(f'Unpicklable payload from job {job_id}: {e!r}')))
+
+
+class Fleet:
+    '''
+    Runs jobs across many dispensers, one worker process per port, so that crypto and
+    frame handling for each unit get a core of their own instead of sharing the GIL::
+
+        def personalise(dispenser, layout):
+            dispenser.move_card('RF')
+            ...
+            return dispenser.get_card_uid().data
+
+        with Fleet(SK_AD3, ['COM3', 'COM4', 'COM5']) as fleet:
+            futures = [fleet.submit(personalise, layout) for _ in range(500)]
+            for future in as_completed(futures):
+                print(future.port, future.result())
+
+    Every process builds its own dispenser with `factory(port)` and holds its port open.
+    Jobs wait in one queue, and the supervisor hands each to whichever unit is free.
+    A job is `function(dispenser, *args, **kwargs)` (or the name of an `SK_AD3` method)
+    and `submit()` returns a `concurrent.futures.Future` that resolves as soon as its
+    result comes back; `future.port` records the port that ran it.
+
+    `factory`, job functions, their arguments and results cross process boundaries, so
+    they must be picklable: use module-level functions rather than lambdas.
+
+    A supervisor thread restarts any worker process that dies. The job it was running
+    fails with an exception rather than being re-queued, since the card it was handling
+    may already have been moved or written; a job handed over but not yet started goes
+    back to the queue. A port whose worker fails to start `max_failed_starts` times in a
+    row is given up on, with the last failure kept in `errors`. Once every port has been
+    given up on, outstanding and later jobs fail with an exception.
+    '''
+
+    def __init__(self, factory=SK_AD3, ports: list = (), restart_delay: float = 1.0,
+                 start_method: str = 'spawn', max_failed_starts: int = 3):
+        self.factory = factory
+        self.ports = list(ports)
+        self.restart_delay = restart_delay
+        self.max_failed_starts = max_failed_starts
+        self.restarts = {port: 0 for port in self.ports}
+        #   Why each port that was given up on failed to start
+        self.errors = {}
+
+        self._context = multiprocessing.get_context(start_method)
+        self._processes = {}
+        self._connections = {}
+        self._futures = {}
+        #   Jobs waiting for a free worker
+        self._pending = deque()
+        #   Per port: the job handed to its worker, whether the worker has started it,
+        #   and whether the worker is up (READY) and waiting for a job
+        self._running = {}
+        self._started = {}
+        self._ready = set()
+        self._idle = set()
+        self._failed_starts = {port: 0 for port in self.ports}
+        self._start_errors = {}
+        self._lock = threading.Lock()
+        #   Wakes the supervisor when a job is submitted
+        self._wakeup, self._waker = self._context.Pipe(duplex=False)
+        self._next_id = 0
+        self._supervisor = None
+        self._closing = False
+        #   Set once no port is left to run jobs
+        self._error = None
+
+    def __enter__(self) -> 'Fleet':
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def start(self) -> None:
+        '''
+        Starts a worker process per port and the supervisor.
+        '''
+        for port in self.ports:
+            self._spawn(port)
+        self._supervisor = threading.Thread(target=self._supervise, name='SK_AD3 fleet', daemon=True)
+        self._supervisor.start()
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        '''
+        Queues `function(dispenser, *args, **kwargs)` for the next free dispenser.
+        Jobs cannot be cancelled once submitted.
+        '''
+        future = Future()
+        future.port = None
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            if self._error is not None:
+                future.set_exception(self._error)
+                return future
+            job_id = self._next_id
+            self._next_id += 1
+            self._futures[job_id] = future
+            self._pending.append((job_id, function, args, kwargs))
+            self._waker.send_bytes(b'')
+        return future
+
+    def close(self) -> None:
+        '''
+        Lets the workers finish every job queued so far, then stops them.
+        '''
+        with self._lock:
+            self._closing = True
+            self._waker.send_bytes(b'')
+        if self._supervisor is not None:
+            self._supervisor.join()
+            self._supervisor = None
+
+    def _spawn(self, port: str) -> None:
+        connection, child = self._context.Pipe()
+        process = self._context.Process(target=_work, name=f'SK_AD3 {port}', daemon=True,
+                                        args=(self.factory, port, child))
+        process.start()
+        child.close()
+        self._processes[port] = process
+        self._connections[port] = connection
+
+    def _supervise(self) -> None:
+        #   Ports whose worker died, and when they may be restarted
+        respawn = {}
+        while self._processes or respawn:
+            wait(list(self._connections.values()) + [p.sentinel for p in self._processes.values()]
+                 + [self._wakeup], timeout=0.1)
+            while self._wakeup.poll():
+                self._wakeup.recv_bytes()
+            for port in list(self._processes):
+                self._receive(port)
+
+            for port, process in list(self._processes.items()):
+                if process.is_alive():
+                    continue
+                process.join()
+                #   Collect whatever it managed to send before it went
+                self._receive(port)
+                del self._processes[port]
+                self._connections.pop(port).close()
+                self._idle.discard(port)
+                job = self._running.pop(port, None)
+                if job is not None:
+                    if self._started.pop(port):
+                        self._resolve(FAILED, job[0], port, Exception(
+                            f'Worker for {port} exited with code {process.exitcode} during job {job[0]}'))
+                    else:
+                        #   Never started, so it is safe to run elsewhere
+                        with self._lock:
+                            self._pending.appendleft(job)
+                #   A clean exit means the worker was told to stop
+                if process.exitcode == 0:
+                    continue
+                if port in self._ready:
+                    self._ready.discard(port)
+                else:
+                    self._failed_starts[port] += 1
+                    if self._failed_starts[port] >= self.max_failed_starts:
+                        self.errors[port] = self._start_errors.get(port) or Exception(
+                            f'Worker for {port} exited with code {process.exitcode} while starting')
+                        continue
+                self.restarts[port] += 1
+                respawn[port] = monotonic() + self.restart_delay
+
+            for port, when in list(respawn.items()):
+                if self._closing and not self._futures:
+                    del respawn[port]
+                elif monotonic() >= when:
+                    del respawn[port]
+                    self._spawn(port)
+
+            if not self._processes and not respawn:
+                self._fail_pending()
+            else:
+                self._dispatch()
+
+    def _dispatch(self) -> None:
+        for port in list(self._idle):
+            with self._lock:
+                job = self._pending.popleft() if self._pending else None
+                closing = self._closing
+            if job is None:
+                if not closing:
+                    return
+                #   Nothing left to do: let the worker exit
+                self._idle.discard(port)
+                self._send(port, None)
+                continue
+            self._idle.discard(port)
+            self._running[port] = job
+            self._started[port] = False
+            try:
+                self._send(port, job)
+            except Exception as e:
+                #   The job itself could not be pickled
+                self._running.pop(port)
+                self._started.pop(port)
+                self._idle.add(port)
+                self._resolve(FAILED, job[0], port, e)
+
+    def _send(self, port: str, message) -> None:
+        try:
+            self._connections[port].send(message)
+        except OSError:
+            #   The worker is gone; the liveness check deals with it
+            pass
+
+    def _fail_pending(self) -> None:
+        errors = ', '.join(f'{port}: {error!r}' for port, error in self.errors.items())
+        with self._lock:
+            if self._error is None:
+                self._error = Exception(f'No dispenser left to run jobs ({errors or "all stopped"})')
+            pending, self._pending = self._pending, deque()
+        for job in pending:
+            self._resolve(FAILED, job[0], None, self._error)
+
+    def _receive(self, port: str) -> None:
+        connection = self._connections[port]
+        try:
+            while connection.poll():
+                kind, job_id, payload = connection.recv()
+                if kind == READY:
+                    self._ready.add(port)
+                    self._failed_starts[port] = 0
+                    self._idle.add(port)
+                elif kind == UNAVAILABLE:
+                    self._start_errors[port] = payload
+                elif kind == STARTED:
+                    self._started[port] = True
+                    with self._lock:
+                        self._futures[job_id].port = port
+                else:
+                    self._running.pop(port, None)
+                    self._started.pop(port, None)
+                    self._idle.add(port)
+                    self._resolve(kind, job_id, port, payload)
+        except (EOFError, OSError):
+            #   The worker is gone; the liveness check deals with it
+            pass
+
+    def _resolve(self, kind: int, job_id: int, port: str, payload) -> None:
+        with self._lock:
+            future = self._futures.pop(job_id)
+        future.port = port
+        if kind == DONE:
+            future.set_result(payload)
+        else:
+            future.set_exception(payload)
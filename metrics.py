@@ -0,0 +1,387 @@
+import inspect
+import threading
+from bisect import bisect_left
+from time import monotonic
+from .worker import COMMANDS
+from .api.constants.command_codes import PMT, EMT
+from .api.utils.lazy import LazyMethod
+
+
+#   Upper bounds, in seconds, of the histogram buckets. Fixed and shared, so recording
+#   a sample is a bisect and two additions.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+#   Names of the SK-AD3 commands, by CM (and PM, where it selects the operation)
+FRAME_NAMES = {
+    0x30: 'init',
+    0x31: 'get_status',
+    0x32: 'move_card',
+    0x33: 'set_insertion',
+    0x50: 'auto_test_RF_card_type',
+    (0x60, 0x30): 'activate_RF_card',
+    (0x60, 0x31): 'deactivate_RF_card',
+}
+
+#   The methods `attach()` times by default: every command but the two that carry a
+#   single frame, which the exchange statistics already cover
+TIMED_METHODS = tuple(name for name in COMMANDS if name not in ('send_command', 'send_raw_apdu'))
+
+#   CM/PM of the command that carries an APDU to the card
+APDU_COMMAND = (0x60, 0x34)
+
+#   Names of the DESFire instructions, by INS
+INS_NAMES = {
+    0x0A: 'authenticate',
+    0x1A: 'authenticate_iso',
+    0xAA: 'authenticate_aes',
+    0xAF: 'additional_frame',
+    0x45: 'get_key_settings',
+    0x64: 'get_key_version',
+    0xC4: 'change_key',
+    0x60: 'get_version',
+    0x5A: 'select_application',
+    0xCA: 'create_application',
+    0xDA: 'delete_application',
+    0x6A: 'get_application_ids',
+    0xFC: 'format_picc',
+    0x6F: 'get_file_ids',
+    0xF5: 'get_file_settings',
+    0xCD: 'create_std_data_file',
+    0xCB: 'create_backup_data_file',
+    0xCC: 'create_value_file',
+    0xC1: 'create_linear_record_file',
+    0xC0: 'create_cyclic_record_file',
+    0xDF: 'delete_file',
+    0xBD: 'read_data',
+    0x3D: 'write_data',
+    0xBB: 'read_records',
+    0x3B: 'write_record',
+    0x6C: 'get_value',
+    0x0C: 'credit',
+    0xDC: 'debit',
+    0xC7: 'commit_transaction',
+    0xA7: 'abort_transaction',
+}
+
+
+def command_name(frame) -> str:
+    '''
+    A label for the command carried by an outbound frame: the SK-AD3 command, or
+    `apdu:<instruction>` for an APDU.
+    '''
+    cm, pm = frame[5], frame[6]
+    if (cm, pm) == APDU_COMMAND:
+        ins = frame[8] if len(frame) > 10 else None
+        return f'apdu:{INS_NAMES.get(ins, f"{ins:#04x}" if ins is not None else "empty")}'
+    return FRAME_NAMES.get((cm, pm)) or FRAME_NAMES.get(cm) or f'{cm:#04x}/{pm:#04x}'
+
+
+def outcome(frame, reply) -> tuple:
+    '''
+    `(outcome, code)` of an exchange: `('PMT', sw)` with the APDU status word for APDUs,
+    `('EMT', error)` with the SK-AD3 error code, or `('no_reply', '')`.
+    '''
+    if len(reply) < 10:
+        return 'no_reply', ''
+    if reply[4] == EMT:
+        return 'EMT', f'{reply[7]:02X}{reply[8]:02X}'
+    if reply[4] == PMT:
+        if (frame[5], frame[6]) == APDU_COMMAND and len(reply) >= 14:
+            return 'PMT', f'{reply[-4]:02X}{reply[-3]:02X}'
+        return 'PMT', ''
+    return f'{reply[4]:#04x}', ''
+
+
+class Histogram:
+    '''
+    Counts of samples per bucket of `LATENCY_BUCKETS`, plus their sum.
+    '''
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list:
+        '''
+        `[(upper_bound, samples at or below it)]`, the last bound being `inf`.
+        '''
+        total, result = 0, []
+        for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q: float) -> float:
+        '''
+        The upper bound of the bucket holding the `q` quantile (0 < q <= 1), or `None`.
+        '''
+        if not self.count:
+            return None
+        for bound, total in self.cumulative():
+            if total >= q * self.count:
+                return bound
+
+    def snapshot(self) -> dict:
+        return {'count': self.count,
+                'sum': self.sum,
+                'mean': self.sum / self.count if self.count else None,
+                'p50': self.quantile(0.5),
+                'p99': self.quantile(0.99)}
+
+
+class ExchangeStats:
+    '''
+    Everything recorded for one command on one dispenser.
+    '''
+
+    __slots__ = ('write', 'first_byte', 'latency', 'bytes_out', 'bytes_in', 'retries', 'outcomes')
+
+    def __init__(self):
+        self.write = Histogram()
+        self.first_byte = Histogram()
+        self.latency = Histogram()
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.retries = 0
+        #   (outcome, code) -> count
+        self.outcomes = {}
+
+
+class MethodStats:
+    '''
+    Everything recorded for one `SK_AD3` method on one dispenser.
+    '''
+
+    __slots__ = ('latency', 'outcomes')
+
+    def __init__(self):
+        self.latency = Histogram()
+        #   'ok', 'failed' (unsuccessful response) or 'error' (raised) -> count
+        self.outcomes = {}
+
+
+class Metrics:
+    '''
+    A registry of per-dispenser, per-command timings and counters::
+
+        metrics = Metrics()
+        metrics.attach(dispenser)
+        ...
+        print(metrics.prometheus())     # Prometheus text exposition format
+        metrics.snapshot()              # the same, as nested dicts
+
+    For every frame exchanged, it records the bytes sent and received, the time to
+    write the frame, the time from the end of the write to the first byte of the reply,
+    the total latency, retries, and the outcome (`PMT` with the APDU status word,
+    `EMT` with the SK-AD3 error code, or the link error, such as `LinkTimeout`, that
+    failed the attempt). With `methods`, `attach()` also times the `SK_AD3` methods in
+    `TIMED_METHODS` (or the names given) called on the dispenser object itself; a method
+    called from within another timed one counts towards the outer call only. Calls
+    dispatched through a `DeviceWorker` are recorded at the frame level only.
+
+    A dispenser without a registry attached only pays for one attribute check per
+    exchange. One registry may be shared by several dispensers and threads.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        #   (dispenser label, command) -> ExchangeStats
+        self.exchanges = {}
+        #   (dispenser label, method) -> MethodStats
+        self.methods = {}
+        self._labels = {}
+        #   Set on a thread while it runs a timed method, see _timed()
+        self._local = threading.local()
+
+    def attach(self, dispenser, label: str = None, methods=True) -> 'Metrics':
+        '''
+        Starts recording `dispenser`'s exchanges, under `label` (`port:addr` by default).
+        `methods` is `True` to time `TIMED_METHODS`, a list of method names to time
+        those instead, or `False`.
+        '''
+        self._labels[id(dispenser)] = label or f'{dispenser.port}:{dispenser.addr:#04x}'
+        dispenser.metrics = self
+        if methods:
+            for name in (TIMED_METHODS if methods is True else methods):
+                setattr(dispenser, name, self._timed(dispenser, name))
+        return self
+
+    def detach(self, dispenser) -> None:
+        '''
+        Stops recording `dispenser`. What was recorded so far is kept.
+        '''
+        dispenser.metrics = None
+        for name in list(dispenser.__dict__):
+            if getattr(dispenser.__dict__[name], '_metrics', None) is self:
+                del dispenser.__dict__[name]
+
+    def record_exchange(self, dispenser, frame, reply, start: float, end: float, retries: int = 0,
+                        failure: str = None) -> None:
+        '''
+        Called by `SK_AD3._exchange` with the monotonic times around one exchange: a
+        successful one after `retries` failed attempts, or a failed attempt, `failure`
+        being the name of the link error it raised.
+        '''
+        key = (self._labels.get(id(dispenser)) or f'{dispenser.port}:{dispenser.addr:#04x}',
+               command_name(frame))
+        wrote_at = dispenser._wrote_at or start
+        #   Not set when nothing at all came back
+        first_byte_at = dispenser._first_byte_at
+        result = (failure, '') if failure is not None else outcome(frame, reply)
+        with self._lock:
+            stats = self.exchanges.get(key)
+            if stats is None:
+                stats = self.exchanges[key] = ExchangeStats()
+            stats.write.observe(wrote_at - start)
+            if first_byte_at is not None:
+                stats.first_byte.observe(first_byte_at - wrote_at)
+            stats.latency.observe(end - start)
+            stats.bytes_out += len(frame)
+            stats.bytes_in += len(reply)
+            stats.retries += retries
+            stats.outcomes[result] = stats.outcomes.get(result, 0) + 1
+
+    def _timed(self, dispenser, name: str):
+        key = (self._labels[id(dispenser)], name)
+        #   Looked up on every call, so that a LazyMethod is only imported once it is used
+        owner = type(dispenser)
+        local = self._local
+
+        def timed(*args, **kwargs):
+            method = getattr(owner, name).__get__(dispenser, owner)
+            if getattr(local, 'timing', False):
+                return method(*args, **kwargs)
+            local.timing = True
+            start = monotonic()
+            result = 'error'
+            try:
+                response = method(*args, **kwargs)
+                result = 'ok'
+                try:
+                    if not response.is_successful():
+                        result = 'failed'
+                except AttributeError:
+                    pass
+                except IndexError:
+                    #   An empty frame: nothing came back
+                    result = 'failed'
+                return response
+            finally:
+                local.timing = False
+                elapsed = monotonic() - start
+                with self._lock:
+                    stats = self.methods.get(key)
+                    if stats is None:
+                        stats = self.methods[key] = MethodStats()
+                    stats.latency.observe(elapsed)
+                    stats.outcomes[result] = stats.outcomes.get(result, 0) + 1
+
+        timed.__name__ = name
+        method = inspect.getattr_static(owner, name)
+        timed.__doc__ = f'See `SK_AD3.{name}`.' if isinstance(method, LazyMethod) else method.__doc__
+        timed._metrics = self
+        return timed
+
+    def snapshot(self) -> dict:
+        '''
+        Everything recorded so far::
+
+            {'exchanges': {dispenser: {command: {'write', 'first_byte', 'latency',
+                                                 'bytes_out', 'bytes_in', 'retries', 'outcomes'}}},
+             'methods': {dispenser: {method: {'latency', 'outcomes'}}}}
+
+        Histograms are summarised as `{'count', 'sum', 'mean', 'p50', 'p99'}` (quantiles
+        are bucket upper bounds); outcomes are keyed `'PMT'`, `'EMT 4130'`, `'PMT 91AE'`...
+        '''
+        def outcomes(counts: dict) -> dict:
+            return {' '.join(part for part in (key if isinstance(key, tuple) else (key,)) if part): count
+                    for key, count in counts.items()}
+
+        snapshot = {'exchanges': {}, 'methods': {}}
+        with self._lock:
+            for (dispenser, command), stats in self.exchanges.items():
+                snapshot['exchanges'].setdefault(dispenser, {})[command] = {
+                    'write': stats.write.snapshot(),
+                    'first_byte': stats.first_byte.snapshot(),
+                    'latency': stats.latency.snapshot(),
+                    'bytes_out': stats.bytes_out,
+                    'bytes_in': stats.bytes_in,
+                    'retries': stats.retries,
+                    'outcomes': outcomes(stats.outcomes),
+                }
+            for (dispenser, method), stats in self.methods.items():
+                snapshot['methods'].setdefault(dispenser, {})[method] = {
+                    'latency': stats.latency.snapshot(),
+                    'outcomes': outcomes(stats.outcomes),
+                }
+        return snapshot
+
+    def prometheus(self, prefix: str = 'sk_ad3') -> str:
+        '''
+        Everything recorded so far, in the Prometheus text exposition format.
+        '''
+        lines = []
+
+        def header(name: str, kind: str, text: str) -> str:
+            lines.append(f'# HELP {prefix}_{name} {text}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            return f'{prefix}_{name}'
+
+        def histogram(name: str, text: str, series: list) -> None:
+            metric = header(name, 'histogram', text)
+            for labels, hist in series:
+                for bound, total in hist.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{metric}_bucket{_labels(labels, le=le)} {total}')
+                lines.append(f'{metric}_sum{_labels(labels)} {hist.sum!r}')
+                lines.append(f'{metric}_count{_labels(labels)} {hist.count}')
+
+        def counter(name: str, text: str, series: list) -> None:
+            metric = header(name, 'counter', text)
+            for labels, value in series:
+                lines.append(f'{metric}{_labels(labels)} {value}')
+
+        with self._lock:
+            exchanges = [({'dispenser': dispenser, 'command': command}, stats)
+                         for (dispenser, command), stats in self.exchanges.items()]
+            methods = [({'dispenser': dispenser, 'method': method}, stats)
+                       for (dispenser, method), stats in self.methods.items()]
+
+            if exchanges:
+                histogram('exchange_write_seconds', 'Time to write a frame onto the wire.',
+                          [(labels, stats.write) for labels, stats in exchanges])
+                histogram('exchange_first_byte_seconds', 'Time from the end of the write to the first byte of the reply.',
+                          [(labels, stats.first_byte) for labels, stats in exchanges])
+                histogram('exchange_latency_seconds', 'Time for a whole exchange.',
+                          [(labels, stats.latency) for labels, stats in exchanges])
+                counter('exchange_sent_bytes_total', 'Bytes written.',
+                        [(labels, stats.bytes_out) for labels, stats in exchanges])
+                counter('exchange_received_bytes_total', 'Bytes received.',
+                        [(labels, stats.bytes_in) for labels, stats in exchanges])
+                counter('exchange_retries_total', 'Frames sent again after a failed attempt.',
+                        [(labels, stats.retries) for labels, stats in exchanges])
+                counter('exchanges_total', 'Exchange attempts, by outcome (PMT/EMT/link error) and status or error code.',
+                        [({**labels, 'outcome': result, 'code': code}, count)
+                         for labels, stats in exchanges for (result, code), count in stats.outcomes.items()])
+            if methods:
+                histogram('method_latency_seconds', 'Time for a whole SK_AD3 method call.',
+                          [(labels, stats.latency) for labels, stats in methods])
+                counter('method_calls_total', 'SK_AD3 method calls, by outcome (ok/failed/error).',
+                        [({**labels, 'outcome': result}, count)
+                         for labels, stats in methods for result, count in stats.outcomes.items()])
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: dict, **extra) -> str:
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in {**labels, **extra}.items()) + '}'
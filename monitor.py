@@ -0,0 +1,223 @@
+import logging
+import threading
+from time import monotonic
+from .worker import DeviceWorker
+from .api.constants.command_codes import PMT, COMMAND_INIT, COMMAND_MOVE_CARD
+from .api.constants.status_codes import \
+    dispenser_status_codes, \
+    stacker_status_codes, \
+    capture_box_status_codes
+
+
+FIELDS = ('dispenser_status', 'stacker_status', 'capture_box_status')
+CODES = (dispenser_status_codes, stacker_status_codes, capture_box_status_codes)
+
+#   The message for a status code missing from the tables
+UNKNOWN_STATUS = 'Unknown status'
+
+log = logging.getLogger(__name__)
+
+#   Named transitions for StatusMonitor.on(): the status field, and the code it changes to
+EVENTS = {
+    'dispenser_empty': ('dispenser_status', 0x30),
+    'card_in_dispenser': ('dispenser_status', 0x31),
+    'card_at_rf': ('dispenser_status', 0x32),
+    'stacker_empty': ('stacker_status', 0x30),
+    'stacker_low': ('stacker_status', 0x31),
+    'stacker_sufficient': ('stacker_status', 0x32),
+    'capture_box_full': ('capture_box_status', 0x31),
+    'capture_box_emptied': ('capture_box_status', 0x30),
+}
+
+#   Commands after which the mechanism is likely to be moving
+MOTION_COMMANDS = frozenset((COMMAND_INIT, COMMAND_MOVE_CARD))
+
+
+class StatusMonitor:
+    '''
+    Keeps the dispenser's status up to date in the background, so it can be read at any
+    time without a round trip, and calls back when it changes::
+
+        worker = DeviceWorker(dispenser)
+        monitor = StatusMonitor(worker)
+        monitor.on('stacker_low', lambda status: alert('Refill the stacker'))
+        monitor.on('capture_box_full', lambda status: alert('Empty the capture box'))
+        monitor.start()
+
+        monitor.status['dispenser_status']      # cached, as returned by get_status()
+
+    Polls go through the `DeviceWorker` passed in, so they interleave safely with every
+    other command that goes through it; issue none on the dispenser directly while the
+    monitor runs.
+
+    Every reply the dispenser sends carries its status, so the monitor also reads it
+    from other commands' replies and only polls when nothing else has for a while.
+    It polls every `active_interval` seconds after a transition or a move/init command,
+    backing off by `backoff` per quiet poll to every `idle_interval` seconds.
+
+    Callbacks run on the monitor's own thread. The first reading counts as a transition
+    from unknown, so callbacks also learn the initial state. A callback that raises is
+    logged and does not stop the monitor.
+    '''
+
+    def __init__(self, worker: DeviceWorker, active_interval: float = 0.1, idle_interval: float = 2.0,
+                 backoff: float = 2.0):
+        if not isinstance(worker, DeviceWorker):
+            raise Exception('StatusMonitor polls through a DeviceWorker, so that its polls and the other '
+                            'commands take turns; wrap the dispenser in one and issue commands through it')
+        self.worker = worker
+        self.dispenser = self.worker.dispenser
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.backoff = backoff
+        #   The exception raised by the last poll, if it failed
+        self.error = None
+
+        self._codes = None
+        self._status = None
+        self._updated = None
+        self._polled = float('-inf')
+        #   (codes, time) of the latest reply, written by _observe on the I/O thread
+        self._latest = None
+        self._motion = False
+        self._interval = active_interval
+        self._callbacks = []
+        self._events = {}
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        #   The poll in flight, aborted by stop()
+        self._poll = None
+
+    @property
+    def status(self) -> dict:
+        '''
+        The latest status, shaped like `get_status().data['status']`, or `None` before the
+        first reading.
+        '''
+        return self._status
+
+    @property
+    def age(self) -> float:
+        '''
+        Seconds since the status was last confirmed by the dispenser, or `None`.
+        '''
+        return None if self._updated is None else monotonic() - self._updated
+
+    def on_change(self, callback) -> None:
+        '''
+        Calls `callback(field, old, new)` whenever one of the status fields changes.
+        `old` and `new` are `{'code': int, 'message': str}` (`old` is `None` at first).
+        '''
+        self._callbacks.append(callback)
+
+    def on(self, event: str, callback) -> None:
+        '''
+        Calls `callback(status)` whenever the named transition happens (see `EVENTS`).
+        '''
+        if event not in EVENTS:
+            raise Exception(f'Unknown status event {event}')
+        self._events.setdefault(EVENTS[event], []).append(callback)
+
+    def start(self) -> 'StatusMonitor':
+        self.dispenser.listeners.append(self._observe)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f'SK_AD3 monitor {self.dispenser.port}:{self.dispenser.addr:#04x}')
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        '''
+        Stops polling, aborting a poll still queued or running. The worker is left running.
+        '''
+        self._stopped.set()
+        self._wake.set()
+        poll = self._poll
+        if poll is not None:
+            poll.abort()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._observe in self.dispenser.listeners:
+            self.dispenser.listeners.remove(self._observe)
+
+    def __enter__(self) -> 'StatusMonitor':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def _observe(self, frame, reply) -> None:
+        #   Runs on the I/O thread: note what was seen and leave the rest to _run
+        if frame[5] in MOTION_COMMANDS:
+            self._motion = True
+        if len(reply) >= 10 and reply[4] == PMT:
+            self._latest = ((reply[7], reply[8], reply[9]), monotonic())
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            last = max(self._polled, self._updated or self._polled)
+            remaining = self._interval - (monotonic() - last)
+            if remaining > 0:
+                #   Polled, or saw another command's reply, recently enough
+                self._wake.wait(remaining)
+                self._wake.clear()
+                self._update()
+                continue
+
+            self._polled = monotonic()
+            self._poll = poll = self.worker.get_status()
+            if self._stopped.is_set():
+                #   stop() may have looked for the poll before it was submitted
+                poll.abort()
+            try:
+                attempts = self.dispenser.retries + 1
+                poll.result(timeout=self.dispenser.read_timeout * attempts + 1.0)
+                self.error = None
+            except Exception as e:
+                if self._stopped.is_set():
+                    break
+                self.error = e
+            finally:
+                self._poll = None
+            if not self._update():
+                self._interval = min(self._interval * self.backoff, self.idle_interval)
+
+    def _update(self) -> bool:
+        '''
+        Applies the latest reply seen. Returns True if the monitor should poll fast.
+        '''
+        latest, self._latest = self._latest, None
+        active = self._motion
+        self._motion = False
+        if latest is not None:
+            codes, self._updated = latest
+            if codes != self._codes:
+                self._transition(codes)
+                active = True
+        if active:
+            self._interval = self.active_interval
+        return active
+
+    def _transition(self, codes: tuple) -> None:
+        old = self._status
+        self._codes = codes
+        self._status = {field: {'code': code, 'message': table.get(code, UNKNOWN_STATUS)}
+                        for field, code, table in zip(FIELDS, codes, CODES)}
+        for field in FIELDS:
+            before = None if old is None else old[field]
+            after = self._status[field]
+            if before is not None and before['code'] == after['code']:
+                continue
+            for callback in self._callbacks:
+                self._call(callback, field, before, after)
+            for callback in self._events.get((field, after['code']), ()):
+                self._call(callback, self._status)
+
+    def _call(self, callback, *args) -> None:
+        try:
+            callback(*args)
+        except Exception:
+            log.exception('StatusMonitor callback %r failed', callback)
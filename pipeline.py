@@ -0,0 +1,168 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+from . import SK_AD3
+
+
+#   Stages in the order a card goes through them. 'prepare' runs on the pool,
+#   everything else on the line, and 'wait' is how long the line sat idle
+#   waiting for 'prepare' to finish.
+STAGES = ('prepare', 'wait', 'move_in', 'activate', 'uid', 'personalise', 'deliver', 'reject')
+
+
+@dataclass
+class CardResult:
+    '''
+    The outcome for one job. `value` is whatever `personalise` returned; on failure,
+    `stage` names the stage that failed and `error` holds the exception.
+    '''
+
+    job: object
+    uid: str = None
+    value: object = None
+    stage: str = None
+    error: Exception = None
+    timings: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class Pipeline:
+    '''
+    Personalises a stream of cards, preparing upcoming cards on a thread pool while
+    the current one is being moved and written::
+
+        def prepare(job):
+            # Host-side work that does not need the card: building the layout,
+            # encrypting payloads, deriving keys...
+            return build_payload(job)
+
+        def personalise(dispenser, uid, payload):
+            dispenser.aes_authenticate(MASTER_KEY)
+            ...
+
+        pipeline = Pipeline(dispenser, prepare, personalise)
+        for result in pipeline.run(jobs):
+            print(result.job, result.uid, result.ok, result.timings)
+
+    For each job, the line moves a card to the RF position, activates it, reads its UID
+    and calls `personalise(dispenser, uid, prepare(job))`, then moves the card to
+    `deliver`. `prepare` runs up to `lookahead` jobs ahead on `workers` threads, so
+    its cost hides behind the mechanical moves. `personalise` should raise on failure.
+
+    A failed stage only costs its own card: the card is moved to `reject` and the line
+    carries on with the next job. If `prepare` fails, no card is dispensed for that job.
+    `stats()` summarises the time spent in each stage (see `STAGES`).
+    '''
+
+    def __init__(self, dispenser: SK_AD3, prepare, personalise, deliver: str = 'front',
+                 reject: str = 'capture', workers: int = 2, lookahead: int = 2):
+        self.dispenser = dispenser
+        self.prepare = prepare
+        self.personalise = personalise
+        self.deliver = deliver
+        self.reject = reject
+        self.workers = workers
+        self.lookahead = lookahead
+        self.timings = {stage: [] for stage in STAGES}
+        self.failures = {stage: 0 for stage in STAGES}
+
+    def run(self, jobs):
+        '''
+        Personalises a card for each job, yielding a `CardResult` as each card leaves
+        the line. The session is held open for the whole run.
+        '''
+        jobs = iter(jobs)
+        pending = deque()
+
+        def refill() -> None:
+            while len(pending) < self.lookahead + 1:
+                try:
+                    job = next(jobs)
+                except StopIteration:
+                    return
+                pending.append((job, executor.submit(self._prepare, job)))
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='SK_AD3 prepare') as executor, \
+                self.dispenser.session():
+            refill()
+            while pending:
+                job, future = pending.popleft()
+                refill()
+                result = CardResult(job)
+                start = perf_counter()
+                try:
+                    payload, result.timings['prepare'] = future.result()
+                except Exception as e:
+                    result.stage, result.error = 'prepare', e
+                else:
+                    result.timings['wait'] = perf_counter() - start
+                    self._line(result, payload)
+                self._record(result)
+                yield result
+
+    def stats(self) -> dict:
+        '''
+        Per stage: how many times it ran and failed, and its mean and worst time in seconds.
+        '''
+        stats = {}
+        for stage, samples in self.timings.items():
+            if samples:
+                stats[stage] = {'count': len(samples),
+                                'failures': self.failures[stage],
+                                'mean': sum(samples) / len(samples),
+                                'max': max(samples)}
+        return stats
+
+    def _prepare(self, job) -> tuple:
+        start = perf_counter()
+        payload = self.prepare(job)
+        return payload, perf_counter() - start
+
+    def _line(self, result: CardResult, payload) -> None:
+        dispenser = self.dispenser
+        try:
+            self._step(result, 'move_in', dispenser.move_card, 'RF')
+            self._step(result, 'activate', dispenser.activate_RF_card)
+            result.uid = self._step(result, 'uid', dispenser.get_card_uid).data['uid']
+            result.value = self._step(result, 'personalise', self.personalise, dispenser, result.uid, payload)
+            self._step(result, 'deliver', dispenser.move_card, self.deliver)
+        except Exception as e:
+            result.error = e
+            if result.stage != 'move_in':
+                self._reject(result)
+
+    def _reject(self, result: CardResult) -> None:
+        #   Get the card out of the way. If even that fails, reset the mechanism
+        #   (which also clears the card) before giving up on the line.
+        try:
+            self._step(result, 'reject', self.dispenser.move_card, self.reject)
+        except Exception:
+            response = self.dispenser.init(self.reject)
+            if not response.is_successful():
+                raise Exception(f'Dispenser could not clear a failed card: {response.raw_response}')
+
+    def _step(self, result: CardResult, stage: str, function, *args):
+        #   Dispenser commands are checked for success; `personalise` raises by itself
+        checked = function is not self.personalise
+        start = perf_counter()
+        try:
+            value = function(*args)
+            if checked and not value.is_successful():
+                raise Exception(f'{stage} failed: {value.raw_response}')
+            return value
+        except Exception:
+            if result.stage is None:
+                result.stage = stage
+            raise
+        finally:
+            result.timings[stage] = perf_counter() - start
+
+    def _record(self, result: CardResult) -> None:
+        for stage, seconds in result.timings.items():
+            self.timings[stage].append(seconds)
+        if result.stage is not None:
+            self.failures[result.stage] += 1
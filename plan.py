@@ -0,0 +1,114 @@
+from .api.link.frames import build_frame, DATA_OFFSET
+from .api.response.response import Response, APDU_Response
+from .api.utils.checksum import bcc
+
+
+#   CM/PM of the command that carries an APDU to the card
+APDU_COMMAND = (0x60, 0x34)
+
+
+class Field:
+    '''
+    A placeholder for `length` bytes of a plan step that are only known at run time.
+    Its value is passed to `CommandPlan.run()` under `name`.
+    '''
+
+    def __init__(self, name: str, length: int):
+        self.name = name
+        self.length = length
+
+
+class CommandPlan:
+    '''
+    A sequence of SK-AD3 commands and DESFire APDUs compiled once into ready-to-send
+    frames, then run as many times as needed::
+
+        issue = CommandPlan()
+        issue.command(COMMAND_MOVE_CARD, 0x32)
+        issue.command(COMMAND_RF_CARD_OPERATION, PARAM_ACTIVATE_RF_CARD, [0x41, 0x30])
+        issue.apdu([0x90, 0x5A, 0x00, 0x00, 0x03, 0xAB, 0xCD, 0xEF, 0x00])
+        issue.apdu([0x90, 0x3D, 0x00, 0x00, 0x17, 0x00, 0x00, 0x00, 0x00, 0x10, 0x00, 0x00,
+                    Field('record', 16), 0x00])
+
+        for record in records:
+            responses = issue.run(dispenser, record=record)
+            if not responses[-1].is_successful():
+                ...
+
+    Every step becomes a complete frame the first time the plan runs for a given
+    address, and is reused by every dispenser with that address. A `Field` reserves
+    bytes that are patched into a copy of its frame on each run (so a plan can be shared
+    between threads), and the BCC is adjusted for just the patched bytes.
+    Steps go straight to the wire, without the per-command methods in between.
+    '''
+
+    def __init__(self):
+        #   (cm, pm, data) per step, data being a list of ints and Fields
+        self.steps = []
+        #   addr -> [(frame, fields, is_apdu)], fields being [(name, start, length)]
+        self._compiled = {}
+
+    def command(self, cm: int, pm: int, data: list = ()) -> 'CommandPlan':
+        '''
+        Adds an SK-AD3 command. `data` may contain `Field`s.
+        '''
+        self.steps.append((cm, pm, list(data)))
+        self._compiled.clear()
+        return self
+
+    def apdu(self, apdu: list) -> 'CommandPlan':
+        '''
+        Adds a wrapped DESFire APDU, as sent by `send_raw_apdu`. `apdu` may contain `Field`s.
+        '''
+        return self.command(*APDU_COMMAND, apdu)
+
+    def compile(self, addr: int) -> list:
+        '''
+        Builds (once per address) and returns the frames for every step.
+        '''
+        if addr not in self._compiled:
+            compiled = []
+            for cm, pm, data in self.steps:
+                flat, fields = [], []
+                for item in data:
+                    if isinstance(item, Field):
+                        fields.append((item.name, DATA_OFFSET + len(flat), item.length))
+                        flat += [0x00] * item.length
+                    else:
+                        flat.append(item)
+                frame = bytes(build_frame(addr, cm, pm, flat))
+                compiled.append((frame, fields, (cm, pm) == APDU_COMMAND))
+            self._compiled[addr] = compiled
+        return self._compiled[addr]
+
+    def run(self, dispenser, **values) -> list:
+        '''
+        Runs every step on `dispenser`, filling each `Field` from `values`. Stops after
+        the first step that fails, so the last response tells whether the plan completed.
+
+        Returns the `Response` (or `APDU_Response`, for APDU steps) of each step that ran.
+        '''
+        responses = []
+        with dispenser.serial_context:
+            try:
+                for frame, fields, is_apdu in self.compile(dispenser.addr):
+                    if fields:
+                        frame = bytearray(frame)
+                        for name, start, length in fields:
+                            value = values[name]
+                            if len(value) != length:
+                                raise Exception(f'{name} must be {length} bytes long, not {len(value)}')
+                            frame[start:start + length] = value
+                            #   The placeholder bytes were zero, so the BCC only changes by the new ones
+                            frame[-1] ^= bcc(value)
+
+                    raw_response = dispenser._exchange(frame)
+                    response = APDU_Response(raw_response) if is_apdu else Response(raw_response)
+                    responses.append(response)
+                    if not raw_response or not response.is_successful():
+                        break
+            finally:
+                #   The steps bypass the commands that keep the card session up to date,
+                #   so whatever it held is stale once any of them ran, even if one then failed
+                dispenser.card_session.reset()
+        return responses
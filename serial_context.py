@@ -1,16 +1,71 @@
 import serial
-from serial import EIGHTBITS, STOPBITS_ONE, PARITY_NONE
+from serial import EIGHTBITS, STOPBITS_ONE, PARITY_NONE, SerialTimeoutException
+from time import monotonic, sleep
 
 
 class SerialContext(serial.Serial):
-    def __init__(self, *args, **kwargs):
+    '''
+    A `serial.Serial` that opens the port on `__enter__` and closes it on `__exit__`.
+
+    Entries are reference counted: nested `with` blocks reuse the handle opened by the
+    outermost block, and only the outermost `__exit__` closes it. When `persistent` is
+    set the port stays open after the last block exits, so a long-lived session can
+    share one OS handle across any number of commands.
+    '''
+
+    def __init__(self, *args, persistent: bool = False, **kwargs):
         super().__init__(*args, **kwargs)
         self.bytesize = EIGHTBITS
         self.stopbits = STOPBITS_ONE
         self.parity = PARITY_NONE
+        self.persistent = persistent
+        self.depth = 0
 
     def __enter__(self, *args, **kwargs):
-        self.open()
+        if not self.is_open:
+            self.open()
+        self.depth += 1
+        return self
 
     def __exit__(self, *args, **kwargs):
-        self.close()
+        self.depth -= 1
+        if self.depth == 0 and not self.persistent:
+            self.close()
+
+    def reopen(self) -> None:
+        '''
+        Closes and reopens the port, e.g. after a USB adapter has dropped off the bus.
+        The reference count is left untouched so enclosing `with` blocks keep working.
+        '''
+        try:
+            self.close()
+        except serial.SerialException:
+            pass
+        self.open()
+
+    @property
+    def byte_time(self) -> float:
+        '''
+        Seconds it takes to put one byte on the wire (start bit, 8 data bits, stop bit).
+        '''
+        return 10 / self.baudrate
+
+    def drain(self, timeout: float = None) -> None:
+        '''
+        Blocks until the driver has put every queued byte on the wire.
+        With a `timeout`, sleeps for roughly the wire time of whatever is still queued
+        between checks and raises `SerialTimeoutException` once `timeout` seconds pass.
+        Without one, defers to the driver's own (unbounded) drain.
+        '''
+        if timeout is None:
+            self.flush()
+            return
+
+        deadline = monotonic() + timeout
+        pending = self.out_waiting
+        while pending:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise SerialTimeoutException(f'{pending} bytes still queued after {timeout}s')
+            sleep(min(pending * self.byte_time, remaining))
+            pending = self.out_waiting
@@ -0,0 +1,624 @@
+import random
+from Crypto.Cipher import AES, DES
+from Crypto.Hash import CMAC
+from ..api.utils.checksum import crc32
+
+
+#   NOTE: this is a behavioural model of a MIFARE DESFire EV1 card, written against the
+#   same sources as the rest of this package (see README). It speaks ISO 7816-4 wrapped
+#   native commands:
+#
+#           [0x90, INS, 0x00, 0x00, (Lc, DATA...), 0x00]  ->  [(DATA...), 0x91, STATUS]
+#
+#   Communication settings are recorded but all traffic is plain. Responses carry an
+#   8-byte CMAC while an AES session is active, as they do on a real card (the MAC is
+#   computed without IV chaining; nothing in this package verifies it).
+
+#   Status codes (SW2)
+OPERATION_OK = 0x00
+OUT_OF_EEPROM = 0x0E
+ILLEGAL_COMMAND = 0x1C
+INTEGRITY_ERROR = 0x1E
+NO_SUCH_KEY = 0x40
+LENGTH_ERROR = 0x7E
+PERMISSION_DENIED = 0x9D
+PARAMETER_ERROR = 0x9E
+APPLICATION_NOT_FOUND = 0xA0
+AUTHENTICATION_ERROR = 0xAE
+ADDITIONAL_FRAME = 0xAF
+BOUNDARY_ERROR = 0xBE
+DUPLICATE_ERROR = 0xDE
+FILE_NOT_FOUND = 0xF0
+
+#   File types, as reported by GetFileSettings
+STANDARD_DATA_FILE = 0x00
+VALUE_FILE = 0x02
+CYCLIC_RECORD_FILE = 0x04
+
+#   Largest payload the card puts in (or accepts in) a single frame
+MAX_FRAME_DATA = 59
+
+PICC_AID = b'\x00\x00\x00'
+FREE_ACCESS = 0x0E
+NO_ACCESS = 0x0F
+
+
+def _le(data) -> int:
+    return int.from_bytes(data, 'little')
+
+
+class CardError(Exception):
+    '''
+    Raised inside command handlers to answer with a DESFire status code.
+    '''
+
+    def __init__(self, status: int):
+        super().__init__(f'{status:#04x}')
+        self.status = status
+
+
+class Key:
+    def __init__(self, value: bytes, version: int = 0):
+        self.value = bytes(value)
+        self.version = version
+
+    @property
+    def engine(self):
+        return AES if len(self.value) == 16 else DES
+
+
+class File:
+    def __init__(self, file_type: int, comms: int, access_rights: bytes):
+        self.file_type = file_type
+        self.comms = comms
+        self.access_rights = bytes(access_rights)
+
+    def key_for(self, right: str) -> int:
+        '''
+        Returns the key number guarding `right` ('read', 'write', 'read_write' or 'change').
+        Access rights arrive LSB first: [(RW << 4) | CHANGE, (R << 4) | W].
+        '''
+        lo, hi = self.access_rights
+        return {'read': hi >> 4, 'write': hi & 0x0F,
+                'read_write': lo >> 4, 'change': lo & 0x0F}[right]
+
+
+class StandardDataFile(File):
+    def __init__(self, comms, access_rights, size: int):
+        super().__init__(STANDARD_DATA_FILE, comms, access_rights)
+        self.data = bytearray(size)
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def settings(self) -> bytes:
+        return bytes([self.file_type, self.comms]) + self.access_rights + \
+            self.size.to_bytes(3, 'little')
+
+
+class ValueFile(File):
+    def __init__(self, comms, access_rights, lower: int, upper: int, value: int, limited_credit: int):
+        super().__init__(VALUE_FILE, comms, access_rights)
+        self.lower = lower
+        self.upper = upper
+        self.value = value
+        self.limited_credit = limited_credit
+        self.size = 4
+
+    def settings(self) -> bytes:
+        return bytes([self.file_type, self.comms]) + self.access_rights + \
+            self.lower.to_bytes(4, 'little', signed=True) + \
+            self.upper.to_bytes(4, 'little', signed=True) + \
+            (0).to_bytes(4, 'little') + bytes([self.limited_credit])
+
+
+class CyclicRecordFile(File):
+    def __init__(self, comms, access_rights, record_size: int, max_records: int):
+        super().__init__(CYCLIC_RECORD_FILE, comms, access_rights)
+        self.record_size = record_size
+        self.max_records = max_records
+        #   Oldest first. One slot is always kept free for the next write, as on a real card.
+        self.records = []
+        self.size = record_size * max_records
+
+    def settings(self) -> bytes:
+        return bytes([self.file_type, self.comms]) + self.access_rights + \
+            self.record_size.to_bytes(3, 'little') + \
+            self.max_records.to_bytes(3, 'little') + \
+            len(self.records).to_bytes(3, 'little')
+
+
+class Application:
+    def __init__(self, key_settings: int, app_settings: int):
+        self.key_settings = key_settings
+        self.app_settings = app_settings
+        key_length = 16 if app_settings & 0x80 else 8
+        self.keys = [Key(bytes(key_length)) for _ in range(app_settings & 0x0F)]
+        self.files = {}
+
+
+class VirtualDesfireCard:
+    '''
+    A virtual DESFire EV1 card. Supports applications, standard data, value and cyclic
+    record files, AES and DES three-pass authentication (as performed by
+    `api/desfire/auth.py`), key changes (as built by `security_commands._change_key`)
+    and transactions.
+
+    `process()` takes a wrapped APDU and returns the card's response bytes.
+    '''
+
+    def __init__(self, uid: bytes = None, master_key: bytes = bytes(8),
+                 capacity: int = 8192, seed: int = None):
+        self.rng = random.Random(seed)
+        self.uid = bytes(uid) if uid else bytes([0x04]) + self.rng.randbytes(6)
+        self.picc_key = Key(master_key)
+        self.picc_key_settings = 0x0F
+        self.capacity = capacity
+        self.applications = {}
+        self.reset()
+
+    def reset(self) -> None:
+        '''
+        Drops all volatile state, as happens when the card leaves the field.
+        '''
+        self.aid = PICC_AID
+        self.authenticated_key = None
+        self.session_key = None
+        self.continuation = None
+        self._clear_transaction()
+
+    #   Helpers
+
+    @property
+    def application(self) -> Application:
+        return self.applications.get(self.aid)
+
+    @property
+    def free_memory(self) -> int:
+        used = sum(f.size for app in self.applications.values() for f in app.files.values())
+        return self.capacity - used
+
+    def _key(self, key_number: int) -> Key:
+        #   At card level the upper bits of the key number flag the key type
+        key_number &= 0x0F
+        if self.aid == PICC_AID:
+            if key_number:
+                raise CardError(NO_SUCH_KEY)
+            return self.picc_key
+        keys = self.application.keys
+        if key_number >= len(keys):
+            raise CardError(NO_SUCH_KEY)
+        return keys[key_number]
+
+    def _change_key_access(self, key_number: int) -> int:
+        '''
+        Returns the key that must be authenticated to change `key_number`, following
+        the ChangeKey access nibble of the application's key settings.
+        '''
+        if self.aid == PICC_AID or key_number == 0:
+            return 0
+        access = self.application.key_settings >> 4
+        if access == 0x0E:
+            return key_number
+        if access == 0x0F:
+            return NO_ACCESS
+        return access
+
+    def _require_key(self, key_number: int) -> None:
+        if key_number == FREE_ACCESS:
+            return
+        if key_number == NO_ACCESS or self.authenticated_key != key_number:
+            raise CardError(PERMISSION_DENIED)
+
+    def _require_master(self, settings: int, free_bit: int) -> None:
+        if not settings & free_bit:
+            self._require_key(0)
+
+    def _require_application(self) -> Application:
+        if self.aid == PICC_AID:
+            raise CardError(PERMISSION_DENIED)
+        return self.application
+
+    def _file(self, fileno: int, file_type: int = None) -> File:
+        app = self._require_application()
+        if fileno not in app.files:
+            raise CardError(FILE_NOT_FOUND)
+        file = app.files[fileno]
+        if file_type is not None and file.file_type != file_type:
+            raise CardError(PARAMETER_ERROR)
+        return file
+
+    def _require_access(self, file: File, *rights) -> None:
+        keys = [file.key_for(right) for right in rights + ('read_write',)]
+        if FREE_ACCESS in keys or self.authenticated_key in keys:
+            return
+        raise CardError(PERMISSION_DENIED)
+
+    def _new_file(self, fileno: int, file: File) -> None:
+        app = self._require_application()
+        self._require_master(app.key_settings, 0x04)
+        if fileno in app.files:
+            raise CardError(DUPLICATE_ERROR)
+        if file.size > self.free_memory:
+            raise CardError(OUT_OF_EEPROM)
+        app.files[fileno] = file
+
+    def _clear_transaction(self) -> None:
+        #   Record writes waiting for CommitTransaction, and uncommitted value changes per file
+        self.pending = []
+        self.deltas = {}
+
+    def _deauthenticate(self) -> None:
+        self.authenticated_key = None
+        self.session_key = None
+
+    def _chunked(self, payload: bytes) -> tuple:
+        '''
+        Returns the first frame of `payload` and arranges for the rest to follow on
+        ADDITIONAL FRAME requests.
+        '''
+        if len(payload) <= MAX_FRAME_DATA:
+            return payload, OPERATION_OK
+
+        def more(_):
+            return self._chunked(payload[MAX_FRAME_DATA:])
+
+        self.continuation = more
+        return payload[:MAX_FRAME_DATA], ADDITIONAL_FRAME
+
+    def _collect(self, expected: int, received: bytes, apply) -> tuple:
+        '''
+        Accumulates chained command data until `expected` bytes have arrived,
+        then calls `apply(data)`.
+        '''
+        if len(received) > expected:
+            raise CardError(LENGTH_ERROR)
+        if len(received) == expected:
+            apply(received)
+            return b'', OPERATION_OK
+
+        def more(data):
+            return self._collect(expected, received + data, apply)
+
+        self.continuation = more
+        return b'', ADDITIONAL_FRAME
+
+    #   Dispatch
+
+    def process(self, apdu) -> bytes:
+        apdu = bytes(apdu)
+        if len(apdu) < 5 or apdu[0] != 0x90:
+            return bytes([0x6E, 0x00])
+        ins = apdu[1]
+        data = apdu[5:5 + apdu[4]]
+
+        continuation, self.continuation = self.continuation, None
+        session_key = self.session_key
+        try:
+            if ins == ADDITIONAL_FRAME:
+                if continuation is None:
+                    raise CardError(ILLEGAL_COMMAND)
+                payload, status = continuation(data)
+            else:
+                handler = self.commands.get(ins)
+                if handler is None:
+                    raise CardError(ILLEGAL_COMMAND)
+                payload, status = handler(self, data)
+        except CardError as e:
+            self.continuation = None
+            if e.status == AUTHENTICATION_ERROR:
+                self._deauthenticate()
+            return bytes([0x91, e.status])
+        except (IndexError, ValueError):
+            self.continuation = None
+            return bytes([0x91, LENGTH_ERROR])
+
+        #   Only responses within an established (and still valid) AES session are MACed
+        if status == OPERATION_OK and session_key and session_key == self.session_key \
+                and len(session_key) == 16:
+            payload = bytes(payload) + CMAC.new(session_key, bytes(payload) + bytes([status]),
+                                                ciphermod=AES).digest()[:8]
+        return bytes(payload) + bytes([0x91, status])
+
+    #   Card level commands
+
+    def get_version(self, data):
+        hardware = bytes([0x04, 0x01, 0x01, 0x01, 0x00, 0x1A, 0x05])
+        software = bytes([0x04, 0x01, 0x01, 0x01, 0x04, 0x1A, 0x05])
+        production = self.uid + bytes(5) + bytes([0x01, 0x23])
+
+        def third_frame(_):
+            return production, OPERATION_OK
+
+        def second_frame(_):
+            self.continuation = third_frame
+            return software, ADDITIONAL_FRAME
+
+        self.continuation = second_frame
+        return hardware, ADDITIONAL_FRAME
+
+    def get_application_ids(self, data):
+        if self.aid != PICC_AID:
+            raise CardError(PERMISSION_DENIED)
+        self._require_master(self.picc_key_settings, 0x02)
+        return b''.join(self.applications), OPERATION_OK
+
+    def select_application(self, data):
+        aid = bytes(data[:3])
+        if len(aid) != 3:
+            raise CardError(LENGTH_ERROR)
+        if aid != PICC_AID and aid not in self.applications:
+            raise CardError(APPLICATION_NOT_FOUND)
+        self.aid = aid
+        self._clear_transaction()
+        self._deauthenticate()
+        return b'', OPERATION_OK
+
+    def create_application(self, data):
+        if self.aid != PICC_AID:
+            raise CardError(PERMISSION_DENIED)
+        aid, key_settings, app_settings = bytes(data[:3]), data[3], data[4]
+        self._require_master(self.picc_key_settings, 0x04)
+        if aid in self.applications:
+            raise CardError(DUPLICATE_ERROR)
+        if not 1 <= app_settings & 0x0F <= 14:
+            raise CardError(PARAMETER_ERROR)
+        self.applications[aid] = Application(key_settings, app_settings)
+        return b'', OPERATION_OK
+
+    def delete_application(self, data):
+        aid = bytes(data[:3])
+        if self.aid != PICC_AID:
+            raise CardError(PERMISSION_DENIED)
+        self._require_key(0)
+        if aid not in self.applications:
+            raise CardError(APPLICATION_NOT_FOUND)
+        del self.applications[aid]
+        return b'', OPERATION_OK
+
+    def format_picc(self, data):
+        if self.aid != PICC_AID:
+            raise CardError(PERMISSION_DENIED)
+        self._require_key(0)
+        self.applications = {}
+        return b'', OPERATION_OK
+
+    #   Security commands
+
+    def _authenticate(self, data, engine):
+        key_number = data[0]
+        key = self._key(key_number)
+        self._deauthenticate()
+        if key.engine is not engine:
+            raise CardError(AUTHENTICATION_ERROR)
+
+        block = engine.block_size
+        random_b = self.rng.randbytes(block)
+        challenge = engine.new(key.value, engine.MODE_CBC, iv=bytes(block)).encrypt(random_b)
+
+        def second_pass(submission):
+            if len(submission) != 2 * block:
+                raise CardError(LENGTH_ERROR)
+            plain = engine.new(key.value, engine.MODE_CBC, iv=challenge).decrypt(submission)
+            random_a, random_b_prime = plain[:block], plain[block:]
+            if random_b_prime != random_b[1:] + random_b[:1]:
+                raise CardError(AUTHENTICATION_ERROR)
+            answer = engine.new(key.value, engine.MODE_CBC, iv=submission[-block:]).encrypt(
+                random_a[1:] + random_a[:1])
+            self.authenticated_key = key_number & 0x0F
+            if engine is AES:
+                self.session_key = random_a[:4] + random_b[:4] + random_a[-4:] + random_b[-4:]
+            else:
+                self.session_key = random_a[:4] + random_b[:4]
+            return answer, OPERATION_OK
+
+        self.continuation = second_pass
+        return challenge, ADDITIONAL_FRAME
+
+    def aes_authenticate(self, data):
+        return self._authenticate(data, AES)
+
+    def des_authenticate(self, data):
+        return self._authenticate(data, DES)
+
+    def change_key(self, data):
+        if self.session_key is None:
+            raise CardError(PERMISSION_DENIED)
+        key_number, ciphertext = data[0], bytes(data[1:])
+        engine = AES if len(self.session_key) == 16 else DES
+        if len(ciphertext) % engine.block_size:
+            raise CardError(LENGTH_ERROR)
+        plain = engine.new(self.session_key, engine.MODE_CBC,
+                           iv=bytes(len(self.session_key))).decrypt(ciphertext)
+
+        padding = 11 if engine is AES else 3
+        new_key = plain[:len(plain) - padding - 5]
+        version = plain[len(new_key)]
+        checksum = plain[len(new_key) + 1:len(new_key) + 5]
+        expected = crc32(bytes((0xC4, key_number)) + new_key + bytes((version,)))
+        if _le(checksum) != expected:
+            raise CardError(INTEGRITY_ERROR)
+
+        key = self._key(key_number)
+        self._require_key(self._change_key_access(key_number & 0x0F))
+        if self.aid != PICC_AID and len(new_key) != len(key.value):
+            raise CardError(PARAMETER_ERROR)
+        key.value, key.version = bytes(new_key), version
+
+        if key_number & 0x0F == self.authenticated_key:
+            self._deauthenticate()
+        return b'', OPERATION_OK
+
+    def get_key_version(self, data):
+        return bytes([self._key(data[0]).version]), OPERATION_OK
+
+    def get_key_settings(self, data):
+        if self.aid == PICC_AID:
+            return bytes([self.picc_key_settings, 0x01]), OPERATION_OK
+        app = self.application
+        return bytes([app.key_settings, app.app_settings]), OPERATION_OK
+
+    #   File commands
+
+    def get_file_ids(self, data):
+        return bytes(sorted(self._require_application().files)), OPERATION_OK
+
+    def create_standard_data_file(self, data):
+        fileno, comms, access = data[0], data[1], bytes(data[2:4])
+        self._new_file(fileno, StandardDataFile(comms, access, _le(data[4:7])))
+        return b'', OPERATION_OK
+
+    def create_value_file(self, data):
+        if len(data) < 17:
+            raise CardError(LENGTH_ERROR)
+        fileno, comms, access = data[0], data[1], bytes(data[2:4])
+        lower, upper, value = (int.from_bytes(data[i:i + 4], 'little', signed=True)
+                               for i in (4, 8, 12))
+        if not lower <= value <= upper:
+            raise CardError(BOUNDARY_ERROR)
+        self._new_file(fileno, ValueFile(comms, access, lower, upper, value, data[16]))
+        return b'', OPERATION_OK
+
+    def create_cyclic_record_file(self, data):
+        if len(data) < 10:
+            raise CardError(LENGTH_ERROR)
+        fileno, comms, access = data[0], data[1], bytes(data[2:4])
+        record_size, max_records = _le(data[4:7]), _le(data[7:10])
+        if record_size < 1 or max_records < 2:
+            raise CardError(PARAMETER_ERROR)
+        self._new_file(fileno, CyclicRecordFile(comms, access, record_size, max_records))
+        return b'', OPERATION_OK
+
+    def delete_file(self, data):
+        app = self._require_application()
+        self._require_master(app.key_settings, 0x04)
+        self._file(data[0])
+        del app.files[data[0]]
+        return b'', OPERATION_OK
+
+    def get_file_settings(self, data):
+        return self._file(data[0]).settings(), OPERATION_OK
+
+    #   Data commands
+
+    def read_data(self, data):
+        file = self._file(data[0], STANDARD_DATA_FILE)
+        self._require_access(file, 'read', 'write')
+        offset, length = _le(data[1:4]), _le(data[4:7])
+        if length == 0:
+            length = file.size - offset
+        if offset + length > file.size or length < 0:
+            raise CardError(BOUNDARY_ERROR)
+        return self._chunked(bytes(file.data[offset:offset + length]))
+
+    def write_data(self, data):
+        file = self._file(data[0], STANDARD_DATA_FILE)
+        self._require_access(file, 'write')
+        offset, length = _le(data[1:4]), _le(data[4:7])
+        if offset + length > file.size:
+            raise CardError(BOUNDARY_ERROR)
+
+        def apply(payload):
+            file.data[offset:offset + length] = payload
+
+        return self._collect(length, bytes(data[7:]), apply)
+
+    def write_record(self, data):
+        file = self._file(data[0], CYCLIC_RECORD_FILE)
+        self._require_access(file, 'write')
+        offset, length = _le(data[1:4]), _le(data[4:7])
+        if offset + length > file.record_size:
+            raise CardError(BOUNDARY_ERROR)
+
+        def apply(payload):
+            def commit():
+                record = bytearray(file.record_size)
+                record[offset:offset + length] = payload
+                file.records.append(record)
+                del file.records[:-(file.max_records - 1)]
+            self.pending.append(commit)
+
+        return self._collect(length, bytes(data[7:]), apply)
+
+    def read_records(self, data):
+        file = self._file(data[0], CYCLIC_RECORD_FILE)
+        self._require_access(file, 'read', 'write')
+        newest, count = _le(data[1:4]), _le(data[4:7])
+        available = len(file.records) - newest
+        if available <= 0 or count > available:
+            raise CardError(BOUNDARY_ERROR)
+        count = count or available
+        end = len(file.records) - newest
+        return self._chunked(b''.join(file.records[end - count:end]))
+
+    def get_value(self, data):
+        file = self._file(data[0], VALUE_FILE)
+        self._require_access(file, 'read', 'write')
+        return file.value.to_bytes(4, 'little', signed=True), OPERATION_OK
+
+    def _change_value(self, data, delta: int) -> tuple:
+        file = self._file(data[0], VALUE_FILE)
+        if len(data) < 5:
+            raise CardError(LENGTH_ERROR)
+        amount = int.from_bytes(data[1:5], 'little', signed=True)
+        if amount < 0:
+            raise CardError(PARAMETER_ERROR)
+
+        #   Limits apply to the value including changes not yet committed
+        delta = self.deltas.get(file, 0) + delta * amount
+        if not file.lower <= file.value + delta <= file.upper:
+            raise CardError(BOUNDARY_ERROR)
+        self.deltas[file] = delta
+        return b'', OPERATION_OK
+
+    def credit(self, data):
+        self._require_access(self._file(data[0], VALUE_FILE))
+        return self._change_value(data, 1)
+
+    def debit(self, data):
+        self._require_access(self._file(data[0], VALUE_FILE), 'read', 'write')
+        return self._change_value(data, -1)
+
+    def commit_transaction(self, data):
+        pending, deltas = self.pending, self.deltas
+        self._clear_transaction()
+        for commit in pending:
+            commit()
+        for file, delta in deltas.items():
+            file.value += delta
+        return b'', OPERATION_OK
+
+    def abort_transaction(self, data):
+        self._clear_transaction()
+        return b'', OPERATION_OK
+
+    commands = {
+        0x60: get_version,
+        0x6A: get_application_ids,
+        0x5A: select_application,
+        0xCA: create_application,
+        0xDA: delete_application,
+        0xFC: format_picc,
+        0xAA: aes_authenticate,
+        0x1A: des_authenticate,
+        0x0A: des_authenticate,
+        0xC4: change_key,
+        0x64: get_key_version,
+        0x45: get_key_settings,
+        0x6F: get_file_ids,
+        0xCD: create_standard_data_file,
+        0xCC: create_value_file,
+        0xC0: create_cyclic_record_file,
+        0xDF: delete_file,
+        0xF5: get_file_settings,
+        0xBD: read_data,
+        0x3D: write_data,
+        0x3B: write_record,
+        0xBB: read_records,
+        0x6C: get_value,
+        0x0C: credit,
+        0xDC: debit,
+        0xC7: commit_transaction,
+        0xA7: abort_transaction,
+    }
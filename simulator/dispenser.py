@@ -0,0 +1,202 @@
+import random
+from ..api.constants.command_codes import *
+from ..api.utils.checksum import bcc
+from .desfire import VirtualDesfireCard
+
+
+#   NOTE: replies are constructed according to the convention:
+#
+#           [ACK] + [STX, ADDR, LENH, LENL] + [PMT, CM, PM, ST0, ST1, ST2, (DATA), ETX] + [BCC]
+#           [ACK] + [STX, ADDR, LENH, LENL] + [EMT, CM, PM, E1, E0, ETX] + [BCC]
+#
+#   See api/constants/status_codes.py and api/constants/error_codes.py for the meaning
+#   of the status and error bytes.
+
+PARAM_RF_APDU = 0x34
+
+#   Error codes, see api/constants/error_codes.py
+ERROR_UNDEFINED_COMMAND = 0x3030
+ERROR_PARAMETER = 0x3031
+ERROR_SEQUENCE = 0x3032
+ERROR_IC_CARD_DEACTIVATED = 0x3635
+ERROR_IC_CARD_ACTIVATION = 0x3631
+ERROR_STACKER_EMPTY = 0x4130
+ERROR_CAPTURE_BOX_FULL = 0x4131
+ERROR_NOT_RESET = 0x4230
+
+#   Card positions
+NO_CARD = None
+FRONT = 'front'
+GATE = 'gate'
+IC = 'IC'
+RF = 'RF'
+
+MOVE_POSITIONS = {0x30: FRONT, 0x31: IC, 0x32: RF, 0x33: 'capture', 0x39: GATE}
+INIT_POSITIONS = {0x30: FRONT, 0x31: 'capture', 0x33: None,
+                  0x34: FRONT, 0x35: 'capture', 0x37: None}
+
+
+class DeviceError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f'{code:#06x}')
+        self.code = code
+
+
+class SimulatedDispenser:
+    '''
+    A virtual SK-AD3 unit. Cards are issued from a stacker of `stacker` cards, each one a
+    fresh card from `card_factory` (a `VirtualDesfireCard` by default), and can be moved
+    between the front, gate, RF/IC positions and the capture box.
+
+    `baudrate` is the rate the unit is configured for; frames sent at any other rate are
+    treated as line noise and go unanswered. `latency` maps command codes (e.g.
+    `COMMAND_MOVE_CARD`) to the seconds the unit spends executing them, on top of the
+    transport's own timing. `ack_rate` is the fraction of replies that are preceded by
+    an ACK (see SK_AD3._read).
+    '''
+
+    def __init__(self, addr: int = 0x00, baudrate: int = 9600,
+                 stacker: int = 100, capture_box_capacity: int = 50, stacker_low: int = 10,
+                 card_factory=VirtualDesfireCard, latency: dict = None,
+                 ack_rate: float = 0.99, seed: int = 0):
+        self.addr = addr
+        self.baudrate = baudrate
+        self.stacker = stacker
+        self.stacker_low = stacker_low
+        self.capture_box = 0
+        self.capture_box_capacity = capture_box_capacity
+        self.card_factory = card_factory
+        self.latency = latency or {}
+        self.ack_rate = ack_rate
+        self.rng = random.Random(seed)
+
+        self.initialised = False
+        self.allow_insertion = False
+        self.position = NO_CARD
+        self.card = None
+        self.card_active = False
+
+    def status(self) -> list:
+        if self.position is NO_CARD:
+            st0 = 0x30
+        elif self.position in (RF, IC):
+            st0 = 0x32
+        else:
+            st0 = 0x31
+        if self.stacker == 0:
+            st1 = 0x30
+        elif self.stacker <= self.stacker_low:
+            st1 = 0x31
+        else:
+            st1 = 0x32
+        st2 = 0x31 if self.capture_box >= self.capture_box_capacity else 0x30
+        return [st0, st1, st2]
+
+    def take_card(self):
+        '''
+        Simulates a customer removing the card presented at the front.
+        Returns the card, or None if there was none to take.
+        '''
+        if self.position not in (FRONT, GATE):
+            return None
+        card, self.card, self.position = self.card, None, NO_CARD
+        return card
+
+    def handle(self, frame: bytes) -> tuple:
+        '''
+        Processes one inbound frame. Returns `(reply, seconds)` where `reply` is the bytes
+        the unit sends back (None for no reply at all) and `seconds` is how long the unit
+        takes to produce it.
+        '''
+        if len(frame) < 9 or frame[0] != STX or frame[-2] != ETX \
+                or bcc(frame) != 0 \
+                or (frame[2] << 8) + frame[3] != len(frame) - 6:
+            return bytes([NAK]), 0.0
+
+        cm, pm, data = frame[5], frame[6], frame[7:-2]
+        try:
+            text = [PMT, cm, pm] + self.status() + list(self.execute(cm, pm, data))
+        except DeviceError as e:
+            text = [EMT, cm, pm, e.code >> 8, e.code & 0xFF]
+
+        buffer = [STX, self.addr, len(text) >> 8, len(text) & 0xFF] + text + [ETX]
+        buffer += [bcc(buffer)]
+        if self.rng.random() < self.ack_rate:
+            buffer = [ACK] + buffer
+        return bytes(buffer), self.latency.get(cm, 0.0)
+
+    def execute(self, cm: int, pm: int, data: bytes) -> bytes:
+        if cm == COMMAND_INIT:
+            return self._init(pm)
+        if cm == COMMAND_STATUS_SENSE:
+            if pm not in (PARAM_UPDATE_STATUS_ONLY, PARAM_PROVIDE_STATUS_INFO):
+                raise DeviceError(ERROR_PARAMETER)
+            return b''
+        if not self.initialised:
+            raise DeviceError(ERROR_NOT_RESET)
+        if cm == COMMAND_MOVE_CARD:
+            return self._move(pm)
+        if cm == COMMAND_SET_INSERTION:
+            if pm not in (PARAM_ALLOW_INSERTION, PARAM_DENY_INSERTION):
+                raise DeviceError(ERROR_PARAMETER)
+            self.allow_insertion = pm == PARAM_ALLOW_INSERTION
+            return b''
+        if cm == COMMAND_AUTO_TEST_CARD_TYPE:
+            if pm != PARAM_TEST_RF_CARD:
+                raise DeviceError(ERROR_PARAMETER)
+            #   '20': Type A CPU card, '00': unknown / no card
+            return b'20' if self.position == RF else b'00'
+        if cm == COMMAND_RF_CARD_OPERATION:
+            return self._rf(pm, data)
+        raise DeviceError(ERROR_UNDEFINED_COMMAND)
+
+    def _init(self, pm: int) -> bytes:
+        if pm not in INIT_POSITIONS:
+            raise DeviceError(ERROR_PARAMETER)
+        self.initialised = True
+        self.card_active = False
+        if self.card is not None and INIT_POSITIONS[pm] is not None:
+            self._place(INIT_POSITIONS[pm])
+        return b''
+
+    def _move(self, pm: int) -> bytes:
+        if pm not in MOVE_POSITIONS:
+            raise DeviceError(ERROR_PARAMETER)
+        position = MOVE_POSITIONS[pm]
+        if self.card is None:
+            if position == 'capture':
+                raise DeviceError(ERROR_SEQUENCE)
+            if self.stacker == 0:
+                raise DeviceError(ERROR_STACKER_EMPTY)
+            self.stacker -= 1
+            self.card = self.card_factory()
+        self._place(position)
+        return b''
+
+    def _place(self, position: str) -> None:
+        self.card_active = False
+        if self.card is not None:
+            self.card.reset()
+        if position == 'capture':
+            if self.capture_box >= self.capture_box_capacity:
+                raise DeviceError(ERROR_CAPTURE_BOX_FULL)
+            self.capture_box += 1
+            self.card, self.position = None, NO_CARD
+        else:
+            self.position = position
+
+    def _rf(self, pm: int, data: bytes) -> bytes:
+        if pm == PARAM_ACTIVATE_RF_CARD:
+            if self.position != RF:
+                raise DeviceError(ERROR_IC_CARD_ACTIVATION)
+            self.card.reset()
+            self.card_active = True
+            return self.card.uid
+        if pm == PARAM_DEACTIVATE_RF_CARD:
+            self.card_active = False
+            return b''
+        if pm == PARAM_RF_APDU:
+            if not self.card_active:
+                raise DeviceError(ERROR_IC_CARD_DEACTIVATED)
+            return self.card.process(data)
+        raise DeviceError(ERROR_PARAMETER)
@@ -0,0 +1,79 @@
+from time import monotonic
+from .transport import SimulatedTransport
+from ..api.link.trace import TX, RX, TraceRecord, read_trace, trace_files, trace_start
+
+
+class ReplayTransport(SimulatedTransport):
+    '''
+    Plays a recorded trace (see `api.link.trace.TraceRecorder`) back to `SK_AD3` in
+    place of a serial port::
+
+        transport = ReplayTransport('unit7.trace')
+        dispenser = SK_AD3(transport=transport)
+        dispenser.get_status()      # answered exactly as the unit answered then
+
+    Each frame the host writes is matched against the next one written in the trace,
+    and answered with the bytes that were read after it. By default the answers are
+    available immediately, so a session replays as fast as the host code can run; with
+    `realtime` they arrive with the recorded delays after each write.
+
+    With `strict`, a frame that differs from the recorded one raises an Exception, as
+    does writing past the end of the trace. Otherwise the recorded answer is replayed
+    regardless, and writes past the end go unanswered.
+
+    Authentication depends on fresh random numbers, so its frames never match a trace;
+    replay the parts of a session around it, or use `strict=False` to profile it anyway.
+
+    `path` may be a trace file, the base name of a rotated trace (all of whose files are
+    replayed, oldest first), or an iterable of `TraceRecord`s.
+    '''
+
+    def __init__(self, path, realtime: bool = False, strict: bool = True, **kwargs):
+        super().__init__(byte_latency=0, **kwargs)
+        self.realtime = realtime
+        self.strict = strict
+        self._records = iter(_records(path) if isinstance(path, str) else path)
+        self._next = next(self._records, None)
+        #   Frames written so far, for error messages
+        self.frames = 0
+        #   Bytes read before the first write belong to no exchange; replay them straight away
+        self._answer(monotonic(), None)
+
+    def write(self, data) -> int:
+        with self._condition:
+            now = monotonic()
+            record = self._next
+            if record is None:
+                if self.strict:
+                    raise Exception(f'Trace exhausted after {self.frames} frames')
+                return len(data)
+            if self.strict and bytes(data) != record.data:
+                raise Exception(f'Frame {self.frames} differs from the trace: wrote {bytes(data).hex()}, '
+                                f'recorded {record.data.hex()}')
+            self.frames += 1
+            self._next = next(self._records, None)
+            self._answer(now, record.time)
+        return len(data)
+
+    def _answer(self, now: float, written_at: float) -> None:
+        #   Queue every RX record up to the next TX, never ahead of the one before it
+        ready_at = now
+        while self._next is not None and self._next.direction == RX:
+            record = self._next
+            if self.realtime and written_at is not None:
+                ready_at = max(ready_at, now + record.time - written_at)
+            self._push(ready_at, record.data)
+            self._next = next(self._records, None)
+
+
+def _records(path: str):
+    files = trace_files(path)
+    if not files:
+        raise Exception(f'No trace at {path}')
+    #   Times restart in each file of a rotated trace; put them all on the first file's clock
+    first = trace_start(files[0])
+    for file in files:
+        offset = trace_start(file) - first
+        for record in read_trace(file):
+            if record.direction in (TX, RX):
+                yield TraceRecord(record.direction, record.time + offset, record.data)
@@ -0,0 +1,135 @@
+import heapq
+import threading
+from time import monotonic
+from ..serial_context import SerialContext
+from ..api.constants.command_codes import ACK
+from ..api.link.framing import FrameReader, COMPLETE, BAD_BCC
+
+
+class SimulatedTransport(SerialContext):
+    '''
+    A drop-in replacement for `SerialContext` that talks to one or more
+    `SimulatedDispenser`s (keyed by their `addr`) instead of a COM port::
+
+        transport = SimulatedTransport(SimulatedDispenser())
+        dispenser = SK_AD3(transport=transport)
+
+    Timing follows the wire: every byte costs `byte_latency` seconds in each direction
+    (by default the real wire time at the current baudrate, 0 for an instantaneous link),
+    and every command costs an extra `command_latency` seconds of turnaround on top of
+    any per-command latency configured on the dispenser itself.
+    '''
+
+    def __init__(self, *dispensers, byte_latency: float = None, command_latency: float = 0.0,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.dispensers = {d.addr: d for d in dispensers}
+        self.byte_latency = byte_latency
+        self.command_latency = command_latency
+        self._condition = threading.Condition(threading.RLock())
+        #   Replies not yet on the wire, as a heap of (ready_at, sequence, bytes)
+        self._pending = []
+        self._sequence = 0
+        self._rx = bytearray()
+        self._tx = FrameReader()
+        #   When the simulated line is next free for the host to transmit on
+        self._line_free_at = 0.0
+
+    #   serial.Serial overrides
+
+    def open(self) -> None:
+        self.is_open = True
+
+    def close(self) -> None:
+        self.is_open = False
+
+    def _reconfigure_port(self, *args, **kwargs) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    @property
+    def in_waiting(self) -> int:
+        with self._condition:
+            self._collect(monotonic())
+            return len(self._rx)
+
+    @property
+    def out_waiting(self) -> int:
+        return 0
+
+    def reset_input_buffer(self) -> None:
+        #   Like a UART flush, this only drops what has arrived; replies still on their
+        #   way come in afterwards
+        with self._condition:
+            self._collect(monotonic())
+            self._rx.clear()
+
+    def reset_output_buffer(self) -> None:
+        pass
+
+    def write(self, data) -> int:
+        view = memoryview(bytes(data))
+        with self._condition:
+            sent_at = max(monotonic(), self._line_free_at) + self._wire_time(len(view))
+            self._line_free_at = sent_at
+
+            while view:
+                consumed = self._tx.feed(view)
+                view = view[consumed:]
+                if self._tx.done:
+                    if self._tx.state in (COMPLETE, BAD_BCC):
+                        self._deliver(bytes(self._tx.frame), sent_at)
+                    self._tx.reset()
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = None if self.timeout is None else monotonic() + self.timeout
+        with self._condition:
+            while True:
+                now = monotonic()
+                self._collect(now)
+                if len(self._rx) >= size:
+                    break
+                wake = self._pending[0][0] if self._pending else None
+                if deadline is not None:
+                    if now >= deadline:
+                        break
+                    wake = deadline if wake is None else min(wake, deadline)
+                self._condition.wait(None if wake is None else wake - now)
+
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+            return data
+
+    #   Simulation
+
+    def _wire_time(self, length: int) -> float:
+        if self.byte_latency is None:
+            return length * self.byte_time
+        return length * self.byte_latency
+
+    def _deliver(self, frame: bytes, received_at: float) -> None:
+        dispenser = self.dispensers.get(frame[1])
+        if dispenser is None or dispenser.baudrate != self.baudrate:
+            return
+        reply, seconds = dispenser.handle(frame)
+        if reply is None:
+            return
+        turnaround = received_at + self.command_latency
+        if reply[0] == ACK and len(reply) > 1:
+            #   The unit acknowledges straight away and replies once the command has run
+            self._push(turnaround + self._wire_time(1), reply[:1])
+            reply = reply[1:]
+        self._push(turnaround + seconds + self._wire_time(len(reply)), reply)
+
+    def _push(self, ready_at: float, data: bytes) -> None:
+        with self._condition:
+            heapq.heappush(self._pending, (ready_at, self._sequence, data))
+            self._sequence += 1
+            self._condition.notify_all()
+
+    def _collect(self, now: float) -> None:
+        while self._pending and self._pending[0][0] <= now:
+            self._rx += heapq.heappop(self._pending)[2]
@@ -0,0 +1,17 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+
+#   The checkout is the `SK_AD3_Card_Dispenser` package (see the README), whatever the
+#   directory it was cloned into is called. Import it under that name before any test
+#   module does, so its relative imports resolve.
+ROOT = Path(__file__).resolve().parent.parent
+PACKAGE = 'SK_AD3_Card_Dispenser'
+
+if PACKAGE not in sys.modules:
+    spec = importlib.util.spec_from_file_location(PACKAGE, ROOT / '__init__.py',
+                                                  submodule_search_locations=[str(ROOT)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = module
+    spec.loader.exec_module(module)
@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.aio import AsyncSK_AD3
+from SK_AD3_Card_Dispenser.api.link.errors import LinkCancelled
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+#   Wrapped DESFire APDUs, sent as is with send_raw_apdu
+GET_VERSION = [0x90, 0x60, 0x00, 0x00, 0x00]
+GET_APPLICATION_IDS = [0x90, 0x6A, 0x00, 0x00, 0x00]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def make_dispenser(**latency) -> AsyncSK_AD3:
+    unit = SimulatedDispenser(latency={0x60: latency.get('apdu', 0.0)})
+    return AsyncSK_AD3(transport=SimulatedTransport(unit, byte_latency=0), read_timeout=2.0)
+
+
+def test_commands_round_trip():
+    async def main():
+        async with make_dispenser() as dispenser:
+            assert (await dispenser.init()).is_successful()
+            assert (await dispenser.move_card('RF')).is_successful()
+            status = await dispenser.get_status(timeout=5)
+            assert status.data['status']['dispenser_status']['code'] == 0x32
+    run(main())
+
+
+def test_commands_run_in_call_order():
+    async def main():
+        async with make_dispenser() as dispenser:
+            await dispenser.init()
+            responses = await asyncio.gather(dispenser.move_card('RF'), dispenser.get_status(),
+                                             dispenser.move_card('capture'), dispenser.get_status())
+            assert [r.data['status']['dispenser_status']['code'] for r in responses[1::2]] == [0x32, 0x30]
+    run(main())
+
+
+def test_timed_out_apdu_does_not_answer_the_next_one():
+    async def main():
+        async with make_dispenser(apdu=0.5) as dispenser:
+            await dispenser.init()
+            await dispenser.move_card('RF')
+            await dispenser.activate_RF_card()
+            with pytest.raises(asyncio.TimeoutError):
+                await dispenser.send_raw_apdu(GET_APPLICATION_IDS, timeout=0.15)
+            #   Get Version answers with more frames to come (91 AF), Get Application IDs with 91 00
+            assert (await dispenser.send_raw_apdu(GET_VERSION))[-4:-2] == [0x91, 0xAF]
+            assert (await dispenser.send_raw_apdu(GET_APPLICATION_IDS))[-4:-2] == [0x91, 0x00]
+    run(main())
+
+
+def test_cancelled_exchange_raises_on_the_worker():
+    async def main():
+        async with make_dispenser(apdu=0.5) as dispenser:
+            await dispenser.init()
+            await dispenser.move_card('RF')
+            future = dispenser.worker.activate_RF_card()
+            await asyncio.sleep(0.1)
+            future.abort()
+            with pytest.raises(LinkCancelled):
+                future.result(timeout=1)
+    run(main())
@@ -0,0 +1,65 @@
+import threading
+import time
+import pytest
+from SK_AD3_Card_Dispenser.bus import Bus
+from SK_AD3_Card_Dispenser.api.constants.command_codes import COMMAND_MOVE_CARD
+from SK_AD3_Card_Dispenser.api.link.errors import LinkCancelled
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+GET_VERSION = [0x90, 0x60, 0x00, 0x00, 0x00]
+GET_APPLICATION_IDS = [0x90, 0x6A, 0x00, 0x00, 0x00]
+
+
+@pytest.fixture
+def units():
+    return SimulatedDispenser(addr=0x00), SimulatedDispenser(addr=0x01)
+
+
+@pytest.fixture
+def bus(units):
+    with Bus(transport=SimulatedTransport(*units, byte_latency=0), read_timeout=2.0) as bus:
+        yield bus
+
+
+def test_replies_are_routed_by_address(bus):
+    left, right = bus.device(0x00), bus.device(0x01)
+    assert left.init().is_successful()
+    assert right.init().is_successful()
+    assert left.move_card('RF').frame[1] == 0x00
+    assert right.get_status().frame[1] == 0x01
+    assert right.get_status().data['status']['dispenser_status']['code'] == 0x30
+
+
+def test_the_line_is_released_during_moves(bus, units):
+    units[0].latency = {COMMAND_MOVE_CARD: 0.5}
+    units[0].ack_rate = 1.0
+    left, right = bus.device(0x00), bus.device(0x01)
+    assert left.init().is_successful()
+    assert right.init().is_successful()
+
+    move = threading.Thread(target=left.move_card, args=('RF',))
+    move.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    assert right.get_status().is_successful()
+    assert time.monotonic() - start < 0.3
+    move.join()
+    assert units[0].stacker == 99
+
+
+def test_aborted_apdu_does_not_answer_the_next_one(bus, units):
+    units[0].latency = {0x60: 0.5}
+    device = bus.device(0x00)
+    assert device.init().is_successful()
+    assert device.move_card('RF').is_successful()
+    assert device.activate_RF_card().is_successful()
+
+    device.abort_event = threading.Event()
+    threading.Timer(0.15, device.abort_event.set).start()
+    with pytest.raises(LinkCancelled):
+        device.send_raw_apdu(GET_APPLICATION_IDS)
+    device.abort_event = None
+    assert device.send_raw_apdu(GET_VERSION)[-4:-2] == [0x91, 0xAF]
+    assert device.send_raw_apdu(GET_APPLICATION_IDS)[-4:-2] == [0x91, 0x00]
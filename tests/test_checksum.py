@@ -0,0 +1,44 @@
+import os
+from functools import reduce
+from operator import xor
+import pytest
+from SK_AD3_Card_Dispenser.api.utils.checksum import \
+    bcc, bcc_check, crc16, crc16_bytes, crc32, crc32_bytes, BCC_FOLD_LENGTH
+
+
+CHECK = b'123456789'
+
+
+def test_crc16_check_value():
+    #   CRC_A's check value (ISO/IEC 14443-3)
+    assert crc16(CHECK) == 0xBF05
+    assert crc16_bytes(CHECK) == b'\x05\xbf'
+
+
+def test_crc32_check_value():
+    #   The IEEE 802.3 check value 0xCBF43926, without the final inversion
+    assert crc32(CHECK) == 0xCBF43926 ^ 0xFFFFFFFF
+    assert crc32_bytes(CHECK) == (0xCBF43926 ^ 0xFFFFFFFF).to_bytes(4, 'little')
+
+
+def test_crc32_keeps_leading_zero_bytes():
+    data = next(bytes((n,)) for n in range(256) if crc32(bytes((n,))) >> 24 == 0)
+    assert len(crc32_bytes(data)) == 4
+
+
+@pytest.mark.parametrize('function', (bcc, crc16, crc32))
+def test_lists_and_buffers_agree(function):
+    data = os.urandom(64)
+    assert function(data) == function(list(data)) == function(bytearray(data)) == function(memoryview(data))
+
+
+@pytest.mark.parametrize('length', (0, 1, 7, 64, BCC_FOLD_LENGTH - 1, BCC_FOLD_LENGTH,
+                                    BCC_FOLD_LENGTH + 1, 255, 1024))
+def test_bcc_is_the_xor_of_every_byte(length):
+    data = os.urandom(length)
+    assert bcc(data) == reduce(xor, data, 0)
+
+
+def test_bcc_check():
+    assert bcc_check([0x01, 0x02, 0x04], 0x07)
+    assert not bcc_check([0x01, 0x02, 0x04], 0x06)
@@ -0,0 +1,222 @@
+import io
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.api.constants.command_codes import PMT, EMT
+from SK_AD3_Card_Dispenser.api.link.errors import LinkTimeout
+from SK_AD3_Card_Dispenser.api.desfire.auth import Auth
+from SK_AD3_Card_Dispenser.api.desfire.session import CardSession, key_digest
+from SK_AD3_Card_Dispenser.api.desfire.uid import CardUID
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+from SK_AD3_Card_Dispenser.simulator.desfire import VirtualDesfireCard
+from SK_AD3_Card_Dispenser.file_objects.application import PermissiveDesfireApplication
+from SK_AD3_Card_Dispenser.file_objects.file import \
+    PermissiveStandardDataFile, PermissiveValueFile, PermissiveCyclicRecordFile
+
+
+MASTER_KEY = [0x00] * 16
+AID = [0x01, 0x02, 0x03]
+
+
+def native(ins: int, data=()) -> list:
+    '''
+    A wrapped DESFire APDU, as sent with `send_raw_apdu`.
+    '''
+    data = list(data)
+    return [0x90, ins, 0x00, 0x00] + ([len(data)] + data if data else []) + [0x00]
+
+
+def status_word(raw_response: list) -> list:
+    return raw_response[-4:-2]
+
+
+@pytest.fixture
+def unit():
+    return SimulatedDispenser(card_factory=lambda: VirtualDesfireCard(master_key=bytes(MASTER_KEY)))
+
+
+@pytest.fixture
+def dispenser(unit):
+    dispenser = SK_AD3(transport=SimulatedTransport(unit, byte_latency=0), read_timeout=1.0)
+    with dispenser.session():
+        assert dispenser.init().is_successful()
+        assert dispenser.move_card('RF').is_successful()
+        assert dispenser.activate_RF_card().is_successful()
+        yield dispenser
+
+
+@pytest.fixture
+def application(dispenser):
+    #   An AES application with one key, which needs no authentication for anything
+    assert status_word(dispenser.send_raw_apdu(native(0xCA, AID + [0x0F, 0x81]))) == [0x91, 0x00]
+    assert status_word(dispenser.send_raw_apdu(native(0x5A, AID))) == [0x91, 0x00]
+    return dispenser
+
+
+@pytest.fixture
+def commands(dispenser):
+    '''
+    `dispenser`, for tests of the DESFire commands themselves. These build their APDUs
+    with APDU Utils, so they are skipped when the submodule is not checked out.
+    '''
+    pytest.importorskip(f'{SK_AD3.__module__}.api.desfire.apdu_utils.data_commands')
+    assert dispenser.aes_authenticate(MASTER_KEY).is_successful()
+    assert dispenser.create_application(PermissiveDesfireApplication(AID)).is_successful()
+    assert dispenser.select_application(AID).is_successful()
+    assert dispenser.aes_authenticate(MASTER_KEY).is_successful()
+    return dispenser
+
+
+def test_card_uid():
+    uid = CardUID(bytes.fromhex('04a1b2c3d4e5f6'))
+    assert uid == b'\x04\xa1\xb2\xc3\xd4\xe5\xf6'
+    assert uid.text == str(uid) == '04A1B2C3D4E5F6'
+    assert uid[:1] == b'\x04'
+    assert {uid: 1}[bytes(uid)] == 1
+
+
+def test_values_are_little_endian_signed_on_the_wire(application):
+    limits = [(-1000).to_bytes(4, 'little', signed=True), (1000).to_bytes(4, 'little', signed=True)]
+    create = native(0xCC, [0x01, 0x00, 0xEE, 0xEE] + list(b''.join(limits)) + [0x00] * 5)
+    assert status_word(application.send_raw_apdu(create)) == [0x91, 0x00]
+    debit = native(0xDC, [0x01] + list((300).to_bytes(4, 'little', signed=True)))
+    assert status_word(application.send_raw_apdu(debit)) == [0x91, 0x00]
+    assert status_word(application.send_raw_apdu(native(0xC7))) == [0x91, 0x00]
+    value = application.send_raw_apdu(native(0x6C, [0x01]), binary=True)
+    assert int.from_bytes(value[10:14], 'little', signed=True) == -300
+
+
+def test_value_file_round_trip(commands):
+    lower = list((-1000).to_bytes(4, 'little', signed=True))
+    assert commands.create_value_file(PermissiveValueFile([0x01], lower_limit=lower)).is_successful()
+    assert commands.credit_value_file([0x01], [300]).is_successful()
+    assert commands.commit_transaction().is_successful()
+    assert commands.get_value_in_value_file([0x01]).data['value'] == 300
+    assert commands.debit_value_file([0x01], [500]).is_successful()
+    assert commands.commit_transaction().is_successful()
+    assert commands.get_value_in_value_file([0x01]).data['value'] == -200
+
+
+def test_binary_results(commands, unit):
+    assert commands.create_standard_data_file(PermissiveStandardDataFile([0x00])).is_successful()
+    assert commands.write_data([0x00], bytes(range(16))).is_successful()
+    assert commands.read_data([0x00], binary=True).data['file']['file_data'] == bytes(range(16))
+    uid = commands.get_card_uid(binary=True).data['uid']
+    assert isinstance(uid, CardUID)
+    assert uid == unit.card.uid
+    assert commands.get_card_uid().data['uid'] == uid.text
+
+
+def test_card_image_round_trip(commands):
+    def authenticate(dispenser, aid):
+        return dispenser.aes_authenticate(MASTER_KEY)
+
+    payload = bytes(range(256)) * 2
+    assert commands.create_standard_data_file(
+        PermissiveStandardDataFile([0x00], file_size=list(len(payload).to_bytes(3, 'little')))).is_successful()
+    assert commands.write_data([0x00], payload).is_successful()
+    lower = list((-1000).to_bytes(4, 'little', signed=True))
+    assert commands.create_value_file(
+        PermissiveValueFile([0x01], lower_limit=lower, limited_credit_available=[0x01])).is_successful()
+    assert commands.debit_value_file([0x01], [42]).is_successful()
+    assert commands.create_cyclic_record_file(PermissiveCyclicRecordFile([0x02])).is_successful()
+    for record in (b'first record....', b'second record...'):
+        assert commands.write_record([0x02], record).is_successful()
+    assert commands.commit_transaction().is_successful()
+
+    original = io.BytesIO()
+    summary = commands.dump_card(original, authenticate=authenticate)
+    assert (summary['applications'], summary['files']) == (1, 3)
+
+    #   Onto a blank card
+    assert commands.move_card('capture').is_successful()
+    assert commands.move_card('RF').is_successful()
+    assert commands.activate_RF_card().is_successful()
+    assert commands.aes_authenticate(MASTER_KEY).is_successful()
+    original.seek(0)
+    assert commands.restore_card(original, authenticate=authenticate) == {'applications': 1, 'files': 3}
+
+    copy = io.BytesIO()
+    commands.dump_card(copy, authenticate=authenticate)
+    assert copy.getvalue() == original.getvalue()
+    assert commands.get_value_in_value_file([0x01]).data['value'] == -42
+
+
+def raw_authenticate(dispenser, key: list) -> None:
+    '''
+    Runs the AES handshake with raw APDUs, and records it in the card session as
+    `aes_authenticate` does.
+    '''
+    authenticator = Auth(key, 'AES')
+    challenge = dispenser.send_raw_apdu(native(0xAA, [0x00]), binary=True)
+    submission = authenticator._first_pass(challenge[10:-4])
+    answer = dispenser.send_raw_apdu(native(0xAF, submission), binary=True)
+    authenticator._second_pass(answer[10:-4])
+    assert authenticator.authenticated
+    session = dispenser.card_session
+    session.key_no, session.auth_type = 0x00, 'AES'
+    session.key_digest = key_digest(key)
+    session.session_key = authenticator.session_key
+
+
+def apdu_reply(sw: list, text=PMT) -> bytes:
+    return bytes([0x02, 0x00, 0x00, 0x07, text, 0x60, 0x34, 0x30, 0x32, 0x30] + sw + [0x03, 0x00])
+
+
+def test_card_session_follows_the_card():
+    session = CardSession()
+    session.key_no, session.auth_type, session.session_key = 0, 'AES', [0x00] * 16
+    session.key_digest = key_digest(MASTER_KEY)
+    session.aid = AID
+
+    for sw in ([0x91, 0x00], [0x91, 0xAF]):
+        session.observe(native(0xBD, [0x00] * 7), apdu_reply(sw))
+        assert session.is_authenticated(0, 'AES', aid=AID, key=MASTER_KEY)
+    assert not session.is_authenticated(0, key=[0x01] * 16)
+    assert not session.is_authenticated(1)
+
+    session.observe(native(0x5A, AID), apdu_reply([0x91, 0x00]))
+    assert (session.authenticated, session.aid) == (False, None)
+
+
+@pytest.mark.parametrize('reply', (apdu_reply([0x91, 0xAE]), apdu_reply([0x91, 0xF0]),
+                                   apdu_reply([0x30, 0x30], text=EMT)))
+def test_error_statuses_end_the_authentication(reply):
+    session = CardSession()
+    session.session_key = [0x00] * 16
+    session.observe(native(0xBD, [0x00] * 7), reply)
+    assert not session.authenticated
+
+
+def test_failed_reads_end_the_authentication(application):
+    raw_authenticate(application, MASTER_KEY)
+    assert application.card_session.authenticated
+    assert status_word(application.send_raw_apdu(native(0x6F))) == [0x91, 0x00]
+    assert application.card_session.authenticated
+    #   File 9 does not exist
+    assert status_word(application.send_raw_apdu(native(0xBD, [0x09] + [0x00] * 6))) == [0x91, 0xF0]
+    assert not application.card_session.authenticated
+
+
+def test_failed_exchanges_end_the_authentication(application, unit):
+    raw_authenticate(application, MASTER_KEY)
+    unit.latency = {0x60: 2.0}
+    application.retries = 0
+    with pytest.raises(LinkTimeout):
+        application.send_raw_apdu(native(0x6F))
+    assert not application.card_session.authenticated
+
+
+def test_authentication_is_reused_for_the_same_key_only(commands):
+    first = commands.ensure_authenticated(MASTER_KEY)
+    assert commands.ensure_authenticated(MASTER_KEY) is first
+    other = commands.ensure_authenticated([0x01] * 16)
+    assert other is not first
+    assert not other.is_successful()
+    assert not commands.card_session.authenticated
+
+
+def test_the_session_keeps_the_uid_as_bytes(commands, unit):
+    assert commands.get_card_uid(binary=False).data['uid'] == unit.card.uid.hex().upper()
+    assert isinstance(commands.card_session.uid, CardUID)
+    assert commands.card_session.uid == unit.card.uid
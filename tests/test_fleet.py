@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+import time
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.fleet import Fleet
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+#   Workers are forked, so they inherit the package as the tests imported it
+pytestmark = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(),
+                                reason='needs the fork start method')
+
+
+def simulated(port: str) -> SK_AD3:
+    if port.startswith('missing'):
+        raise Exception(f'No such port {port}')
+    return SK_AD3(port=port, transport=SimulatedTransport(SimulatedDispenser(), byte_latency=0))
+
+
+def issue(dispenser) -> bool:
+    return dispenser.init().is_successful() and dispenser.move_card('RF').is_successful()
+
+
+def crash(dispenser) -> None:
+    os._exit(3)
+
+
+def fleet(ports: list) -> Fleet:
+    return Fleet(simulated, ports, restart_delay=0.05, start_method='fork')
+
+
+def test_jobs_run_on_every_port():
+    with fleet(['unit0', 'unit1']) as running:
+        futures = [running.submit(issue) for _ in range(20)]
+        assert [future.result(timeout=30) for future in futures] == [True] * 20
+        assert {future.port for future in futures} == {'unit0', 'unit1'}
+
+
+def test_a_crashed_job_fails_and_the_worker_restarts():
+    with fleet(['unit0']) as running:
+        crashed = running.submit(crash)
+        with pytest.raises(Exception, match='exited with code 3'):
+            crashed.result(timeout=30)
+        assert running.submit('get_status').result(timeout=30).is_successful()
+        assert running.restarts['unit0'] == 1
+
+
+def test_ports_that_never_start_are_given_up_on():
+    with fleet(['missing0', 'unit0']) as running:
+        deadline = time.monotonic() + 30
+        while 'missing0' not in running.errors and time.monotonic() < deadline:
+            assert running.submit('get_status').result(timeout=30).is_successful()
+    assert running.restarts['missing0'] == running.max_failed_starts - 1
+    assert 'No such port missing0' in str(running.errors['missing0'])
+
+
+def test_jobs_fail_when_no_port_starts():
+    with fleet(['missing0', 'missing1']) as running:
+        with pytest.raises(Exception, match='No dispenser left'):
+            running.submit(issue).result(timeout=30)
@@ -0,0 +1,57 @@
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.api.constants.command_codes import \
+    STX, CMT, ETX, COMMAND_STATUS_SENSE, PARAM_PROVIDE_STATUS_INFO
+from SK_AD3_Card_Dispenser.api.link.frames import build_frame, cached_frame, FRAME_OVERHEAD
+from SK_AD3_Card_Dispenser.api.utils.checksum import bcc
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+GET_APPLICATION_IDS = [0x90, 0x6A, 0x00, 0x00, 0x00]
+
+
+@pytest.fixture
+def dispenser():
+    dispenser = SK_AD3(transport=SimulatedTransport(SimulatedDispenser(), byte_latency=0), read_timeout=1.0)
+    with dispenser.session():
+        assert dispenser.init().is_successful()
+        yield dispenser
+
+
+def test_build_frame_layout():
+    frame = build_frame(0x01, 0x60, 0x34, b'\x90\x6a\x00\x00\x00')
+    assert len(frame) == 5 + FRAME_OVERHEAD
+    assert list(frame[:7]) == [STX, 0x01, 0x00, 0x08, CMT, 0x60, 0x34]
+    assert frame[-2] == ETX
+    assert bcc(frame) == 0
+
+
+@pytest.mark.parametrize('data', (b'\x01\x02', [0x01, 0x02], bytearray(b'\x01\x02'), memoryview(b'\x01\x02')))
+def test_build_frame_takes_any_bytes_like_data(data):
+    assert build_frame(0x00, 0x60, 0x34, data) == build_frame(0x00, 0x60, 0x34, b'\x01\x02')
+
+
+def test_cached_frames_are_shared_and_immutable():
+    frame = cached_frame(0x00, COMMAND_STATUS_SENSE, PARAM_PROVIDE_STATUS_INFO)
+    assert frame is cached_frame(0x00, COMMAND_STATUS_SENSE, PARAM_PROVIDE_STATUS_INFO)
+    assert isinstance(frame, bytes)
+    assert frame == build_frame(0x00, COMMAND_STATUS_SENSE, PARAM_PROVIDE_STATUS_INFO)
+
+
+def test_send_command_returns_a_list(dispenser):
+    frame = cached_frame(0x00, COMMAND_STATUS_SENSE, PARAM_PROVIDE_STATUS_INFO)
+    raw_response = dispenser.send_command(frame)
+    assert isinstance(raw_response, list)
+    binary = dispenser.send_command(frame, binary=True)
+    assert isinstance(binary, bytearray)
+    assert binary == bytearray(raw_response)
+
+
+def test_send_raw_apdu_returns_a_list(dispenser):
+    assert dispenser.move_card('RF').is_successful()
+    assert dispenser.activate_RF_card().is_successful()
+    raw_response = dispenser.send_raw_apdu(GET_APPLICATION_IDS)
+    assert isinstance(raw_response, list)
+    assert raw_response[-4:-2] == [0x91, 0x00]
+    assert isinstance(dispenser.send_raw_apdu(bytes(GET_APPLICATION_IDS), binary=True), bytearray)
@@ -0,0 +1,124 @@
+from SK_AD3_Card_Dispenser.api.constants.command_codes import STX, ETX, ACK, NAK, PMT
+from SK_AD3_Card_Dispenser.api.link.framing import \
+    FrameReader, SCAN, HEADER, BODY, COMPLETE, BAD_BCC, NAKED, MAX_TEXT_LENGTH
+from SK_AD3_Card_Dispenser.api.utils.checksum import bcc
+
+
+def reply(text=bytes((PMT, 0x31, 0x30, 0x30, 0x32, 0x30)), addr=0x00) -> bytes:
+    frame = bytearray((STX, addr, len(text) >> 8, len(text) & 0xFF)) + text + bytes((ETX,))
+    return bytes(frame + bytes((bcc(frame),)))
+
+
+def parse(data) -> FrameReader:
+    return feed(FrameReader(), data)[0]
+
+
+def feed(reader: FrameReader, data) -> tuple:
+    '''
+    Feeds `data` until the reader is done. Returns the reader and the bytes left over.
+    '''
+    data = bytes(data)
+    while data and not reader.done:
+        data = data[reader.feed(data):]
+    return reader, data
+
+
+def test_parses_a_frame_after_an_ack():
+    reader = parse(bytes((ACK,)) + reply())
+    assert reader.state == COMPLETE
+    assert reader.acked
+    assert reader.frame == reply()
+
+
+def test_parses_a_frame_without_an_ack():
+    reader = parse(reply())
+    assert reader.state == COMPLETE
+    assert not reader.acked
+
+
+def test_parses_a_frame_fed_a_byte_at_a_time():
+    reader = FrameReader()
+    for byte in reply():
+        assert not reader.done
+        assert 1 <= reader.wanted()
+        reader.feed(bytes((byte,)))
+    assert reader.state == COMPLETE
+    assert reader.frame == reply()
+
+
+def test_wanted_never_reaches_past_the_frame():
+    frame = reply()
+    reader = FrameReader()
+    reader.feed(frame[:1])
+    assert (reader.state, reader.wanted()) == (HEADER, 3)
+    reader.feed(frame[1:4])
+    assert (reader.state, reader.wanted()) == (BODY, len(frame) - 4)
+    assert reader.feed(frame[4:] + reply()) == len(frame) - 4
+    assert reader.state == COMPLETE
+
+
+def test_skips_line_noise_before_the_stx():
+    assert parse(b'\x00\xff\x42' + reply()).frame == reply()
+
+
+def test_bad_bcc():
+    frame = bytearray(reply())
+    frame[-1] ^= 0x01
+    assert parse(frame).state == BAD_BCC
+
+
+def test_bad_etx():
+    frame = bytearray(reply())
+    frame[-2] = 0x00
+    frame[-1] = bcc(frame[:-1])
+    assert parse(frame).state == BAD_BCC
+
+
+def test_nak():
+    reader = parse(bytes((NAK,)))
+    assert reader.state == NAKED
+    assert reader.done
+
+
+def test_implausible_length_is_taken_for_noise():
+    length = MAX_TEXT_LENGTH + 1
+    reader = parse(bytes((STX, 0x00, length >> 8, length & 0xFF)))
+    assert reader.state == BAD_BCC
+
+
+def test_resync_finds_the_frame_behind_a_stray_stx():
+    #   The stray STX takes the real one for its ADDR, and the reply's bytes for its length
+    reader, rest = feed(FrameReader(), bytes((STX,)) + reply())
+    assert reader.state == BAD_BCC
+    reader.resync()
+    feed(reader, rest)
+    assert reader.state == COMPLETE
+    assert reader.frame == reply()
+
+
+def test_resync_after_a_corrupted_frame_waits_for_the_next_one():
+    corrupted = bytearray(reply())
+    corrupted[7] ^= 0x01
+    reader = parse(corrupted)
+    assert reader.state == BAD_BCC
+    reader.resync()
+    assert not reader.done
+    reader.feed(reply())
+    assert reader.state == COMPLETE
+    assert reader.frame == reply()
+
+
+def test_resync_takes_naks_in_the_held_bytes_for_noise():
+    #   A length byte that reads as 0x15 (NAK) must not end the resync as a NAK
+    reader = parse(bytes((STX, 0x00, 0x00, NAK)) + bytes(NAK) + b'\x00\x00')
+    assert reader.state == BAD_BCC
+    reader.resync()
+    assert reader.state != NAKED
+    reader.feed(reply())
+    assert reader.state == COMPLETE
+
+
+def test_resync_of_an_empty_frame_rescans():
+    reader = FrameReader()
+    reader.resync()
+    assert reader.state == SCAN
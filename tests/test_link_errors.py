@@ -0,0 +1,175 @@
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.bus import Bus
+from SK_AD3_Card_Dispenser.api.constants.command_codes import ACK, NAK
+from SK_AD3_Card_Dispenser.api.link.errors import LinkTimeout, FrameError, FrameRejected
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+READ_TIMEOUT = 0.3
+
+
+class FaultyTransport(SimulatedTransport):
+    '''
+    Spoils the next replies as listed in `faults`: 'drop' loses the frame, 'flip'
+    corrupts a byte, 'noise' puts a stray STX ahead of it, 'late' delivers it after the
+    read timeout, and 'nak' answers with a NAK (in place of the ACK) instead. 'stray_nak'
+    puts a NAK right after the ACK, and 'stray_nak_drop' does so and loses the frame.
+    Counts the frames written in `writes`.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.faults = []
+        self.writes = 0
+
+    def write(self, data) -> int:
+        self.writes += 1
+        return super().write(data)
+
+    def _push(self, ready_at: float, data: bytes) -> None:
+        fault = self.faults[0] if self.faults else None
+        if fault == 'nak':
+            if data == bytes((ACK,)):
+                data = bytes((NAK,))
+            else:
+                self.faults.pop(0)
+                return
+        elif fault in ('stray_nak', 'stray_nak_drop'):
+            if data == bytes((ACK,)):
+                data = bytes((ACK, NAK))
+            else:
+                self.faults.pop(0)
+                if fault == 'stray_nak_drop':
+                    return
+        elif fault is not None and len(data) > 1:
+            self.faults.pop(0)
+            if fault == 'drop':
+                return
+            if fault == 'flip':
+                data = data[:8] + bytes((data[8] ^ 0x01,)) + data[9:]
+            elif fault == 'noise':
+                data = b'\xf2' + data
+            elif fault == 'late':
+                ready_at += READ_TIMEOUT * 2
+        super()._push(ready_at, data)
+
+
+@pytest.fixture
+def unit():
+    return SimulatedDispenser()
+
+
+@pytest.fixture
+def transport(unit):
+    return FaultyTransport(unit, byte_latency=0)
+
+
+@pytest.fixture
+def dispenser(transport):
+    dispenser = SK_AD3(transport=transport, read_timeout=READ_TIMEOUT)
+    with dispenser.session():
+        assert dispenser.init().is_successful()
+        yield dispenser
+
+
+@pytest.mark.parametrize('fault', ('drop', 'flip', 'noise', 'late', 'nak', 'stray_nak_drop'))
+def test_idempotent_commands_recover_from_link_faults(dispenser, transport, fault):
+    transport.faults = [fault]
+    assert dispenser.get_status().is_successful()
+    assert not transport.faults
+
+
+def test_retries_run_out(dispenser, transport):
+    transport.faults = ['drop'] * (dispenser.retries + 1)
+    with pytest.raises(LinkTimeout):
+        dispenser.get_status()
+
+
+def test_moves_are_not_resent_after_a_timeout(dispenser, transport):
+    transport.faults = ['drop']
+    with pytest.raises(LinkTimeout):
+        dispenser.move_card('RF')
+
+
+def test_naked_moves_are_resent(dispenser, transport):
+    transport.faults = ['nak']
+    transport.writes = 0
+    assert dispenser.move_card('RF').is_successful()
+    assert transport.writes == 2
+
+
+def test_a_nak_after_the_ack_is_noise(dispenser, transport, unit):
+    stacker = unit.stacker
+    transport.faults = ['stray_nak']
+    transport.writes = 0
+    assert dispenser.move_card('RF').is_successful()
+    assert (transport.writes, unit.stacker) == (1, stacker - 1)
+
+
+def test_moves_are_not_resent_after_a_stray_nak(dispenser, transport):
+    transport.faults = ['stray_nak_drop']
+    transport.writes = 0
+    with pytest.raises(FrameError):
+        dispenser.move_card('RF')
+    assert transport.writes == 1
+
+
+@pytest.mark.parametrize('fault, error', (('drop', LinkTimeout), ('flip', FrameError), ('nak', FrameRejected),
+                                          ('stray_nak_drop', FrameError)))
+def test_link_errors_without_retries(dispenser, transport, fault, error):
+    dispenser.retries = 0
+    transport.faults = [fault]
+    with pytest.raises(error):
+        dispenser.get_status()
+    assert dispenser.get_status().is_successful()
+
+
+def test_late_replies_are_not_taken_for_the_next_one(dispenser, transport):
+    dispenser.retries = 0
+    transport.faults = ['late']
+    with pytest.raises(LinkTimeout):
+        dispenser.move_card('RF')
+    response = dispenser.get_status()
+    assert response.is_successful()
+    assert response.frame[5] == 0x31
+
+
+@pytest.fixture
+def bus():
+    transport = FaultyTransport(SimulatedDispenser(addr=0x00), SimulatedDispenser(addr=0x01),
+                                byte_latency=0)
+    with Bus(transport=transport, read_timeout=READ_TIMEOUT) as bus:
+        assert bus.device(0x00).init().is_successful()
+        yield bus
+
+
+@pytest.mark.parametrize('fault, error', (('drop', LinkTimeout), ('flip', FrameError), ('nak', FrameRejected),
+                                          ('stray_nak_drop', FrameError)))
+def test_bus_link_errors(bus, fault, error):
+    device = bus.device(0x00)
+    device.retries = 0
+    bus.serial_context.faults = [fault]
+    with pytest.raises(error):
+        device.get_status()
+
+
+def test_bus_resends_naked_moves(bus):
+    device = bus.device(0x00)
+    bus.serial_context.faults = ['nak']
+    assert device.move_card('RF').is_successful()
+
+
+@pytest.mark.parametrize('fault', ('stray_nak', 'stray_nak_drop'))
+def test_bus_does_not_resend_moves_after_a_stray_nak(bus, fault):
+    device = bus.device(0x00)
+    transport = bus.serial_context
+    transport.faults = [fault]
+    transport.writes = 0
+    if fault == 'stray_nak':
+        assert device.move_card('RF').is_successful()
+    else:
+        with pytest.raises(FrameError):
+            device.move_card('RF')
+    assert transport.writes == 1
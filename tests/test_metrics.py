@@ -0,0 +1,77 @@
+import subprocess
+import sys
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.metrics import Metrics
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+from conftest import ROOT
+
+
+GET_VERSION = [0x90, 0x60, 0x00, 0x00, 0x00]
+
+
+class Dispenser(SK_AD3):
+    def checked_status(self):
+        return self.get_status()
+
+
+@pytest.fixture
+def dispenser():
+    dispenser = Dispenser(transport=SimulatedTransport(SimulatedDispenser(), byte_latency=0), read_timeout=1.0)
+    with dispenser.session():
+        yield dispenser
+
+
+def test_exchanges_and_methods_are_recorded(dispenser):
+    metrics = Metrics().attach(dispenser, label='unit')
+    assert dispenser.init().is_successful()
+    assert dispenser.move_card('RF').is_successful()
+    assert dispenser.activate_RF_card().is_successful()
+    dispenser.send_raw_apdu(GET_VERSION)
+
+    snapshot = metrics.snapshot()
+    exchanges = snapshot['exchanges']['unit']
+    assert exchanges['move_card']['outcomes'] == {'PMT': 1}
+    assert exchanges['apdu:get_version']['outcomes'] == {'PMT 91AF': 1}
+    assert exchanges['init']['bytes_out'] == 9
+    #   Frame-level commands are left to the exchange statistics
+    assert set(snapshot['methods']['unit']) == {'init', 'move_card', 'activate_RF_card'}
+    assert 'sk_ad3_exchange_latency_seconds_bucket{dispenser="unit",command="init",le="+Inf"} 1' \
+        in metrics.prometheus()
+
+    metrics.detach(dispenser)
+    assert dispenser.get_status().is_successful()
+    assert 'get_status' not in metrics.snapshot()['exchanges']['unit']
+
+
+def test_nested_calls_count_once(dispenser):
+    metrics = Metrics().attach(dispenser, label='unit', methods=['checked_status', 'get_status'])
+    assert dispenser.checked_status().is_successful()
+    methods = metrics.snapshot()['methods']['unit']
+    assert methods == {'checked_status': {'latency': methods['checked_status']['latency'],
+                                          'outcomes': {'ok': 1}}}
+    assert dispenser.get_status().is_successful()
+    assert metrics.snapshot()['methods']['unit']['get_status']['outcomes'] == {'ok': 1}
+
+
+def test_attaching_leaves_the_desfire_commands_unloaded():
+    #   In a fresh interpreter, as other tests may have loaded them already
+    script = f'''
+import sys
+sys.path.insert(0, {str(ROOT / 'tests')!r})
+import conftest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.metrics import Metrics
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+dispenser = SK_AD3(transport=SimulatedTransport(SimulatedDispenser(), byte_latency=0))
+Metrics().attach(dispenser)
+with dispenser.session():
+    assert dispenser.get_status().is_successful()
+#   The card session is part of SK_AD3 itself; the commands are not
+print(sorted(name for name in sys.modules if '.api.desfire.' in name and not name.endswith('.session')))
+'''
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '[]'
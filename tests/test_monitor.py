@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.worker import DeviceWorker
+from SK_AD3_Card_Dispenser.monitor import StatusMonitor
+from SK_AD3_Card_Dispenser.api.constants.command_codes import COMMAND_MOVE_CARD
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+@pytest.fixture
+def unit():
+    return SimulatedDispenser(stacker=3, stacker_low=2)
+
+
+@pytest.fixture
+def worker(unit):
+    worker = DeviceWorker(SK_AD3(transport=SimulatedTransport(unit, byte_latency=0), read_timeout=2.0))
+    assert worker.init().result(timeout=5).is_successful()
+    yield worker
+    worker.close()
+
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_needs_a_worker(worker):
+    with pytest.raises(Exception):
+        StatusMonitor(worker.dispenser)
+
+
+def test_events_follow_the_dispenser(worker):
+    changes, low = [], threading.Event()
+    monitor = StatusMonitor(worker, active_interval=0.02, idle_interval=0.1)
+    monitor.on_change(lambda field, old, new: changes.append((field, new['code'])))
+    monitor.on('stacker_low', lambda status: low.set())
+    with monitor:
+        assert wait_for(lambda: monitor.status is not None)
+        assert monitor.status['dispenser_status']['code'] == 0x30
+        assert ('stacker_status', 0x32) in changes
+
+        assert worker.move_card('RF').result(timeout=5).is_successful()
+        assert low.wait(2.0)
+        assert wait_for(lambda: monitor.status['dispenser_status']['code'] == 0x32)
+        assert ('dispenser_status', 0x32) in changes
+    assert monitor.error is None
+
+
+def test_failing_callbacks_are_logged(worker, caplog):
+    def fail(status):
+        raise ValueError('callback failed')
+
+    seen = threading.Event()
+    monitor = StatusMonitor(worker, active_interval=0.02)
+    monitor.on('dispenser_empty', fail)
+    monitor.on('dispenser_empty', lambda status: seen.set())
+    with caplog.at_level(logging.ERROR), monitor:
+        assert seen.wait(2.0)
+    assert 'callback failed' in caplog.text
+
+
+def test_stop_does_not_wait_for_the_poll(worker, unit):
+    unit.latency = {COMMAND_MOVE_CARD: 1.5}
+    monitor = StatusMonitor(worker, active_interval=0.02).start()
+    assert wait_for(lambda: monitor.status is not None)
+    #   The next poll queues up behind the move
+    move = worker.move_card('RF')
+    time.sleep(0.2)
+    start = time.monotonic()
+    monitor.stop()
+    assert time.monotonic() - start < 0.5
+    assert move.result(timeout=5).is_successful()
+    assert monitor.error is None
@@ -0,0 +1,61 @@
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.pipeline import Pipeline
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+@pytest.fixture
+def unit():
+    return SimulatedDispenser(stacker=10)
+
+
+@pytest.fixture
+def dispenser(unit):
+    dispenser = SK_AD3(transport=SimulatedTransport(unit, byte_latency=0), read_timeout=1.0)
+    assert dispenser.init().is_successful()
+    return dispenser
+
+
+def broken(job):
+    raise ValueError(f'No layout for {job}')
+
+
+def test_failed_preparation_dispenses_no_card(dispenser, unit):
+    pipeline = Pipeline(dispenser, prepare=broken, personalise=None)
+    results = list(pipeline.run(range(3)))
+    assert [(result.job, result.stage) for result in results] == [(0, 'prepare'), (1, 'prepare'), (2, 'prepare')]
+    assert all(isinstance(result.error, ValueError) for result in results)
+    assert unit.stacker == 10
+    assert pipeline.failures['prepare'] == 3
+
+
+def test_an_empty_stacker_fails_the_move_in(dispenser, unit):
+    unit.stacker = 0
+    pipeline = Pipeline(dispenser, prepare=str, personalise=None)
+    result, = pipeline.run(['job'])
+    assert result.stage == 'move_in'
+    assert unit.capture_box == 0
+
+
+def test_cards_are_personalised_and_failures_rejected(dispenser, unit):
+    pytest.importorskip(f'{SK_AD3.__module__}.api.desfire.apdu_utils.application_commands')
+
+    def personalise(dispenser, uid, payload):
+        if payload == 'job 2':
+            raise ValueError('Write failed')
+        return uid, payload
+
+    pipeline = Pipeline(dispenser, prepare=lambda job: f'job {job}', personalise=personalise,
+                        deliver='gate', reject='capture')
+    results = []
+    for result in pipeline.run(range(4)):
+        results.append(result)
+        unit.take_card()
+    assert [result.ok for result in results] == [True, True, False, True]
+    assert results[2].stage == 'personalise'
+    assert [result.value[1] for result in results if result.ok] == ['job 0', 'job 1', 'job 3']
+    assert len({result.uid for result in results}) == 4
+    assert (unit.stacker, unit.capture_box) == (6, 1)
+    stats = pipeline.stats()['personalise']
+    assert (stats['count'], stats['failures']) == (4, 1)
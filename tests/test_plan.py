@@ -0,0 +1,72 @@
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.plan import CommandPlan, Field
+from SK_AD3_Card_Dispenser.api.constants.command_codes import \
+    COMMAND_MOVE_CARD, COMMAND_STATUS_SENSE, COMMAND_RF_CARD_OPERATION, PARAM_ACTIVATE_RF_CARD
+from SK_AD3_Card_Dispenser.api.link.frames import build_frame
+from SK_AD3_Card_Dispenser.api.link.errors import LinkTimeout
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+AID = [0x01, 0x02, 0x03]
+
+
+@pytest.fixture
+def unit():
+    return SimulatedDispenser()
+
+
+@pytest.fixture
+def dispenser(unit):
+    dispenser = SK_AD3(transport=SimulatedTransport(unit, byte_latency=0), read_timeout=0.5)
+    with dispenser.session():
+        assert dispenser.init().is_successful()
+        yield dispenser
+
+
+def issue_plan() -> CommandPlan:
+    plan = CommandPlan()
+    plan.command(COMMAND_MOVE_CARD, 0x32)
+    plan.command(COMMAND_RF_CARD_OPERATION, PARAM_ACTIVATE_RF_CARD, [0x41, 0x30])
+    plan.apdu([0x90, 0xCA, 0x00, 0x00, 0x05, Field('aid', 3), 0x0F, 0x81, 0x00])
+    plan.apdu([0x90, 0x5A, 0x00, 0x00, 0x03, Field('aid', 3), 0x00])
+    return plan
+
+
+def test_fields_are_patched_with_a_correct_bcc():
+    plan = CommandPlan().apdu([0x90, 0x5A, 0x00, 0x00, 0x03, Field('aid', 3), 0x00])
+    compiled, = plan.compile(0x01)
+    assert compiled[0] == build_frame(0x01, 0x60, 0x34, [0x90, 0x5A, 0x00, 0x00, 0x03, 0x00, 0x00, 0x00, 0x00])
+    assert plan.compile(0x01) is plan.compile(0x01)
+
+
+def test_plans_run_every_step(dispenser, unit):
+    responses = issue_plan().run(dispenser, aid=bytes(AID))
+    assert [response.is_successful() for response in responses] == [True] * 4
+    assert unit.card.aid == bytes(AID)
+
+
+def test_plans_stop_at_the_first_failure(dispenser):
+    plan = issue_plan()
+    assert plan.run(dispenser, aid=bytes(AID))[-1].is_successful()
+    #   The application exists now, so creating it again fails
+    responses = plan.run(dispenser, aid=bytes(AID))
+    assert len(responses) == 3
+    assert responses[-1].code == [0x91, 0xDE]
+
+
+def test_fields_must_have_their_length(dispenser):
+    with pytest.raises(Exception, match='aid must be 3 bytes long'):
+        issue_plan().run(dispenser, aid=b'\x01')
+
+
+def test_the_card_session_is_reset_when_a_step_raises(dispenser, unit):
+    session = dispenser.card_session
+    session.key_no, session.auth_type, session.session_key = 0, 'AES', [0x00] * 16
+    unit.latency = {COMMAND_STATUS_SENSE: 1.0}
+    plan = CommandPlan().command(COMMAND_MOVE_CARD, 0x32).command(COMMAND_STATUS_SENSE, 0x30)
+    dispenser.retries = 0
+    with pytest.raises(LinkTimeout):
+        plan.run(dispenser)
+    assert not session.authenticated
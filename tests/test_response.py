@@ -0,0 +1,53 @@
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.api.constants.command_codes import STX, ETX, PMT, EMT
+from SK_AD3_Card_Dispenser.api.response.response import Response, APDU_Response
+from SK_AD3_Card_Dispenser.api.utils.checksum import bcc
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+def reply(text: list) -> bytearray:
+    frame = bytearray([STX, 0x00, len(text) >> 8, len(text) & 0xFF] + text + [ETX])
+    return frame + bytes((bcc(frame),))
+
+
+def test_frames_are_kept_as_they_came():
+    frame = reply([PMT, 0x31, 0x30, 0x30, 0x32, 0x30])
+    response = Response(frame)
+    assert response.frame is frame
+    assert response.raw_response == list(frame)
+    assert response.raw_response is response.raw_response
+    assert response.is_successful()
+
+
+def test_lists_are_accepted_too():
+    frame = reply([PMT, 0x31, 0x30, 0x30, 0x32, 0x30])
+    response = Response(list(frame))
+    assert response.frame == frame
+    assert response.status() == Response(frame).status()
+
+
+def test_error_frames():
+    response = Response(reply([EMT, 0x32, 0x30, 0x30, 0x30]))
+    assert not response.is_successful()
+    assert response.error() is response.error()
+
+
+def test_apdu_status_words():
+    def apdu_reply(data: list, sw: list) -> APDU_Response:
+        return APDU_Response(reply([PMT, 0x60, 0x34, 0x30, 0x32, 0x30] + data + sw))
+
+    response = apdu_reply([0x01, 0x02], [0x91, 0x00])
+    assert response.is_successful()
+    assert response.code == [0x91, 0x00]
+    assert bytes(response.payload) == b'\x01\x02'
+    assert apdu_reply([], [0x91, 0xAF]).is_successful()
+    assert not apdu_reply([], [0x91, 0xAE]).is_successful()
+
+
+def test_get_status_decodes_once():
+    dispenser = SK_AD3(transport=SimulatedTransport(SimulatedDispenser(), byte_latency=0))
+    response = dispenser.get_status()
+    assert response.data['status'] is response.status()
+    assert response.status()['dispenser_status']['code'] == 0x30
@@ -0,0 +1,44 @@
+import pytest
+from SK_AD3_Card_Dispenser.api.constants.command_codes import \
+    COMMAND_STATUS_SENSE, COMMAND_MOVE_CARD, COMMAND_INIT
+from SK_AD3_Card_Dispenser.api.link.frames import build_frame
+from SK_AD3_Card_Dispenser.api.link.retransmit import \
+    is_idempotent, backoff, APDU_COMMAND, MAX_BACKOFF
+
+
+def apdu_frame(ins: int, data=b'') -> bytearray:
+    return build_frame(0x00, *APDU_COMMAND, bytes((0x90, ins, 0x00, 0x00, len(data))) + data + b'\x00')
+
+
+def test_status_sense_is_idempotent():
+    assert is_idempotent(build_frame(0x00, COMMAND_STATUS_SENSE, 0x30))
+
+
+@pytest.mark.parametrize('cm', (COMMAND_MOVE_CARD, COMMAND_INIT))
+def test_mechanical_commands_are_not(cm):
+    assert not is_idempotent(build_frame(0x00, cm, 0x30))
+
+
+@pytest.mark.parametrize('ins', (0x45, 0x5A, 0x60, 0x64, 0x6A, 0x6C, 0x6F, 0xBB, 0xBD, 0xF5))
+def test_read_only_desfire_commands_are_idempotent(ins):
+    assert is_idempotent(apdu_frame(ins, b'\x00'))
+
+
+@pytest.mark.parametrize('ins', (
+    0xAF,   # Additional Frame continues whatever came before
+    0xAA,   # Authenticate AES
+    0x3D,   # Write Data
+    0x0C,   # Credit
+    0xC7,   # Commit Transaction
+    0xC4,   # Change Key
+))
+def test_other_desfire_commands_are_not(ins):
+    assert not is_idempotent(apdu_frame(ins, b'\x00'))
+
+
+def test_backoff_doubles_from_base():
+    assert [backoff(attempt, 0.05) for attempt in (1, 2, 3)] == pytest.approx([0.05, 0.1, 0.2])
+
+
+def test_backoff_is_capped():
+    assert backoff(20, 0.05) == MAX_BACKOFF
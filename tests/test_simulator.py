@@ -0,0 +1,72 @@
+import time
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.api.constants.command_codes import \
+    COMMAND_STATUS_SENSE, COMMAND_MOVE_CARD, PARAM_PROVIDE_STATUS_INFO
+from SK_AD3_Card_Dispenser.api.link.frames import build_frame
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+@pytest.fixture
+def unit():
+    return SimulatedDispenser(stacker=3, capture_box_capacity=2)
+
+
+@pytest.fixture
+def dispenser(unit):
+    dispenser = SK_AD3(transport=SimulatedTransport(unit, byte_latency=0), read_timeout=1.0)
+    with dispenser.session():
+        yield dispenser
+
+
+def test_commands_need_init(dispenser):
+    response = dispenser.move_card('RF')
+    assert not response.is_successful()
+    assert dispenser.init().is_successful()
+    assert dispenser.move_card('RF').is_successful()
+
+
+def test_status_round_trip(dispenser):
+    response = dispenser.get_status()
+    assert response.is_successful()
+    assert response.data['status']['dispenser_status']['code'] == 0x30
+    assert response.data['status']['stacker_status']['code'] == 0x31
+
+
+def test_moves_issue_and_capture_cards(dispenser, unit):
+    assert dispenser.init().is_successful()
+    assert dispenser.move_card('RF').is_successful()
+    assert unit.stacker == 2
+    assert dispenser.get_status().data['status']['dispenser_status']['code'] == 0x32
+    assert dispenser.activate_RF_card().is_successful()
+    assert dispenser.move_card('capture').is_successful()
+    assert (unit.stacker, unit.capture_box) == (2, 1)
+    #   Moving with no card in place issues the next one
+    assert dispenser.move_card('front').is_successful()
+    assert unit.stacker == 1
+    assert unit.take_card() is not None
+
+
+def test_flushing_keeps_replies_still_on_the_wire(unit):
+    transport = SimulatedTransport(unit, byte_latency=0, command_latency=0.2)
+    transport.timeout = 0.05
+    transport.write(build_frame(0x00, COMMAND_STATUS_SENSE, PARAM_PROVIDE_STATUS_INFO))
+    transport.reset_input_buffer()
+    time.sleep(0.3)
+    assert transport.in_waiting > 0
+    transport.reset_input_buffer()
+    assert transport.in_waiting == 0
+
+
+def test_latency_is_charged_per_command(unit):
+    unit.latency = {COMMAND_MOVE_CARD: 0.2}
+    dispenser = SK_AD3(transport=SimulatedTransport(unit, byte_latency=0))
+    with dispenser.session():
+        assert dispenser.init().is_successful()
+        start = time.monotonic()
+        assert dispenser.get_status().is_successful()
+        assert time.monotonic() - start < 0.1
+        start = time.monotonic()
+        assert dispenser.move_card('RF').is_successful()
+        assert time.monotonic() - start >= 0.2
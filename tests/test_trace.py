@@ -0,0 +1,63 @@
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.api.link.trace import TX, RX, TraceRecorder, read_trace, trace_files
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+from SK_AD3_Card_Dispenser.simulator.replay import ReplayTransport
+
+
+GET_VERSION = [0x90, 0x60, 0x00, 0x00, 0x00]
+
+
+def run_session(dispenser: SK_AD3) -> list:
+    with dispenser.session():
+        return [dispenser.init().is_successful(),
+                dispenser.move_card('RF').is_successful(),
+                dispenser.get_status().data['status'],
+                dispenser.activate_RF_card().is_successful(),
+                dispenser.send_raw_apdu(GET_VERSION),
+                dispenser.move_card('capture').is_successful()]
+
+
+def record(path, **kwargs) -> list:
+    dispenser = SK_AD3(transport=SimulatedTransport(SimulatedDispenser(), byte_latency=0))
+    with TraceRecorder(str(path), **kwargs) as trace:
+        dispenser.trace = trace
+        return run_session(dispenser)
+
+
+def test_a_recorded_session_replays(tmp_path):
+    path = tmp_path / 'unit.trace'
+    recorded = record(path)
+    records = list(read_trace(str(path)))
+    assert sum(r.direction == TX for r in records) == 6
+    assert all(r.direction in (TX, RX) for r in records)
+    assert [r.time for r in records] == sorted(r.time for r in records)
+
+    transport = ReplayTransport(str(path))
+    assert run_session(SK_AD3(transport=transport)) == recorded
+    assert transport.frames == 6
+
+
+def test_a_rotated_trace_replays_whole(tmp_path):
+    path = tmp_path / 'unit.trace'
+    recorded = record(path, max_bytes=128, backups=10)
+    files = trace_files(str(path))
+    assert len(files) > 2
+    assert all((tmp_path / file).stat().st_size <= 128 for file in files)
+    assert run_session(SK_AD3(transport=ReplayTransport(str(path)))) == recorded
+
+
+def test_rotation_keeps_the_newest_files(tmp_path):
+    path = tmp_path / 'unit.trace'
+    record(path, max_bytes=128, backups=1)
+    assert trace_files(str(path)) == [f'{path}.1', str(path)]
+
+
+def test_strict_replay_rejects_other_frames(tmp_path):
+    path = tmp_path / 'unit.trace'
+    record(path)
+    dispenser = SK_AD3(transport=ReplayTransport(str(path)))
+    with dispenser.session():
+        with pytest.raises(Exception, match='differs from the trace'):
+            dispenser.get_status()
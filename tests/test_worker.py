@@ -0,0 +1,82 @@
+import threading
+import time
+import pytest
+from SK_AD3_Card_Dispenser import SK_AD3
+from SK_AD3_Card_Dispenser.worker import DeviceWorker
+from SK_AD3_Card_Dispenser.api.constants.command_codes import COMMAND_MOVE_CARD
+from SK_AD3_Card_Dispenser.api.link.errors import LinkCancelled
+from SK_AD3_Card_Dispenser.simulator.transport import SimulatedTransport
+from SK_AD3_Card_Dispenser.simulator.dispenser import SimulatedDispenser
+
+
+class Unplugged(SimulatedTransport):
+    def open(self) -> None:
+        raise OSError('No such port')
+
+
+@pytest.fixture
+def unit():
+    return SimulatedDispenser(latency={COMMAND_MOVE_CARD: 0.3})
+
+
+@pytest.fixture
+def worker(unit):
+    worker = DeviceWorker(SK_AD3(transport=SimulatedTransport(unit, byte_latency=0), read_timeout=2.0))
+    assert worker.init().result(timeout=5).is_successful()
+    yield worker
+    worker.close()
+
+
+def test_commands_from_many_threads(worker):
+    results = []
+
+    def poll():
+        for _ in range(10):
+            results.append(worker.get_status().result(timeout=5).is_successful())
+
+    threads = [threading.Thread(target=poll) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [True] * 40
+
+
+def test_submit_runs_a_sequence_as_one_unit(worker, unit):
+    def issue(dispenser):
+        return dispenser.move_card('RF'), dispenser.get_status()
+
+    moved, status = worker.submit(issue).result(timeout=5)
+    assert moved.is_successful()
+    assert status.data['status']['dispenser_status']['code'] == 0x32
+
+
+def test_abort_stops_a_running_command(worker):
+    future = worker.move_card('RF')
+    time.sleep(0.1)
+    assert not future.abort()
+    with pytest.raises(LinkCancelled):
+        future.result(timeout=1)
+    #   The move's late reply is not taken for the next command's
+    status = worker.get_status().result(timeout=5)
+    assert status.frame[5] == 0x31
+    assert status.data['status']['dispenser_status']['code'] == 0x32
+
+
+def test_cancel_skips_a_queued_command(worker, unit):
+    running = worker.move_card('RF')
+    queued = worker.move_card('capture')
+    assert queued.abort()
+    assert running.result(timeout=5).is_successful()
+    assert worker.get_status().result(timeout=5).data['status']['dispenser_status']['code'] == 0x32
+    assert unit.capture_box == 0
+
+
+def test_requests_fail_when_the_port_cannot_open(unit):
+    worker = DeviceWorker(SK_AD3(transport=Unplugged(unit, byte_latency=0)))
+    with pytest.raises(OSError):
+        worker.get_status().result(timeout=5)
+    worker._thread.join(timeout=5)
+    assert isinstance(worker.error, OSError)
+    with pytest.raises(OSError):
+        worker.get_status().result(timeout=1)
@@ -0,0 +1,167 @@
+import queue
+import threading
+from concurrent.futures import Future
+from . import SK_AD3
+
+
+#   SK_AD3 methods that can be queued by name (and are proxied by DeviceWorker / AsyncSK_AD3)
+COMMANDS = (
+    #   Top-level SK_AD3 methods
+    'send_command',
+    'init',
+    'get_status',
+    'move_card',
+    'set_insertion',
+    'auto_test_RF_card_type',
+    'activate_RF_card',
+    'deactivate_RF_card',
+    #   Top-level Desfire API methods
+    'send_raw_apdu',
+    'aes_authenticate',
+    'des_authenticate',
+    'change_picc_master_key',
+    'change_application_key',
+    'ensure_authenticated',
+    'get_key_version',
+    'get_card_uid',
+    'get_application_ids',
+    'select_application',
+    'create_application',
+    'delete_application',
+    'format_picc',
+    'get_file_ids',
+    'create_standard_data_file',
+    'create_cyclic_record_file',
+    'create_value_file',
+    'delete_file',
+    'get_file_settings',
+    'read_data',
+    'write_data',
+    'write_record',
+    'read_record',
+    'credit_value_file',
+    'debit_value_file',
+    'get_value_in_value_file',
+    'commit_transaction',
+)
+
+
+class CommandFuture(Future):
+    '''
+    A `concurrent.futures.Future` for a queued command. In addition to `cancel()`, which
+    only works before the command has started, `abort()` also stops a running command
+    at its next read slice (it then fails with `LinkCancelled`).
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.abort_event = threading.Event()
+
+    def abort(self) -> bool:
+        if self.cancel():
+            return True
+        self.abort_event.set()
+        return False
+
+
+class DeviceWorker:
+    '''
+    Owns all I/O for one dispenser: a single thread works through a queue of requests,
+    so any number of threads can share the device without interleaving frames::
+
+        worker = DeviceWorker(SK_AD3('COM7'))
+        future = worker.get_status()
+        status = future.result(timeout=5)
+
+    Every command in `COMMANDS` is available as a method that queues it and returns a
+    `CommandFuture`. Each request runs to completion before the next one starts, which
+    makes multi-frame commands such as `aes_authenticate` and `get_card_uid` atomic.
+    Use `submit()` to run a sequence of commands as one unit::
+
+        worker.submit(lambda dispenser: (dispenser.select_application(aid),
+                                         dispenser.read_data([0x00])))
+
+    The port is kept open (see `SK_AD3.session()`) for as long as the worker runs. If it
+    cannot be opened, the worker stops: the exception is kept in `error`, and every
+    request queued, before or after, fails with it.
+    '''
+
+    def __init__(self, dispenser: SK_AD3):
+        self.dispenser = dispenser
+        #   Why the worker stopped, if it failed
+        self.error = None
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f'SK_AD3 {dispenser.port}:{dispenser.addr:#04x}')
+        self._thread.start()
+
+    def submit(self, function, *args, **kwargs) -> CommandFuture:
+        '''
+        Queues `function(dispenser, *args, **kwargs)`. `function` may also be the name
+        of an `SK_AD3` method.
+        '''
+        if isinstance(function, str):
+            function = getattr(type(self.dispenser), function)
+        future = CommandFuture()
+        with self._lock:
+            if self.error is None:
+                self._queue.put((future, function, args, kwargs))
+                return future
+        future.set_running_or_notify_cancel()
+        future.set_exception(self.error)
+        return future
+
+    def close(self, wait: bool = True) -> None:
+        '''
+        Stops the worker once everything queued so far has run, and closes the port.
+        '''
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def __getattr__(self, name: str):
+        if name not in COMMANDS:
+            raise AttributeError(name)
+
+        def command(*args, **kwargs) -> CommandFuture:
+            return self.submit(name, *args, **kwargs)
+
+        command.__name__ = name
+        return command
+
+    def _run(self) -> None:
+        try:
+            with self.dispenser.session():
+                self._serve()
+        except Exception as e:
+            #   Only opening or closing the port gets here; the requests catch their own
+            self._fail(e)
+
+    def _serve(self) -> None:
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            future, function, args, kwargs = request
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.dispenser.abort_event = future.abort_event
+            try:
+                future.set_result(function(self.dispenser, *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.dispenser.abort_event = None
+
+    def _fail(self, error: Exception) -> None:
+        with self._lock:
+            self.error = error
+        #   Nothing is queued after error is set, so this empties the queue for good
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None and request[0].set_running_or_notify_cancel():
+                request[0].set_exception(error)